@@ -1,6 +1,8 @@
 from fonduer.meta import Meta
+from fonduer.parser.models import Document
 from sqlalchemy.dialects import postgresql
-from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, text
+from psycopg2.extras import execute_values
 
 INT_ARRAY_TYPE = postgresql.ARRAY(Integer)
 STR_ARRAY_TYPE = postgresql.ARRAY(String)
@@ -57,5 +59,46 @@ class TableX(_meta.Base):
     phrases_right = Column(STR_ARRAY_TYPE)
     phrases_page = Column(STR_ARRAY_TYPE)
 
+class IngestedDocument(_meta.Base):
+    """Hash of the merged HTML of every fully ingested document"""
+    __tablename__ = "ingested_document"
+    name = Column(String, primary_key=True)
+    html_hash = Column(String, nullable=False)
 
 
+def bulk_insert(session, table, rows, page_size=1000):
+    """
+    Insert rows with execute_values, one statement per page of rows instead of one per ORM object.
+    The rows join the transaction of the session.
+    :param session: db session.
+    :param table: table name.
+    :param rows: list of dicts with the same keys, mapping column names to values.
+    :param page_size: rows per statement.
+    """
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    query = 'INSERT INTO %s (%s) VALUES %%s' % (table, ', '.join('"%s"' % c for c in columns))
+    cursor = session.connection().connection.cursor()
+    execute_values(cursor, query, [tuple(row[c] for c in columns) for row in rows], page_size=page_size)
+
+
+def delete_documents(session, doc_names):
+    """
+    Remove documents and every row derived from them, so they can be ingested again.
+    :param session: db session.
+    :param doc_names: Names of the documents.
+    """
+    docs = session.query(Document).filter(Document.name.in_(list(doc_names))).all()
+    doc_ids = [doc.id for doc in docs]
+    if doc_ids:
+        params = {'ids': doc_ids}
+        session.execute(text("DELETE FROM table_x WHERE equation_id IN "
+                             "(SELECT id FROM equation WHERE document_id = ANY(:ids))"), params)
+        session.execute(text("DELETE FROM variable WHERE document_id = ANY(:ids)"), params)
+        session.execute(text("DELETE FROM equation WHERE document_id = ANY(:ids)"), params)
+        session.execute(text("DELETE FROM latexsentence WHERE document_id = ANY(:ids)"), params)
+        session.execute(text("DELETE FROM image WHERE id IN (SELECT id FROM sentence WHERE document_id = ANY(:ids))"), params)
+        for doc in docs:
+            session.delete(doc)
+    session.query(IngestedDocument).filter(IngestedDocument.name.in_(list(doc_names))).delete(synchronize_session=False)
@@ -0,0 +1,40 @@
+"""
+Bookkeeping for incremental ingestion.
+Every merged HTML document is hashed, and the hash is recorded in the
+database once the document is fully ingested. A later run only ingests the
+documents whose hash is not recorded yet.
+"""
+import hashlib
+import os
+
+
+def html_hash(path):
+    """
+    :param path: merged HTML file
+    :return: hex digest of the file contents
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def document_name(html_file):
+    """
+    :param html_file: merged HTML file name
+    :return: name Fonduer gives the document
+    """
+    return os.path.splitext(os.path.basename(html_file))[0]
+
+
+def plan_ingestion(hashes, ingested):
+    """
+    :param hashes: {document name: hash} of the merged documents of this run
+    :param ingested: {document name: hash} recorded in the database
+    :return: (new, changed, unchanged) sorted lists of document names. Changed documents were ingested with another hash
+    """
+    new = sorted(name for name in hashes if name not in ingested)
+    changed = sorted(name for name in hashes if name in ingested and ingested[name] != hashes[name])
+    unchanged = sorted(name for name in hashes if name in ingested and ingested[name] == hashes[name])
+    return new, changed, unchanged
@@ -13,6 +13,7 @@ from fonduer.meta import Meta as Mt
 from sqlalchemy import Column, Integer, String, Text, ForeignKey
 from sqlalchemy.dialects import postgresql
 from os.path import join
+from db_models import bulk_insert
 
 import re
 
@@ -51,12 +52,13 @@ class Image(_meta.Base):
     img_path = Column(Text, nullable=False)
 
 
-def link(words_location, db_connect_str, ignored_files=[]): 
+def link(words_location, db_connect_str, ignored_files=[], doc_names=None):
     """
     Put the coordinate information for each token into the db and get the path to the original pdf image for each section.
     :param words_location: Directory storing the json files which contain the word coordinate information.
     :param db_connect_str: db connection string.
     :param ignored_files: Files to be ignored.
+    :param doc_names: Optional names of the documents to link, all documents by default.
     """
     XPATH_PATTERN = re.compile("/html/body/div\[([0-9]+)\]/div\[([0-9]+)\]/div\[.*\]/p.*")
     session = Meta.init(db_connect_str).Session()
@@ -69,7 +71,10 @@ def link(words_location, db_connect_str, ignored_files=[]):
             return json.load(paths)
 
     def get_all_documents():
-        return session.query(Document).order_by(Document.id)
+        docs = session.query(Document)
+        if doc_names is not None:
+            docs = docs.filter(Document.name.in_(list(doc_names)))
+        return docs.order_by(Document.id)
 
     def get_all_sentence_from_a_doc(doc_id):
         return session.query(Sentence).filter(Sentence.document_id == doc_id, Sentence.name != 'Equation').order_by(Sentence.id)
@@ -84,6 +89,8 @@ def link(words_location, db_connect_str, ignored_files=[]):
             w2 = w2.replace(hyphen,'-')
         return w1 == w2
 
+    latex_rows = []
+    image_rows = []
     for doc in get_all_documents():
         if doc.name + '.html' in ignored_files:
             continue
@@ -121,11 +128,7 @@ def link(words_location, db_connect_str, ignored_files=[]):
                 #print('the same')
                 #print(path_count)
                 #print(paths[path_count])
-                img_p = Image(
-                    id = sent.id,
-                    img_path = paths[path_count]
-                )
-                session.add(img_p)
+                image_rows.append({'id': sent.id, 'img_path': paths[path_count]})
             else:
                 path_count += 1
                 if path_count >= len(paths):
@@ -134,11 +137,7 @@ def link(words_location, db_connect_str, ignored_files=[]):
                     #print('different')
                     #print(path_count)
                     #print(paths[path_count])
-                    img_p = Image(
-                        id = sent.id,
-                        img_path = paths[path_count]
-                    )
-                    session.add(img_p)
+                    image_rows.append({'id': sent.id, 'img_path': paths[path_count]})
                     index1_prev = index1
                     index2_prev = index2
 
@@ -176,16 +175,14 @@ def link(words_location, db_connect_str, ignored_files=[]):
                         str_buffer = ''
                         word_bag_count += 1
 
-            l = Latex(
-                document_id = sent.document_id,
-                name = sent.name,
-                section_id = sent.section_id,
-                paragraph_id = sent.paragraph_id,
-                text = sent.text,
-                tokens = latex_tokens
-            )
-
-            session.add(l)
+            latex_rows.append({
+                'document_id': sent.document_id,
+                'name': sent.name,
+                'section_id': sent.section_id,
+                'paragraph_id': sent.paragraph_id,
+                'text': sent.text,
+                'tokens': latex_tokens
+            })
 
             sent.top = coordinates_record['top']
             sent.left = coordinates_record['left']
@@ -206,6 +203,10 @@ def link(words_location, db_connect_str, ignored_files=[]):
             if sent.name != 'Equation':
                 sanity_check()
     print('Before commit')
+    # Coordinates are ORM updates of the sentences, the new Latex and Image rows go in bulk
+    session.flush()
+    bulk_insert(session, Latex.__tablename__, latex_rows)
+    bulk_insert(session, Image.__tablename__, image_rows)
     session.commit()
 
 
@@ -3,16 +3,18 @@ from fonduer.parser.preprocessors import HTMLDocPreprocessor
 from fonduer.parser import Parser
 import argparse
 
-def parse(html_location, database):
+def parse(html_location, database, parallelism=1, clear=True):
     """
     Wrapper function for calling Fonduer parser.
     :param html_location: HTML files generated by ``parse_preprocess.py``.
     :param database: db connection string.
+    :param parallelism: Number of parser processes.
+    :param clear: Drop the documents already in the db, False to add to them.
     """
     session = Meta.init(database).Session()
     doc_preprocessor = HTMLDocPreprocessor(html_location)
     corpus_parser = Parser(session, structural=True, lingual=True)
-    corpus_parser.apply(doc_preprocessor)
+    corpus_parser.apply(doc_preprocessor, clear=clear, parallelism=parallelism)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,11 @@
 import os, sys
 import shutil
+import multiprocessing as mp
 sys.path.append(os.path.dirname(__file__))
+from fonduer import Meta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from link import link
 from pagemerger import pagemerger
@@ -10,11 +15,50 @@ from insert_equation import insert_equation_tuple
 from table_X_plus import build_table_X
 from csv_generator import generate_csv
 from table_one import var_in_text
+from db_models import IngestedDocument, bulk_insert, delete_documents
+from ingest_state import html_hash, document_name, plan_ingestion
+
+
+def _init_worker(db_connect_str):
+    # The parent emptied its pool before forking. Closing what the worker inherited could still reach sockets
+    # the parent owns, so the worker leaves the inherited engine alone and connects through its own engine.
+    Meta.init(db_connect_str)
+    Meta.engine = create_engine(db_connect_str, client_encoding='utf8', poolclass=NullPool)
+    Meta.Session = sessionmaker(bind=Meta.engine)
+
+
+def _preprocess_document(task):
+    merge_folder, html_file, output_html, output_words, output_equations, strip_tags = task
+    preprocess(os.path.join(merge_folder, html_file), "%s.json" % (os.path.join(output_words, html_file)),
+               os.path.join(output_html, html_file), "%s.json" % (os.path.join(output_equations, html_file)), "%s.json" % (os.path.join(output_words, 'path_info_'+html_file)), strip_tags)
+
+
+def _ingest_document(task):
+    """
+    Link coordinates, insert equations and extract variables of one parsed document
+    """
+    doc_name, output_words, output_equations, db_connect_str, ignored_file_when_link = task
+    link(output_words, db_connect_str, ignored_file_when_link, [doc_name])
+    insert_equation_tuple(db_connect_str, output_equations, [doc_name])
+    var_in_text(db_connect_str, [doc_name])
+    return doc_name
+
+
+def _run(fn, tasks, processes, initargs=None):
+    if processes == 1:
+        return [fn(task) for task in tasks]
+    if initargs is not None and getattr(Meta, 'engine', None) is not None:
+        # Forked workers must not inherit pooled connections the parent keeps using afterwards
+        Meta.engine.dispose()
+    with mp.Pool(processes=processes, initializer=_init_worker if initargs is not None else None,
+                 initargs=initargs or ()) as pool:
+        return pool.map(fn, tasks, chunksize=1)
 
 
 
 def parse_html_to_postgres(input_folder, output_html, merge_folder, output_words, output_equations, db_connect_str,
-                           strip_tags, ignored_file_when_link, csv_file, corenlp_fd, store_into_postgres=True):
+                           strip_tags, ignored_file_when_link, csv_file, corenlp_fd, store_into_postgres=True,
+                           incremental=False, processes=1):
     """
     Helper function for database ingestion.
     :param input_folder: Location of input folder containing source HTML files.
@@ -28,6 +72,9 @@ def parse_html_to_postgres(input_folder, output_html, merge_folder, output_words
     :param csv_file: Location of the output csv file
     :param corenlp_fd: Location of the CoreNLP java file.
     :param store_into_postgres: Flag for whether to ingest data into Postgres.
+    :param incremental: Add to the documents already in the db, skipping documents whose merged HTML was ingested
+                        before. Documents ingested with another HTML are replaced.
+    :param processes: Number of worker processes for merging, preprocessing, parsing and linking.
     """
     assert os.path.isabs(input_folder)
     assert os.path.isabs(output_html)
@@ -45,7 +92,23 @@ def parse_html_to_postgres(input_folder, output_html, merge_folder, output_words
     if os.path.exists(merge_folder):
         shutil.rmtree(merge_folder)
     os.makedirs(merge_folder, exist_ok=True)
-    pagemerger(input_folder, merge_folder)
+    pagemerger(input_folder, merge_folder, processes)
+
+    all_inputs = sorted(os.listdir(merge_folder))
+    hashes = {document_name(f): html_hash(os.path.join(merge_folder, f)) for f in all_inputs}
+    to_ingest = sorted(hashes)
+    if store_into_postgres and incremental:
+        session = Meta.init(db_connect_str).Session()
+        ingested = {doc.name: doc.html_hash for doc in session.query(IngestedDocument)}
+        new, changed, unchanged = plan_ingestion(hashes, ingested)
+        print('%d new, %d changed and %d unchanged documents' % (len(new), len(changed), len(unchanged)))
+        to_ingest = new + changed
+        # Changed documents and leftovers of failed runs are removed before they are parsed again
+        delete_documents(session, to_ingest)
+        session.commit()
+        session.close()
+        selected = set(to_ingest)
+        all_inputs = [f for f in all_inputs if document_name(f) in selected]
 
     """
     # 2. preprocess the input html and store intermediate json and html in the output folder declared above.
@@ -58,21 +121,19 @@ def parse_html_to_postgres(input_folder, output_html, merge_folder, output_words
         python preprocess.py --input $(merge_folder)$(file) --output_words $(output_words)$(file).json --output_html $(output_html)$(file);)
         @touch preprocess.stamp
     """
-    if os.path.exists(output_html):
-        shutil.rmtree(output_html)
-    if os.path.exists(output_words):
-        shutil.rmtree(output_words)
-    if os.path.exists(output_equations):
-        shutil.rmtree(output_equations)
+    # The parser reads every file in output_html, so it only ever holds the documents of this run.
+    # Incremental runs keep the coordinate json of earlier documents.
+    cleared = [output_html] if incremental else [output_html, output_words, output_equations]
+    for folder in cleared:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
 
     os.makedirs(output_html, exist_ok=True)
     os.makedirs(output_words, exist_ok=True)
     os.makedirs(output_equations, exist_ok=True)
 
-    all_inputs = [f for f in os.listdir(merge_folder)]
-    for html_file in all_inputs:
-        preprocess(os.path.join(merge_folder, html_file), "%s.json" % (os.path.join(output_words, html_file)),
-                   os.path.join(output_html, html_file), "%s.json" % (os.path.join(output_equations, html_file)), "%s.json" % (os.path.join(output_words, 'path_info_'+html_file)), strip_tags)
+    _run(_preprocess_document, [(merge_folder, html_file, output_html, output_words, output_equations, strip_tags)
+                                for html_file in all_inputs], processes)
 
     if store_into_postgres:
         """
@@ -82,7 +143,11 @@ def parse_html_to_postgres(input_folder, output_html, merge_folder, output_words
         python parse.py --html_location $(output_html) --database $(db_connect_str)
         @touch parse.stamp
         """
-        parse(output_html, db_connect_str)
+        if not all_inputs:
+            print('No new documents to ingest')
+            generate_csv(db_connect_str, csv_file)
+            return
+        parse(output_html, db_connect_str, parallelism=processes, clear=not incremental)
 
         """
         # 4. run the link file to insert coordinate information into fonduer based on the information from the json output folder (aka. hocr)
@@ -90,13 +155,17 @@ def parse_html_to_postgres(input_folder, output_html, merge_folder, output_words
             python link.py --words_location $(output_words) --database $(db_connect_str)
             @touch link.stamp
         """
-        link(output_words, db_connect_str, ignored_file_when_link)
-
-        insert_equation_tuple(db_connect_str, output_equations)
+        _run(_ingest_document, [(doc_name, output_words, output_equations, db_connect_str, ignored_file_when_link)
+                                for doc_name in to_ingest], processes, initargs=(db_connect_str,))
 
-        var_in_text(db_connect_str)
+        # CoreNLP runs as one server, so the phrase table is built in this process
+        build_table_X(db_connect_str, corenlp_fd, to_ingest if incremental else None)
 
-        build_table_X(db_connect_str,corenlp_fd)
+        session = Meta.init(db_connect_str).Session()
+        session.query(IngestedDocument).filter(IngestedDocument.name.in_(to_ingest)).delete(synchronize_session=False)
+        bulk_insert(session, IngestedDocument.__tablename__, [{'name': name, 'html_hash': hashes[name]} for name in to_ingest])
+        session.commit()
+        session.close()
 
         generate_csv(db_connect_str, csv_file)
         
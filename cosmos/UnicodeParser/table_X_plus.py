@@ -3,10 +3,10 @@ import re
 import string
 import pandas as pd
 from stanfordnlp.server import CoreNLPClient
-from db_models import Equation, Variable, TableX
+from db_models import Equation, Variable, TableX, bulk_insert
 from sqlalchemy.dialects import postgresql
 from fonduer.meta import Meta
-from fonduer.parser.models import Sentence
+from fonduer.parser.models import Document, Sentence
 
 from stanfordnlp.server import CoreNLPClient
 
@@ -288,17 +288,23 @@ def remove_symbol(phrases, indices_banned, text_banned):
                 break
     return res
 
-def build_table_X(db, corenlp):
+def build_table_X(db, corenlp, doc_names=None):
     """
     Build the table containing the symbols and phrases for each equation.
     :param db: db connection string.
     :param corenlp: Location of the CoreNLP java file.
+    :param doc_names: Optional names of the documents to build rows for, all documents by default.
     """
     os.environ["CORENLP_HOME"] = corenlp
 
     session = Meta.init(db).Session()
     variables = session.query(Variable).order_by(Variable.equation_id)
-    equations = session.query(Equation).order_by(Equation.id)
+    equations = session.query(Equation)
+    if doc_names is not None:
+        doc_ids = session.query(Document.id).filter(Document.name.in_(list(doc_names)))
+        equations = equations.filter(Equation.document_id.in_(doc_ids))
+    equations = equations.order_by(Equation.id)
+    rows = []
     sentences = session.query(Sentence).order_by(Sentence.id)
     with CoreNLPClient(annotators=['pos','depparse']) as client:
         vars_used_index = []
@@ -396,7 +402,7 @@ def build_table_X(db, corenlp):
                                 phrases_page.append(page_str)
                                     
                 
-                x = TableX(
+                rows.append(dict(
                     equation_id=eqt.id,
                     symbols=vars_used,
                     phrases=entities,
@@ -405,10 +411,9 @@ def build_table_X(db, corenlp):
                     phrases_left = phrases_left,
                     phrases_right = phrases_right,
                     phrases_page = phrases_page,
-                )
-
-                session.add(x)
+                ))
 
+        bulk_insert(session, TableX.__tablename__, rows)
         session.commit()
 
 
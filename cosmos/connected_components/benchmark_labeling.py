@@ -0,0 +1,183 @@
+"""
+Benchmark the run-length labeling engine against the original per-pixel
+connected components loop on rendered pages
+"""
+
+import os
+import click
+import numpy as np
+from PIL import Image
+from timeit import default_timer as timer
+from connected_components.labeling import label_components
+
+
+def get_components_loop(bmap):
+    """
+    Original per-pixel connected components loop, kept as the benchmark baseline
+    :param bmap: Input binary map (numpy nd array)
+    :return: List of coordinates (tl_x, tl_y, br_x, br_y) corresponding to connected components 
+    """
+    label_map = np.zeros(bmap.shape)
+    current_label = 1
+    label_dict = {}
+    # pass 1
+    for y in range(bmap.shape[1]):
+        for x in range(bmap.shape[0]):
+            # Background pixel, pass it
+            if bmap[x, y].item() == 0:
+                continue
+            # Top left corner
+            if x == 0 and y == 0:
+                label_map[x, y] = current_label
+                current_label += 1
+                continue
+            # top row pixel
+            if y == 0:
+                # Check only the west pixel
+                west = label_map[x-1, y]
+                if west == 0:
+                    label_map[x, y] = current_label
+                    current_label += 1
+                    continue
+                else:
+                    label_map[x, y] = west
+                    continue
+            # right column pixel
+            if x == bmap.shape[0]-1:
+                # Check all but northeast (since we're on the right most pixel and that is out of range
+                west = label_map[x-1, y]
+                north_west = label_map[x-1, y-1]
+                north = label_map[x, y-1].item()
+                points = [west, north_west, north]
+                filtered_points = [p for p in points if p != 0]
+                if len(filtered_points) == 0:
+                    label_map[x, y] = current_label
+                    current_label += 1
+                    continue
+                min_val = min(filtered_points)
+                for f in filtered_points:
+                    if f != min_val:
+                        if min_val in label_dict:
+                            label_dict[f] = label_dict[min_val]
+                        else:
+                            label_dict[f] = min_val
+                label_map[x, y] = min_val
+                continue
+            # left column pixel
+            if x == 0:
+                # Check north and northeast
+                north = label_map[x, y-1]
+                north_east = label_map[x+1, y-1]
+                points = [north, north_east]
+                filtered_points = [p for p in points if p != 0]
+                if len(filtered_points) == 0:
+                    label_map[x, y] = current_label
+                    current_label += 1
+                    continue
+                min_val = min(filtered_points)
+                for f in filtered_points:
+                    if f != min_val:
+                        if min_val in label_dict:
+                            label_dict[f] = label_dict[min_val]
+                        else:
+                            label_dict[f] = min_val
+                label_map[x, y] = min_val
+                continue
+            # Normal pixel
+            # finally, do all the west, north west, north, and north east points
+            west = label_map[x-1, y]
+            north_west = label_map[x-1, y-1]
+            north = label_map[x, y-1]
+            north_east = label_map[x+1, y-1]
+            points = [west, north_west, north, north_east]
+            filtered_points = [p for p in points if p != 0]
+            if len(filtered_points) == 0:
+                label_map[x, y] = current_label
+                current_label += 1
+                continue
+            min_val = min(filtered_points)
+            for f in filtered_points:
+                if f != min_val:
+                    if min_val in label_dict:
+                        label_dict[f] = label_dict[min_val]
+                    else:
+                        label_dict[f] = min_val
+            label_map[x, y] = min_val
+
+                
+    # pass 2
+    components_list = {}
+    for y in range(label_map.shape[1]):
+        for x in range(label_map.shape[0]):
+            if label_map[x, y] == 0:
+                continue
+            val = label_map[x, y]
+            if val in label_dict:
+                val = label_dict[val]
+            tl_x, tl_y, br_x, br_y = x, y, x, y
+            if val in components_list:
+                tl_x, tl_y, br_x, br_y = components_list[val]
+                if x < tl_x:
+                    tl_x = x
+                if x > br_x:
+                    br_x = x
+                # don't really need this but whatever i think it makes the code clear
+                if y < tl_y:
+                    tl_y = y
+                if y > br_y:
+                    br_y = y
+            components_list[val] = (tl_x, tl_y, br_x, br_y)
+    return list(components_list.values())
+
+
+def load_bmap(img_p, white_thresh=245):
+    """
+    Binarize a page the same way write_proposals does
+    :param img_p: Path to image
+    :param white_thresh: Threshold to filter non white pixels
+    :return: binary nd array
+    """
+    img = Image.open(img_p)
+    fn = lambda x : 0 if x > white_thresh else 255
+    return np.array(img.convert('L').point(fn, mode='1')).astype(np.uint8)
+
+
+def benchmark_page(img_p, white_thresh=245, legacy=True):
+    """
+    Time both labeling implementations on a single page
+    :param img_p: Path to image
+    :param white_thresh: Threshold to filter non white pixels
+    :param legacy: Also time the per-pixel loop (minutes per 1920x1920 page)
+    :return: dictionary of timings and component counts
+    """
+    bmap = load_bmap(img_p, white_thresh)
+    start = timer()
+    components = label_components(bmap)
+    result = {'page': os.path.basename(img_p),
+              'pixels': int(bmap.size),
+              'ink_pixels': int(components.counts.sum()),
+              'components': int(components.boxes.shape[0]),
+              'labeling_s': timer() - start}
+    if legacy:
+        start = timer()
+        legacy_components = get_components_loop(bmap)
+        result['legacy_s'] = timer() - start
+        result['legacy_components'] = len(legacy_components)
+        result['speedup'] = result['legacy_s'] / max(result['labeling_s'], 1e-9)
+    return result
+
+
+@click.command()
+@click.argument('img_dir')
+@click.option('--white-thresh', help='Threshold to filter non white pixels', default=245)
+@click.option('--max-pages', help='Number of pages to benchmark', default=5)
+@click.option('--legacy/--no-legacy', help='Also time the per-pixel loop', default=True)
+def benchmark(img_dir, white_thresh, max_pages, legacy):
+    pages = sorted(f for f in os.listdir(img_dir) if f.endswith('.png'))[:max_pages]
+    for page in pages:
+        result = benchmark_page(os.path.join(img_dir, page), white_thresh=white_thresh, legacy=legacy)
+        print(', '.join(f'{key}: {val:.3f}' if isinstance(val, float) else f'{key}: {val}' for key, val in result.items()))
+
+
+if __name__ == '__main__':
+    benchmark()
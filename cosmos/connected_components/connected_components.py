@@ -16,166 +16,46 @@ from torch import nn
 from torch.nn import functional as F
 import matplotlib.pyplot as plt
 import os
+from connected_components.labeling import label_components
+from connected_components.whitespace import InkTable
 
 
 def get_components(bmap, numpy=False):
     """
     Given a binary map, output an 8-connected components region
     :param bmap: Input binary map
-    :param numpy: By default we accept pytorch maps, but change this to True to pass in numpy array
+    :param numpy: Kept for backwards compatibility, both numpy arrays and pytorch maps are accepted
     :return: List of coordinates (tl_x, tl_y, br_x, br_y) corresponding to connected components 
     """
-    if numpy:
-        bmap = torch.from_numpy(bmap)
-    label_map = np.zeros(bmap.shape)
-    current_label = 1
-    label_dict = {}
-    # pass 1
-    for y in range(bmap.shape[1]):
-        for x in range(bmap.shape[0]):
-            # Background pixel, pass it
-            if bmap[x, y].item() == 0:
-                continue
-            # Top left corner
-            if x == 0 and y == 0:
-                label_map[x, y] = current_label
-                current_label += 1
-                continue
-            # top row pixel
-            if y == 0:
-                # Check only the west pixel
-                west = label_map[x-1, y]
-                if west == 0:
-                    label_map[x, y] = current_label
-                    current_label += 1
-                    continue
-                else:
-                    label_map[x, y] = west
-                    continue
-            # right column pixel
-            if x == bmap.shape[0]-1:
-                # Check all but northeast (since we're on the right most pixel and that is out of range
-                west = label_map[x-1, y]
-                north_west = label_map[x-1, y-1]
-                north = label_map[x, y-1].item()
-                points = [west, north_west, north]
-                filtered_points = [p for p in points if p != 0]
-                if len(filtered_points) == 0:
-                    label_map[x, y] = current_label
-                    current_label += 1
-                    continue
-                min_val = min(filtered_points)
-                for f in filtered_points:
-                    if f != min_val:
-                        if min_val in label_dict:
-                            label_dict[f] = label_dict[min_val]
-                        else:
-                            label_dict[f] = min_val
-                label_map[x, y] = min_val
-                continue
-            # left column pixel
-            if x == 0:
-                # Check north and northeast
-                north = label_map[x, y-1]
-                north_east = label_map[x+1, y-1]
-                points = [north, north_east]
-                filtered_points = [p for p in points if p != 0]
-                if len(filtered_points) == 0:
-                    label_map[x, y] = current_label
-                    current_label += 1
-                    continue
-                min_val = min(filtered_points)
-                for f in filtered_points:
-                    if f != min_val:
-                        if min_val in label_dict:
-                            label_dict[f] = label_dict[min_val]
-                        else:
-                            label_dict[f] = min_val
-                label_map[x, y] = min_val
-                continue
-            # Normal pixel
-            # finally, do all the west, north west, north, and north east points
-            west = label_map[x-1, y]
-            north_west = label_map[x-1, y-1]
-            north = label_map[x, y-1]
-            north_east = label_map[x+1, y-1]
-            points = [west, north_west, north, north_east]
-            filtered_points = [p for p in points if p != 0]
-            if len(filtered_points) == 0:
-                label_map[x, y] = current_label
-                current_label += 1
-                continue
-            min_val = min(filtered_points)
-            for f in filtered_points:
-                if f != min_val:
-                    if min_val in label_dict:
-                        label_dict[f] = label_dict[min_val]
-                    else:
-                        label_dict[f] = min_val
-            label_map[x, y] = min_val
-
-                
-    # pass 2
-    components_list = {}
-    for y in range(label_map.shape[1]):
-        for x in range(label_map.shape[0]):
-            if label_map[x, y] == 0:
-                continue
-            val = label_map[x, y]
-            if val in label_dict:
-                val = label_dict[val]
-            tl_x, tl_y, br_x, br_y = x, y, x, y
-            if val in components_list:
-                tl_x, tl_y, br_x, br_y = components_list[val]
-                if x < tl_x:
-                    tl_x = x
-                if x > br_x:
-                    br_x = x
-                # don't really need this but whatever i think it makes the code clear
-                if y < tl_y:
-                    tl_y = y
-                if y > br_y:
-                    br_y = y
-            components_list[val] = (tl_x, tl_y, br_x, br_y)
-    return list(components_list.values())
+    components = label_components(bmap)
+    return [tuple(box) for box in components.boxes.tolist()]
 
 
-def balance_margins(bmap, img):
+def balance_margins(bmap, img, ink_table=None):
     """
     Given an input binary map, balance possibly unequal margins. The motivation is to better determine the column number
     :param bmap: Binary input map (numpy nd array)
     :param img: Map of original image (np nd array)
+    :param ink_table: Optional InkTable over bmap, built if not passed
     :return: Adjusted bmap, Adjusted img, left margin difference (must adjust downstream)
     """
-    img_height = bmap.shape[0]
-    zero_col = np.zeros(img_height)
-    left_w, right_w = 0, 0
-    stop_left, stop_right = False, False
-    for i in range(1, bmap.shape[1]):
-        left = bmap[:, i]
-        right = bmap[:, bmap.shape[1]-i]
-        if not (left == zero_col).all():
-            stop_left = True
-        if not (right == zero_col).all():
-            stop_right = True
-        if stop_left and stop_right:
-            diff = abs(left_w - right_w)
-            if left_w < right_w:
-                img = img[:, :bmap.shape[1]-diff, :]
-                bmap = bmap[:, :bmap.shape[1]-diff]
-            else:
-                img = img[:, diff:, :]
-                bmap = bmap[:, diff:]
-            break
-        elif stop_left:
-            right_w += 1
-        elif stop_right:
-            left_w += 1
-        else:
-            right_w += 1
-            left_w += 1
-    l_diff = left_w - right_w if left_w > right_w else 0
-    return bmap, img, l_diff
+    if ink_table is None:
+        ink_table = InkTable(bmap)
+    width = bmap.shape[1]
+    # Column 0 is never inspected, so the scan runs over columns 1..width-1 from both sides
+    ink_cols = np.nonzero(ink_table.col_ink()[1:])[0] + 1
+    if ink_cols.shape[0] == 0:
+        return bmap, img, 0
+    first_left = int(ink_cols[0])
+    first_right = width - int(ink_cols[-1])
+    diff = abs(first_left - first_right)
+    if first_left < first_right:
+        img = img[:, :width-diff, :]
+        bmap = bmap[:, :width-diff]
+        return bmap, img, 0
+    img = img[:, diff:, :]
+    bmap = bmap[:, diff:]
+    return bmap, img, diff
 
 
 def get_blank_rows(inp_np, blank_row_h):
@@ -185,106 +65,53 @@ def get_blank_rows(inp_np, blank_row_h):
     :param blank_row_h: Blank row height
     :return: [integer denoting separation locations via y axis]
     """
-    blank_row = np.zeros((blank_row_h, inp_np.shape[1]))
-    curr_top = 0
-    curr_bot = blank_row_h
-    white_rows = []
-    while curr_bot < inp_np.shape[0]-1:
-        sub_img = inp_np[curr_top:curr_bot, :]
-        if (sub_img == blank_row).all():
-            if len(white_rows) == 0:
-                white_rows.append(curr_bot)
-                curr_top += 1
-                curr_bot = curr_top + blank_row_h
-                continue
-            last_white_bot = white_rows[len(white_rows)-1]
-            if last_white_bot >= curr_top:
-                white_rows[len(white_rows)-1] = curr_bot
-            else:
-                white_rows.append(curr_bot)
-        elif curr_top == 0:
-            white_rows.append(0)
-        elif curr_bot == inp_np.shape[0]-2:
-            white_rows.append(inp_np.shape[0]-1)
-        curr_top += 1
-        curr_bot = curr_top + blank_row_h
-    return white_rows
+    return InkTable(inp_np).blank_rows(blank_row_h)
 
-def write_proposals(img_p, output_dir='tmp/cc_proposals', white_thresh=245, blank_row_height=15, filter_thres=5):
+def segment_page(ink_table, bmap_np, blank_row_height):
     """
-     Function that handles writing of object proposals
-    :param img_p: Path to image
-    :param output_dir: Path to output directory
-    :param white_thres: Threshold to filter non white pixels
+    Split a page into rows, columns and objects at a single blank row height
+    :param ink_table: InkTable over bmap_np
+    :param bmap_np: Margin balanced binary map of the page (numpy nd array)
     :param blank_row_height: row height parameter
-    :param filter_thres: Filter object size threshold parameter
+    :return: {(num_cols, column_index): [(tl_y, tl_x, br_y, br_x)]}, number of objects, summed object heights
     """
-    img = Image.open(img_p)
-    fn = lambda x : 0 if x > white_thresh else 255
-    img_np = np.array(img.convert('RGB'))
-    bmap_np = np.array(img.convert('L').point(fn, mode='1')).astype(np.uint8)
-    img_np_orig = img_np
-    bmap_np, img_np, left_shave = balance_margins(bmap_np, img_np)
-    img_height = bmap_np.shape[0]
-    num_sections = int(img_height / blank_row_height)
-    blank_row = np.zeros((blank_row_height, bmap_np.shape[1]))
-    curr_top = 0
-    white_rows = get_blank_rows(bmap_np, blank_row_height)
+    white_rows = ink_table.blank_rows(blank_row_height)
     rows = []
     for i in range(len(white_rows)-1):
         curr = white_rows[i]
         nxt = white_rows[i+1]
         rows.append((bmap_np[curr:nxt, :], curr, nxt))
-    block_coords = set()
     block_coords2 = {}
-    blocks_list = []
     obj_count = 0
     obj_heights = 0
     for row, top_coord, bottom_coord in rows:
-        blocks = coords = col_idx = num_cols = None
+        coords = col_idx = num_cols = None
         # Old way
         if row.shape[0] < 10 * blank_row_height:
-            num_cols = get_columns_for_row(row)
-            blocks, coords, col_idx = divide_row_into_columns(row, num_cols)
+            num_cols = get_columns_for_row(row, ink_table=ink_table, top=top_coord)
+            _, coords, col_idx = divide_row_into_columns(row, num_cols)
         else:
             # New way
-            rowT = row.T
-            white_cols = get_blank_rows(rowT, blank_row_height)
-            cols = []
-            blocks = []
+            white_cols = ink_table.blank_cols(blank_row_height, top=top_coord, bottom=bottom_coord)
             coords = []
             col_idx = []
             num_cols = len(col_idx)
             for i in range(len(white_cols)-1):
-                curr = white_cols[i]
-                nxt = white_cols[i+1]
-                spl = rowT[curr:nxt, :]
-                spl = spl.T
-                blocks.append(spl)
-                coords.append((curr, nxt))
+                coords.append((white_cols[i], white_cols[i+1]))
                 col_idx.append(i)
 
-        for ind, b in enumerate(blocks):
-            c = coords[ind]
+        for ind, c in enumerate(coords):
             column_index = col_idx[ind]
-
-            white_rows = get_blank_rows(b, blank_row_height)
-            rows2 = []
+            block_table = ink_table.crop(top=top_coord, left=c[0], bottom=bottom_coord, right=c[1])
+            white_rows = block_table.blank_rows(blank_row_height)
             for i in range(len(white_rows)-1):
-                curr = white_rows[i]
-                nxt = white_rows[i+1]
-                rows2.append((b[curr:nxt, :], curr, nxt))
-            for r, c2, n in rows2:
+                c2 = white_rows[i]
+                n = white_rows[i+1]
                 # Replacing components with finding the proper pixel vals
-                one_inds = np.argwhere(r)
-                if len(one_inds) == 0:
+                ink_bbox = block_table.ink_bbox(top=c2, bottom=n)
+                if ink_bbox is None:
                     continue
-                h_one_inds = np.hsplit(one_inds, 2)
-
-                x1 = int(np.min(h_one_inds[1]))
-                y1 = int(np.min(h_one_inds[0]))
-                x2 = int(np.max(h_one_inds[1]))
-                y2 = int(np.max(h_one_inds[0]))
+                y1, x1, y2, x2 = ink_bbox
 
                 key = (num_cols, column_index)
                 val = (top_coord + c2 + y1, c[0] + x1, top_coord + c2 + y2, c[0]+x2)
@@ -295,12 +122,51 @@ def write_proposals(img_p, output_dir='tmp/cc_proposals', white_thresh=245, blan
                     block_coords2[key].append(val)
                 else:
                     block_coords2[key] = [val]
-    
-    if obj_count > 0:
-        avg_height = obj_heights / obj_count
-        if avg_height < 3 * blank_row_height:
-            write_proposals(img_p, output_dir, white_thresh=white_thresh, blank_row_height=2 * blank_row_height, filter_thres=filter_thres)
-            return
+    return block_coords2, obj_count, obj_heights
+
+
+def segment_page_multiscale(ink_table, bmap_np, blank_row_height=15, max_scales=None):
+    """
+    Segment a page at doubling blank row heights until the average object is at least three blank rows tall.
+    The page and its ink table stay in memory, so each extra scale costs one segmentation pass and no decode.
+    :param ink_table: InkTable over bmap_np
+    :param bmap_np: Margin balanced binary map of the page (numpy nd array)
+    :param blank_row_height: smallest row height to try
+    :param max_scales: Maximum number of scales to try, unbounded by default
+    :return: winning blank row height, {(num_cols, column_index): [(tl_y, tl_x, br_y, br_x)]} at that height
+    """
+    scale = blank_row_height
+    nscales = 1
+    while True:
+        block_coords2, obj_count, obj_heights = segment_page(ink_table, bmap_np, scale)
+        if obj_count == 0 or obj_heights / obj_count >= 3 * scale:
+            return scale, block_coords2
+        if max_scales is not None and nscales >= max_scales:
+            return scale, block_coords2
+        scale *= 2
+        nscales += 1
+
+
+def get_proposals(img, white_thresh=245, blank_row_height=15, filter_thres=5, max_scales=None):
+    """
+    Compute object proposals for an in memory page
+    :param img: PIL image of the page
+    :param white_thres: Threshold to filter non white pixels
+    :param blank_row_height: row height parameter
+    :param filter_thres: Filter object size threshold parameter
+    :param max_scales: Maximum number of doubled blank row heights to try, unbounded by default
+    :return: [(tl_x, tl_y, br_x, br_y)] proposals, blank row height the page was segmented at
+    """
+    fn = lambda x : 0 if x > white_thresh else 255
+    img_np = np.array(img.convert('RGB'))
+    bmap_np = np.array(img.convert('L').point(fn, mode='1')).astype(np.uint8)
+    page_table = InkTable(bmap_np)
+    bmap_np, img_np, left_shave = balance_margins(bmap_np, img_np, ink_table=page_table)
+    # balance_margins only crops columns, so the page table is reused through a view
+    right_shave = page_table.shape[1] - left_shave - bmap_np.shape[1]
+    ink_table = page_table.crop(left=left_shave, right=page_table.shape[1] - right_shave)
+    scale, block_coords2 = segment_page_multiscale(ink_table, bmap_np, blank_row_height, max_scales=max_scales)
+    block_coords = set()
     for key in block_coords2:
         coords_list = block_coords2[key]
         for ind2, bc in enumerate(coords_list):
@@ -312,16 +178,35 @@ def write_proposals(img_p, output_dir='tmp/cc_proposals', white_thresh=245, blan
                 continue
             adjusted = (left_shave + tl_x1, tl_y1, left_shave + br_x1, br_y1)
             block_coords.add(adjusted)
+    return list(block_coords), scale
 
-    block_coords = list(block_coords)
+
+def write_proposals(img_p, output_dir='tmp/cc_proposals', white_thresh=245, blank_row_height=15, filter_thres=5, max_scales=None, image=None, write_annotated=True):
+    """
+     Function that handles writing of object proposals
+    :param img_p: Path to image
+    :param output_dir: Path to output directory
+    :param white_thres: Threshold to filter non white pixels
+    :param blank_row_height: row height parameter
+    :param filter_thres: Filter object size threshold parameter
+    :param max_scales: Maximum number of doubled blank row heights to try, unbounded by default
+    :param image: optional PIL image object that will be used instead of opening image at img_p
+    :param write_annotated: Also write a copy of the page with the proposals drawn on it
+    :return: [(tl_x, tl_y, br_x, br_y)] proposals
+    """
+    img = Image.open(img_p) if image is None else image
+    block_coords, scale = get_proposals(img, white_thresh=white_thresh, blank_row_height=blank_row_height,
+                                        filter_thres=filter_thres, max_scales=max_scales)
     img_p = os.path.basename(img_p)
     write_p = os.path.join(output_dir, img_p[:-4] + '.csv')
     write_img_p = os.path.join(output_dir, img_p)
     with open(write_p, 'w', encoding='utf-8') as wp:
         for coord in block_coords:
-            wp.write(f'{coord[0]},{coord[1]},{coord[2]},{coord[3]}\n')
-    draw_cc(img_np_orig, block_coords, write_img_p=write_img_p)
-    return
+            # The fifth column records the blank row height the page was segmented at
+            wp.write(f'{coord[0]},{coord[1]},{coord[2]},{coord[3]},{scale}\n')
+    if write_annotated:
+        draw_cc(np.array(img.convert('RGB')), block_coords, write_img_p=write_img_p)
+    return block_coords
 
 
 def draw_cc(img_np, cc_list, write_img_p=None):
@@ -340,12 +225,18 @@ def draw_cc(img_np, cc_list, write_img_p=None):
     Image.fromarray(img_np).save(write_p)
 
 
-def get_columns_for_row(row):
+def get_columns_for_row(row, ink_table=None, top=0):
     """
     Detect number of columns in a row
     :param row: nd array denoting row
+    :param ink_table: Optional InkTable of the page the row was cut from, built over row if not passed
+    :param top: Top coordinate of the row inside ink_table
     :return: number of columns
     """
+    if ink_table is None:
+        ink_table = InkTable(row)
+        top = 0
+    bottom = top + row.shape[0]
     # 3/100 width = test width. We need half that for later
     test_width = int(math.ceil(row.shape[1] / 200))
     half_test_width = int(math.ceil(test_width / 2))
@@ -357,11 +248,7 @@ def get_columns_for_row(row):
         test_points = []
         for i in range(1, c):
             test_points.append(int(row_w / c * i))
-        def mark_empty_block(p):
-            block = row[:, p-half_test_width:p+half_test_width]
-            test_col = np.zeros((block.shape[0], block.shape[1]))
-            return (block == test_col).all()
-        test_blocks = [mark_empty_block(p) for p in test_points]
+        test_blocks = [ink_table.is_blank(top, p-half_test_width, bottom, p+half_test_width) for p in test_points]
         if False not in test_blocks:
             curr_c = c
     return curr_c
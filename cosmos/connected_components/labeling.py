@@ -0,0 +1,171 @@
+"""
+Run-length connected components labeling backed by an array union-find.
+
+Foreground pixels are grouped into horizontal runs, runs on neighboring rows
+are linked under 8-connectivity, and the links are resolved with a union-find
+over run indices. Every step is a numpy array operation, so no per-pixel
+python code runs.
+"""
+
+from collections import namedtuple
+import numpy as np
+
+Components = namedtuple('Components', ['boxes', 'counts', 'labels'])
+
+
+class UnionFind:
+    """
+    Array backed union-find over the integers [0, n)
+    """
+    def __init__(self, n):
+        """
+        Initialize n singleton sets
+        :param n: number of elements
+        """
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, idxs):
+        """
+        Find the roots of a batch of elements, compressing the paths along the way
+        :param idxs: int array of element indices
+        :return: int array of roots
+        """
+        self.compress()
+        return self.parent[idxs]
+
+    def compress(self):
+        """
+        Point every element directly at its root via pointer jumping
+        """
+        while True:
+            grand = self.parent[self.parent]
+            if np.array_equal(grand, self.parent):
+                return
+            self.parent = grand
+
+    def union(self, a, b):
+        """
+        Merge the sets containing a[i] and b[i] for every i. The smaller root is kept
+        as the representative, so each set is named by its smallest element.
+        :param a: int array of element indices
+        :param b: int array of element indices, same length as a
+        """
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        while a.shape[0] > 0:
+            self.compress()
+            ra = self.parent[a]
+            rb = self.parent[b]
+            pending = ra != rb
+            if not pending.any():
+                return
+            a, b, ra, rb = a[pending], b[pending], ra[pending], rb[pending]
+            low = np.minimum(ra, rb)
+            high = np.maximum(ra, rb)
+            # Hook roots onto the smallest root they are linked to. Conflicting hooks on
+            # the same root are resolved on the next iteration.
+            np.minimum.at(self.parent, high, low)
+
+    def roots(self):
+        """
+        :return: root of every element
+        """
+        self.compress()
+        return self.parent
+
+
+def to_binary_numpy(bmap):
+    """
+    Convert a numpy array or torch tensor to a boolean numpy array
+    :param bmap: 2D numpy array or torch tensor, nonzero is foreground
+    :return: 2D boolean numpy array
+    """
+    if hasattr(bmap, 'detach'):
+        bmap = bmap.detach().cpu().numpy()
+    bmap = np.asarray(bmap)
+    if bmap.ndim != 2:
+        raise ValueError(f'Expected a 2D binary map, got shape {bmap.shape}')
+    return bmap != 0
+
+
+def find_runs(bmap):
+    """
+    Run-length encode the foreground of a binary map along its second axis
+    :param bmap: 2D boolean numpy array
+    :return: (rows, starts, ends) int arrays, ends are exclusive. Runs are ordered row-major.
+    """
+    h, w = bmap.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = bmap
+    diffs = np.diff(padded, axis=1)
+    start_rows, starts = np.nonzero(diffs == 1)
+    _, ends = np.nonzero(diffs == -1)
+    return start_rows.astype(np.int64), starts.astype(np.int64), ends.astype(np.int64)
+
+
+def link_runs(rows, starts, ends, width):
+    """
+    Find every pair of 8-connected runs on consecutive rows
+    :param rows: run rows
+    :param starts: run starts
+    :param ends: run ends (exclusive)
+    :param width: width of the binary map
+    :return: (upper, lower) int arrays of run indices that touch
+    """
+    # Keys order runs row-major, which lets one searchsorted per run find its
+    # touching runs on the next row
+    stride = width + 2
+    start_keys = rows * stride + starts
+    end_keys = rows * stride + ends
+    next_row = (rows + 1) * stride
+    # Runs on the next row touch [s, e) iff they end at or after s and start at or before e
+    lo = np.searchsorted(end_keys, next_row + starts, side='left')
+    hi = np.searchsorted(start_keys, next_row + ends, side='right')
+    counts = np.maximum(hi - lo, 0)
+    upper = np.repeat(np.arange(rows.shape[0], dtype=np.int64), counts)
+    offsets = np.arange(upper.shape[0], dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    lower = np.repeat(lo, counts) + offsets
+    return upper, lower
+
+
+def label_components(bmap, return_labels=False):
+    """
+    Label the 8-connected components of a binary map
+    :param bmap: 2D numpy array or torch tensor, nonzero is foreground
+    :param return_labels: Also paint a label map (0 is background, components start at 1)
+    :return: Components namedtuple. boxes is a [K x 4] int array of (tl_x, tl_y, br_x, br_y) inclusive
+             coordinates where x indexes the first axis of bmap, counts is a [K] array of pixel counts,
+             labels is the label map or None. Components are ordered by their first pixel in row-major order.
+    """
+    bmap = to_binary_numpy(bmap)
+    h, w = bmap.shape
+    rows, starts, ends = find_runs(bmap)
+    nruns = rows.shape[0]
+    if nruns == 0:
+        labels = np.zeros((h, w), dtype=np.int32) if return_labels else None
+        return Components(np.zeros((0, 4), dtype=np.int64), np.zeros(0, dtype=np.int64), labels)
+    uf = UnionFind(nruns)
+    upper, lower = link_runs(rows, starts, ends, w)
+    uf.union(upper, lower)
+    roots, run_labels = np.unique(uf.roots(), return_inverse=True)
+    ncomponents = roots.shape[0]
+    counts = np.bincount(run_labels, weights=ends - starts, minlength=ncomponents).astype(np.int64)
+    # Runs are row ordered, so the first and last run of a component give its row extent
+    tl_x = np.full(ncomponents, h, dtype=np.int64)
+    br_x = np.full(ncomponents, -1, dtype=np.int64)
+    tl_y = np.full(ncomponents, w, dtype=np.int64)
+    br_y = np.full(ncomponents, -1, dtype=np.int64)
+    np.minimum.at(tl_x, run_labels, rows)
+    np.maximum.at(br_x, run_labels, rows)
+    np.minimum.at(tl_y, run_labels, starts)
+    np.maximum.at(br_y, run_labels, ends - 1)
+    boxes = np.stack([tl_x, tl_y, br_x, br_y], axis=1)
+    labels = None
+    if return_labels:
+        lengths = ends - starts
+        flat_starts = np.repeat(rows * w + starts, lengths)
+        offsets = np.arange(flat_starts.shape[0], dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        labels = np.zeros(h * w, dtype=np.int32)
+        labels[flat_starts + offsets] = np.repeat(run_labels + 1, lengths)
+        labels = labels.reshape(h, w)
+    return Components(boxes, counts, labels)
@@ -0,0 +1,141 @@
+"""
+Whitespace segmentation over a summed-area table of page ink.
+
+The table is built once per page. After that the ink count of any rectangle,
+and so whether a run of rows or columns is blank, is answered in O(1), and a
+sliding blank window scan over a region is a single vectorized pass.
+"""
+
+import numpy as np
+
+
+def scan_blank_windows(window_ink, extent, blank_h):
+    """
+    Turn the ink counts of a sliding window into separation locations. This reproduces the sequential
+    scan of the original get_blank_rows: a run of blank windows is reported by the bottom of its last
+    window, a non blank first window adds 0 and a non blank last window adds extent-1.
+    :param window_ink: ink count of the window starting at each offset
+    :param extent: length of the scanned axis
+    :param blank_h: window length
+    :return: [integer denoting separation locations]
+    """
+    nwindows = window_ink.shape[0]
+    if nwindows == 0:
+        return []
+    blank = window_ink == 0
+    white_rows = []
+    if not blank[0]:
+        white_rows.append(0)
+    run_ends = np.nonzero(blank & np.append(~blank[1:], True))[0]
+    white_rows.extend((run_ends + blank_h).tolist())
+    if not blank[-1] and nwindows > 1:
+        white_rows.append(extent - 1)
+    return white_rows
+
+
+class InkTable:
+    """
+    Summed-area table over a binary page map
+    """
+    def __init__(self, bmap, sat=None, offset=(0, 0), shape=None):
+        """
+        Build the table
+        :param bmap: Binary map (numpy nd array), nonzero is ink. May be None when sat is given.
+        :param sat: Existing summed-area table to share, used by crop
+        :param offset: (top, left) of this table inside sat
+        :param shape: (height, width) of this table inside sat
+        """
+        if sat is None:
+            bmap = np.asarray(bmap) != 0
+            sat = np.zeros((bmap.shape[0] + 1, bmap.shape[1] + 1), dtype=np.int64)
+            np.cumsum(bmap, axis=0, out=sat[1:, 1:])
+            np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+            shape = bmap.shape
+        self.sat = sat
+        self.top, self.left = offset
+        self.shape = tuple(shape)
+
+    def crop(self, top=0, left=0, bottom=None, right=None):
+        """
+        View of a sub-rectangle of the page, sharing the underlying table
+        :return: InkTable whose coordinates start at (top, left)
+        """
+        bottom, right = self._clip(bottom, right)
+        return InkTable(None, sat=self.sat, offset=(self.top + top, self.left + left), shape=(bottom - top, right - left))
+
+    def _clip(self, bottom, right):
+        bottom = self.shape[0] if bottom is None else bottom
+        right = self.shape[1] if right is None else right
+        return bottom, right
+
+    def ink(self, top, left, bottom, right):
+        """
+        Ink pixel count of the rectangle [top:bottom, left:right]
+        """
+        t, l, b, r = top + self.top, left + self.left, bottom + self.top, right + self.left
+        sat = self.sat
+        return int(sat[b, r] - sat[t, r] - sat[b, l] + sat[t, l])
+
+    def is_blank(self, top, left, bottom, right):
+        """
+        :return: True if the rectangle [top:bottom, left:right] has no ink
+        """
+        return self.ink(top, left, bottom, right) == 0
+
+    def row_ink(self, top=0, left=0, bottom=None, right=None):
+        """
+        Per row ink counts of a region
+        :return: array of length bottom-top
+        """
+        bottom, right = self._clip(bottom, right)
+        rows = self.sat[self.top + top:self.top + bottom + 1]
+        cumulative = rows[:, self.left + right] - rows[:, self.left + left]
+        return np.diff(cumulative)
+
+    def col_ink(self, top=0, left=0, bottom=None, right=None):
+        """
+        Per column ink counts of a region
+        :return: array of length right-left
+        """
+        bottom, right = self._clip(bottom, right)
+        cols = self.sat[:, self.left + left:self.left + right + 1]
+        cumulative = cols[self.top + bottom] - cols[self.top + top]
+        return np.diff(cumulative)
+
+    def blank_rows(self, blank_row_h, top=0, left=0, bottom=None, right=None):
+        """
+        Equivalent of get_blank_rows on the region [top:bottom, left:right]
+        :param blank_row_h: Blank row height
+        :return: [integer denoting separation locations via y axis, relative to top]
+        """
+        bottom, right = self._clip(bottom, right)
+        return self._blank_scan(self.row_ink(top, left, bottom, right), blank_row_h)
+
+    def blank_cols(self, blank_col_w, top=0, left=0, bottom=None, right=None):
+        """
+        Equivalent of get_blank_rows on the transpose of the region [top:bottom, left:right]
+        :param blank_col_w: Blank column width
+        :return: [integer denoting separation locations via x axis, relative to left]
+        """
+        bottom, right = self._clip(bottom, right)
+        return self._blank_scan(self.col_ink(top, left, bottom, right), blank_col_w)
+
+    @staticmethod
+    def _blank_scan(line_ink, blank_h):
+        extent = line_ink.shape[0]
+        nwindows = max(extent - 1 - blank_h, 0)
+        cumulative = np.concatenate(([0], np.cumsum(line_ink)))
+        window_ink = cumulative[blank_h:blank_h + nwindows] - cumulative[:nwindows]
+        return scan_blank_windows(window_ink, extent, blank_h)
+
+    def ink_bbox(self, top=0, left=0, bottom=None, right=None):
+        """
+        Tight bounding box of the ink inside a region
+        :return: (y1, x1, y2, x2) inclusive and relative to (top, left), or None if the region is blank
+        """
+        bottom, right = self._clip(bottom, right)
+        rows = np.nonzero(self.row_ink(top, left, bottom, right))[0]
+        if rows.shape[0] == 0:
+            return None
+        cols = np.nonzero(self.col_ink(top, left, bottom, right))[0]
+        return int(rows[0]), int(cols[0]), int(rows[-1]), int(cols[-1])
@@ -0,0 +1,181 @@
+"""
+Per page index of the regions of a page html.
+The page is parsed once with lxml. Every region div is keyed by the
+coordinates of its hocr div; the image path and the words of a region are
+read from the tree the first time they are asked for. Target to caption
+association uses distance matrices over all targets and captions of a page.
+"""
+from collections import defaultdict, namedtuple
+import numpy as np
+from lxml import etree
+from lxml import html as lxml_html
+from postprocess.postprocess import segment_divs, next_hocr
+
+Region = namedtuple('Region', ['cls', 'coords', 'score', 'div'])
+HTML_PARSER = lxml_html.HTMLParser(encoding='utf-8')
+NEXT_IMG_XPATH = etree.XPath("(descendant::img | following::img)[1]")
+WORD_XPATH = etree.XPath(".//*[@class='ocrx_word']")
+
+
+def class_matches(cls, query):
+    """
+    soup.find_all('div', query) class matching: a query with whitespace must equal the whole class,
+    otherwise it must equal one of the classes
+    :param cls: normalized class attribute of a div
+    :param query: class searched for
+    :return: True if the div matches
+    """
+    if ' ' in query:
+        return cls == ' '.join(query.split())
+    return query in cls.split() or cls == query
+
+
+class PageRegions:
+    """
+    Regions of one page html, indexed by coordinates
+    """
+    def __init__(self, html_f):
+        """
+        :param html_f: page html
+        """
+        root = lxml_html.parse(html_f, parser=HTML_PARSER).getroot()
+        self.regions = []
+        self.by_coords = defaultdict(list)
+        for seg_type in segment_divs(root):
+            hocr = next_hocr(seg_type)
+            if hocr is None:
+                print(seg_type)
+                raise Exception('Invalid div found. Please account for said div')
+            coords = tuple(int(x) for x in hocr.get('data-coordinates').split(' '))
+            region = Region(' '.join(seg_type.get('class').split()), coords, float(hocr.get('data-score')), seg_type)
+            self.regions.append(region)
+            self.by_coords[coords].append(region)
+        self._info = {}
+
+    def cls_list(self):
+        """
+        :return: [(cls, bb, score)] sorted by bb, as xml2list returns it for the page's xml
+        """
+        return sorted([(r.cls, tuple(r.coords), r.score) for r in self.regions], key=lambda x: x[1])
+
+    def find(self, cls, bb):
+        """
+        :param cls: class of the region
+        :param bb: coordinates of the region
+        :return: first Region in document order with this class and coordinates, or None
+        """
+        for region in self.by_coords.get(tuple(bb), []):
+            if class_matches(region.cls, cls):
+                return region
+        return None
+
+    def info(self, region):
+        """
+        :param region: Region of this page
+        :return: (image path, unicode words, tesseract words)
+        """
+        key = id(region.div)
+        if key not in self._info:
+            img = NEXT_IMG_XPATH(region.div)[0]
+            self._info[key] = (str(img.get('src')), collect_region_words(region.div, 'text_unicode'),
+                               collect_region_words(region.div, 'hocr'))
+        return self._info[key]
+
+
+def collect_region_words(div, target):
+    """
+    Words of a region div
+    :param div: region div element
+    :param target: class that must be present in the region
+    :return: String of word list
+    """
+    if len(div.xpath(f".//*[@class='{target}']")) == 0:
+        print(etree.tostring(div, pretty_print=True))
+        print('----')
+        print(target)
+        raise Exception('Unable to find target on root')
+    return ' '.join(w.text for w in WORD_XPATH(div) if w.text is not None and w.text.strip())
+
+
+def associate(targets, cls_associations):
+    """
+    Associate every target with the association closest to its top left corner (measured to the association's
+    bottom left) or to its bottom right corner (measured to the association's top right), whichever is closer
+    :param targets: [(cls, bb, score)] targets
+    :param cls_associations: [(cls, bb, score)] candidate associations
+    :return: list with the association of each target, None when there are no candidates
+    """
+    if len(cls_associations) == 0:
+        return [None] * len(targets)
+    t = np.array([x[1] for x in targets], dtype=np.int64).reshape(-1, 4)
+    a = np.array([x[1] for x in cls_associations], dtype=np.int64).reshape(-1, 4)
+    # squared distances, targets x associations
+    bl_dists = (t[:, None, 0] - a[None, :, 0]) ** 2 + (t[:, None, 1] - a[None, :, 3]) ** 2
+    tr_dists = (t[:, None, 2] - a[None, :, 2]) ** 2 + (t[:, None, 3] - a[None, :, 1]) ** 2
+    bl_ind = bl_dists.argmin(axis=1)
+    tr_ind = tr_dists.argmin(axis=1)
+    rows = np.arange(len(t))
+    use_bl = bl_dists[rows, bl_ind] <= tr_dists[rows, tr_ind]
+    return [cls_associations[int(b) if ub else int(r)] for b, r, ub in zip(bl_ind, tr_ind, use_bl)]
+
+
+def get_target_map(page, target_cls, target_cls_association):
+    """
+    Get a map with targets and target associations
+    :param page: PageRegions of the page
+    :param target_cls: the target class
+    :param target_cls_association: the target class association
+    :return: dictionary mapping targets to target associations, list of associations without a target
+    """
+    cls_list = page.cls_list()
+    targets = [x for x in cls_list if x[0] == target_cls]
+    if len(targets) == 0:
+        return None, None
+    cls_associations = [x for x in cls_list if x[0] == target_cls_association]
+    target_map = dict(zip(targets, associate(targets, cls_associations)))
+    leftover = set(target_map.values())
+    leftover_assocs = [assoc for assoc in cls_associations if assoc not in leftover]
+    return target_map, leftover_assocs
+
+
+def page_rows(page, target_cls, target_cls_association):
+    """
+    Rows of the target <=> target association table for one page
+    :param page: PageRegions of the page
+    :param target_cls: Target class
+    :param target_cls_association: Association class
+    :return: dict of column lists, or None if the page has no target
+    """
+    target_map, leftover_assocs = get_target_map(page, target_cls, target_cls_association)
+    if target_map is None:
+        return None
+    df_dict = {'target_img_path': [], 'target_unicode': [], 'target_tesseract': [], 'assoc_img_path': [], 'assoc_unicode': [], 'assoc_tesseract': []}
+
+    def lookup(obj):
+        region = page.find(obj[0], obj[1]) if obj is not None else None
+        return page.info(region) if region is not None else (None, None, None)
+
+    for target, target_assoc in target_map.items():
+        # The assumption made here is that we just need to extract text information from just the target
+        # but we'll get the path to the image for both of them.
+        # Dangling captions get None for their target
+        target_img_path, target_unic, target_tess = lookup(target)
+        assoc_img_path, assoc_unic, assoc_tess = lookup(target_assoc)
+        df_dict['target_img_path'].append(target_img_path)
+        df_dict['assoc_img_path'].append(assoc_img_path)
+        df_dict['target_unicode'].append(target_unic)
+        df_dict['assoc_unicode'].append(assoc_unic)
+        df_dict['target_tesseract'].append(target_tess)
+        df_dict['assoc_tesseract'].append(assoc_tess)
+    for assoc in leftover_assocs:
+        region = page.find(assoc[0], assoc[1])
+        if region is None:
+            continue
+        assoc_img_path, assoc_unic, assoc_tess = page.info(region)
+        df_dict['target_img_path'].append(None)
+        df_dict['assoc_img_path'].append(assoc_img_path)
+        df_dict['target_unicode'].append(None)
+        df_dict['assoc_unicode'].append(assoc_unic)
+        df_dict['target_tesseract'].append(None)
+        df_dict['assoc_tesseract'].append(assoc_tess)
+    return df_dict
@@ -6,7 +6,7 @@ import re
 import os
 import glob
 import codecs
-from postprocess.postprocess import not_ocr
+from postprocess.postprocess import not_ocr, segment_divs, next_hocr
 from pascal_voc_writer import Writer
 from argparse import ArgumentParser
 
@@ -33,6 +33,25 @@ def iterate_and_update_writer(soup, writer):
     return writer
 
 
+def tree2xml(root, page_name, output_path):
+    """
+    Write the xml of a page from its lxml html tree, the counterpart of htmlfile2xml for an already parsed page
+    :param root: lxml html tree
+    :param page_name: page name, the html file name without extension
+    :param output_path: Path to output new xml
+    """
+    writer = Writer(f'{page_name}.png', 1920, 1920)
+    for seg_type in segment_divs(root):
+        seg_class = ' '.join(seg_type.get('class').split())
+        hocr = next_hocr(seg_type)
+        if hocr is None:
+            print(seg_type)
+            raise Exception('Invalid div found. Please account for said div')
+        coordinates = tuple(int(x) for x in hocr.get('data-coordinates').split(' '))
+        writer.addObject(seg_class, *coordinates, difficult=float(hocr.get('data-score')))
+    writer.save(f'{os.path.join(output_path, page_name)}.xml')
+
+
 def htmlfile2xml(html_f_path, output_path):
     """
     Take as input an html file, and output back an xml from that representation
@@ -5,22 +5,33 @@ From a zipped list of class and coordinates, create an html file
 import dominate
 from dominate.tags import *
 import os
-import pytesseract
 from PIL import Image, ImageFile
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 import re
 import string
 from lxml import html, etree
 from dominate.util import raw
-from latex_ocr.img2latex import img2latex_api, get_im2latex_model
 from config import IM2LATEX_WEIGHT
 from .pdf_extractor import parse_pdf
+from .ocr import ocr_page_regions
+from .page_tokens import PageTokenIndex, xml_safe
+from utils import registry
 
 BBOX_COORDINATES_PATTERN = re.compile("bbox\s(-?[0-9]+)\s(-?[0-9]+)\s(-?[0-9]+)\s(-?[0-9]+)")
 FILE_NAME_PATTERN = re.compile("(.*\.pdf)_([0-9]+)\.png")
 
-with open('words_alpha.txt') as word_file:
-    valid_words = set(word_file.read().split())
+def load_im2latex():
+    # TensorFlow is imported with the model, only by processes that run variable OCR
+    from latex_ocr.img2latex import get_im2latex_model
+    return get_im2latex_model(IM2LATEX_WEIGHT)
+
+def load_valid_words():
+    with open('words_alpha.txt') as word_file:
+        return set(word_file.read().split())
+
+registry.register('im2latex', load_im2latex)
+registry.register('valid_words', load_valid_words)
+
 stop_words = ['all', 'am', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'but', 'by', 'can', 'did', 'do', 'few', \
 'for', 'get', 'had', 'has', 'he', 'her', 'him', 'his', 'how', 'if', 'in', 'is', 'it', 'its', 'me', \
 'my', 'nor', 'of', 'on', 'or', 'our', 'out', 'own', 'set', 'she', 'so', 'the', 'to', 'too', 'use', 'up', \
@@ -43,13 +54,16 @@ def get_coordinate(title):
 def variable_ocr(im2latex_model, root, sub_img, strip_tags):
     """
     Get the latex representation for each variable candidate.
-    :param im2latex_model: Location of the im2latex model.
+    :param im2latex_model: im2latex model, None for the model of this process
     :param root: Root of the etree.
     :param sub_img: Image of the section.
     :param strip_tags: Tags to be Tags to be flatten.
     :return: New tree.
     """
+    from latex_ocr.img2latex import img2latex_batch_api
+    valid_words = registry.get('valid_words')
     #etree.strip_tags(root, *strip_tags)
+    candidates = []
     for word in root.xpath(".//*[@class='ocrx_word']"):
         if not word.text:
             continue
@@ -60,10 +74,19 @@ def variable_ocr(im2latex_model, root, sub_img, strip_tags):
             continue
 
         if not text in valid_words or len(text) <= 3:
-            coord = get_coordinate(word.get('title'))
-            sub_sub_img = sub_img.crop((coord['xmin'],coord['ymin'],coord['xmax'],coord['ymax']))
-            output = img2latex_api(im2latex_model, img=sub_sub_img, downsample_image_ratio=2, cropping=True, padding=True, gray_scale=True)
-            word.text = output
+            candidates.append(word)
+    if not candidates:
+        return root
+    if im2latex_model is None:
+        im2latex_model = registry.get('im2latex')
+    crops = []
+    for word in candidates:
+        coord = get_coordinate(word.get('title'))
+        crops.append(sub_img.crop((coord['xmin'],coord['ymin'],coord['xmax'],coord['ymax'])))
+    # All candidates of the section are transcribed in a few batched session runs
+    outputs = img2latex_batch_api(im2latex_model, crops, downsample_image_ratio=2, cropping=True, padding=True, gray_scale=True)
+    for word, output in zip(candidates, outputs):
+        word.text = output
     return root
 
 def coordinate_convert(x1,y1,x2,y2,max_of_x,max_of_y):
@@ -105,13 +128,9 @@ def invalid_filter(s):
     :param s: Input string.
     :return: String after filter.
     """
-    out = ''
-    for c in s:
-        if valid_xml_char_ordinal(c):
-            out += c
-    return out
+    return xml_safe(s)
 
-def unicode_representation(unicode_df, page, root, base, t):
+def unicode_representation(unicode_df, page, root, base, t, token_index=None):
     """
     Get the unicode representation for each section.
     :param unicode_df: Dataframe containing unicode for each token.
@@ -119,6 +138,7 @@ def unicode_representation(unicode_df, page, root, base, t):
     :param root: Root of the section tree.
     :param base: Base of the coordinate.
     :param t: Type of the section.
+    :param token_index: Optional PageTokenIndex of the page, built from unicode_df when not given
     :return: New tree containing the unicode representation. 
     """
     df = unicode_df[0]
@@ -128,7 +148,7 @@ def unicode_representation(unicode_df, page, root, base, t):
         return root, 'Have no Unicode', -1
     MAX_OF_X = limit[2]
     MAX_OF_Y = limit[3]
-    df_page = df[df['page'] == page-1]
+    index = token_index if token_index is not None else PageTokenIndex(df, page-1)
     first_id = -1
     first = True
     num_skip = 0 
@@ -136,49 +156,33 @@ def unicode_representation(unicode_df, page, root, base, t):
         coord = get_coordinate(word.get('title'))
         coordinate = coordinate_convert(coord['xmin']+base[0],coord['ymin']+base[1],coord['xmax']+base[0],coord['ymax']+base[1],MAX_OF_X,MAX_OF_Y)
         paddy = (coordinate[3]-coordinate[1])*0.3
-        #print('converted coord: '+str(coordinate[0])+' '+str(coordinate[1])+' '+str(coordinate[2])+' '+str(coordinate[3]))
-        index = ~( (df_page['x1'] >= coordinate[2]) | (df_page['x2'] <= coordinate[0]) | \
-                (df_page['y1'] >= coordinate[3]-paddy) | (df_page['y2'] <= coordinate[1]+paddy) )
-        df_within = df_page[index]
-        text = ''
+        text = []
         idx_prev = -1
-        for idx, row in df_within.iterrows():            
+        for pos in index.query(coordinate[0], coordinate[1]+paddy, coordinate[2], coordinate[3]-paddy):
+            idx = index.ids[pos]
             if first:
                 first_id = idx
                 first = False
-            if idx_prev == -1:
-                text += invalid_filter(row['text'])
-                text += ' '
+            # Only a run of consecutive tokens is kept
+            if idx_prev == -1 or idx == idx_prev+1:
+                text.append(index.safe_texts[pos])
                 idx_prev = idx
             else:
-                if idx == idx_prev+1:
-                    text += invalid_filter(row['text'])
-                    text += ' '
-                    idx_prev = idx
-                else:
-                    num_skip += 1
-
-            #print('coord within: '+str(row['x1'])+' '+str(row['y1'])+' '+str(row['x2'])+' '+str(row['y2']))
-        word.text = text
+                num_skip += 1
+        word.text = ''.join(token + ' ' for token in text)
 
     #print('Number of skip: '+str(num_skip))
 
     if t == 'Equation':
         coordinate = coordinate_convert(base[0],base[1],base[2],base[3],MAX_OF_X,MAX_OF_Y)
-        paddy = (coordinate[3]-coordinate[1])*0.0
-        index = ~( (df_page['x1'] >= coordinate[2]) | (df_page['x2'] <= coordinate[0]) | \
-                (df_page['y1'] >= coordinate[3]-paddy) | (df_page['y2'] <= coordinate[1]+paddy) )
-        df_within = df_page[index]
-        text = ''
-        for idx, row in df_within.iterrows():
-            text += row['text']
-            text += ' '
+        text = ''.join(index.texts[pos] + ' ' for pos in index.query(*coordinate))
     else:
         text = ' '
     return root,text,first_id
         
 
-def list2html(input_list, image_name, image_dir, output_dir, unicode_df=None,tesseract_hocr=True, tesseract_text=True, include_image=True, feather_x=2, feather_y=2):
+def list2html(input_list, image_name, image_dir, output_dir, unicode_df=None,tesseract_hocr=True, tesseract_text=True, include_image=True, feather_x=2, feather_y=2,
+              ocr_backend='auto', ocr_cache_dir=None):
     """
     Given an input list, write a corresponding html file. All extractions and postprocessing occur in this function.
     :param input_list: List output from xml2list
@@ -191,25 +195,28 @@ def list2html(input_list, image_name, image_dir, output_dir, unicode_df=None,tes
     :param include_image: flag to include cropped images for each hocr
     :param feather_x: x feathering parameter to increase accuracy of ocr
     :param feather_y: x feathering parameter to increase accuracy of ocr
+    :param ocr_backend: OCR backend, see converters.ocr.get_engine
+    :param ocr_cache_dir: optional directory to cache region OCR results in
     """
     doc = dominate.document(title=image_name[:-4])
     
     inter_path = os.path.join(output_dir, 'img', image_name[:-4])
-    im2latex_model = get_im2latex_model(IM2LATEX_WEIGHT)
     with doc:
         img = Image.open(os.path.join(image_dir, image_name))
+        width, height = img.size
+        # Feather the coords here a bit so we can get better OCR
+        region_coords = [[max(coords[0]-feather_x, 0), max(coords[1]-feather_y, 0),
+                          min(coords[2]+feather_x, width), min(coords[3]+feather_y, height)] for _, coords, _ in input_list]
+        # All regions of the page go to one OCR engine, which reuses its Tesseract handle and the cache
+        region_hocr = ocr_page_regions(img, region_coords, backend=ocr_backend, cache_dir=ocr_cache_dir)
+        # One spatial index over the page's pdfminer tokens serves every region
+        token_index = None
         for ind, inp in enumerate(input_list):
             t, coords, score = inp
-            width, height = img.size
-            # Feather the coords here a bit so we can get better OCR
-            ccoords = [max(coords[0]-feather_x, 0), max(coords[1]-feather_y, 0),
-                          min(coords[2]+feather_x, width), min(coords[3]+feather_y, height)]
+            ccoords = region_coords[ind]
             cropped = img.crop(ccoords)
             input_id = str(t) + str(ind)
-            hocr = pytesseract.image_to_pdf_or_hocr(cropped, extension='hocr').decode('utf-8')
-            # Going to run a quick regex to find the body tag
-            body = re.search(r'.*<body>(.*)</body>.*', hocr, re.DOTALL)
-            b_text = body.group(1)
+            b_text = region_hocr[ind]
             d = div(id=input_id, cls=str(t))
             with d:
                 if include_image:
@@ -233,7 +240,9 @@ def list2html(input_list, image_name, image_dir, output_dir, unicode_df=None,tes
                         match = FILE_NAME_PATTERN.search(image_name)
                         pdf_name = '/input/'+match.group(1)
                         page_num = int(match.group(2))
-                        unicode_tree,text,first_id = unicode_representation(unicode_df, page_num, tree, coords, t)
+                        if token_index is None and unicode_df[0] is not None:
+                            token_index = PageTokenIndex(unicode_df[0], page_num-1)
+                        unicode_tree,text,first_id = unicode_representation(unicode_df, page_num, tree, coords, t, token_index)
                         #occasionally the class here would be replaced by 'Page Header', cannot figure our why
                         div(raw(etree.tostring(unicode_tree).decode("utf-8")), cls='text_unicode', data_coordinates=f'{coords[0]} {coords[1]} {coords[2]} {coords[3]}', id=str(first_id))
                         div(text, cls='equation_unicode')  
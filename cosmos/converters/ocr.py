@@ -0,0 +1,165 @@
+"""
+OCR engine layer for region OCR.
+Every process keeps one engine. With tesserocr the engine is a persistent
+Tesseract API handle: the page image is set once and each region is read
+through SetRectangle, so language data is loaded once per process instead of
+once per region. Without tesserocr each region falls back to a pytesseract
+call on the crop. Results can be cached on disk, keyed by the hash of the
+page pixels and the region rectangle, so re-runs skip unchanged regions.
+hOCR coordinates are always relative to the region, as they are when a crop
+is OCRed.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+OCR_BACKENDS = ('auto', 'tesserocr', 'pytesseract')
+BBOX_PATTERN = re.compile(r"bbox (-?[0-9]+) (-?[0-9]+) (-?[0-9]+) (-?[0-9]+)")
+BODY_PATTERN = re.compile(r'.*<body>(.*)</body>.*', re.DOTALL)
+
+_engines = {}
+
+
+def translate_hocr(hocr, dx, dy):
+    """
+    Shift every bbox of an hOCR fragment by (-dx, -dy)
+    :param hocr: hOCR string
+    :param dx: x offset of the region
+    :param dy: y offset of the region
+    :return: hOCR string with region relative coordinates
+    """
+    def shift(match):
+        x1, y1, x2, y2 = [int(g) for g in match.groups()]
+        return f"bbox {x1 - dx} {y1 - dy} {x2 - dx} {y2 - dy}"
+    return BBOX_PATTERN.sub(shift, hocr)
+
+
+class TesserocrEngine:
+    """
+    Persistent Tesseract API handle
+    """
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng'):
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def ocr_regions(self, img, rects):
+        """
+        :param img: PIL page image
+        :param rects: list of (x1, y1, x2, y2) regions
+        :return: list of hOCR body strings, one per region
+        """
+        self.api.SetImage(img)
+        out = []
+        for x1, y1, x2, y2 in rects:
+            self.api.SetRectangle(x1, y1, x2 - x1, y2 - y1)
+            out.append(translate_hocr(self.api.GetHOCRText(0), x1, y1))
+        return out
+
+
+class PytesseractEngine:
+    """
+    One tesseract process per region
+    """
+    name = 'pytesseract'
+
+    def __init__(self, lang='eng'):
+        import pytesseract
+        self.pytesseract = pytesseract
+        self.lang = lang
+
+    def ocr_regions(self, img, rects):
+        out = []
+        for rect in rects:
+            hocr = self.pytesseract.image_to_pdf_or_hocr(img.crop(rect), lang=self.lang, extension='hocr').decode('utf-8')
+            body = BODY_PATTERN.search(hocr)
+            out.append(body.group(1) if body is not None else '')
+        return out
+
+
+def get_engine(backend='auto', lang='eng'):
+    """
+    The engine of this process, created on first use
+    :param backend: 'tesserocr', 'pytesseract' or 'auto' for tesserocr when it is installed
+    :param lang: tesseract language
+    :return: engine
+    """
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f'Unknown OCR backend {backend}, expected one of {OCR_BACKENDS}')
+    if backend == 'auto':
+        backend = 'tesserocr' if tesserocr is not None else 'pytesseract'
+    key = (backend, lang, os.getpid())
+    if key not in _engines:
+        _engines[key] = TesserocrEngine(lang) if backend == 'tesserocr' else PytesseractEngine(lang)
+    return _engines[key]
+
+
+def image_hash(img):
+    """
+    :param img: PIL image
+    :return: hex digest of the mode, size and pixels
+    """
+    digest = hashlib.sha1(f'{img.mode} {img.size}'.encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Directory of hOCR results, one file per page hash and region
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key, rect):
+        return os.path.join(self.cache_dir, key[:2], f"{key}_{'_'.join(str(int(c)) for c in rect)}.hocr")
+
+    def get(self, key, rect):
+        path = self._path(key, rect)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as rf:
+            return rf.read()
+
+    def put(self, key, rect, hocr):
+        path = self._path(key, rect)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent workers never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as wf:
+            wf.write(hocr)
+        os.replace(tmp_path, path)
+
+
+def ocr_page_regions(img, rects, backend='auto', lang='eng', cache_dir=None):
+    """
+    OCR all regions of a page
+    :param img: PIL page image
+    :param rects: list of (x1, y1, x2, y2) integer regions inside the page
+    :param backend: OCR backend, see get_engine
+    :param lang: tesseract language
+    :param cache_dir: optional directory to cache results in
+    :return: list of hOCR body strings with region relative coordinates, one per region
+    """
+    rects = [tuple(int(c) for c in rect) for rect in rects]
+    results = [None] * len(rects)
+    cache = OCRCache(cache_dir) if cache_dir is not None else None
+    if cache is not None:
+        engine_name = backend if backend != 'auto' else ('tesserocr' if tesserocr is not None else 'pytesseract')
+        key = f'{image_hash(img)}_{engine_name}_{lang}'
+        results = [cache.get(key, rect) for rect in rects]
+    missing = [idx for idx, hocr in enumerate(results) if hocr is None]
+    if missing:
+        engine = get_engine(backend, lang)
+        for idx, hocr in zip(missing, engine.ocr_regions(img, [rects[idx] for idx in missing])):
+            results[idx] = hocr
+            if cache is not None:
+                cache.put(key, rects[idx], hocr)
+    return results
@@ -0,0 +1,64 @@
+"""
+Spatial index over the pdfminer tokens of one page.
+Tokens are sorted by their top edge once per page. Every token is at most
+band_height tall, except for a few outliers that are kept aside, so the tokens
+that can overlap a query box have a top edge in (y1 - band_height, y2). That
+band is found with two binary searches and only its tokens and the outliers
+are tested on the remaining sides with numpy. XML-unsafe characters are
+removed from every token once when the index is built.
+"""
+import re
+import numpy as np
+
+# Tokens taller than this many median token heights are tested on every query
+# instead of widening the band of every query to their height
+TALL_FACTOR = 4
+
+# Complement of the characters valid_xml_char_ordinal accepts
+INVALID_XML_CHARS = re.compile(r'[^\u0009\u000A\u000D\u0020-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]')
+
+
+def xml_safe(s):
+    """
+    Remove the characters that are not valid in XML from a string
+    :param s: Input string.
+    :return: String after filter.
+    """
+    return INVALID_XML_CHARS.sub('', s)
+
+
+class PageTokenIndex:
+    """
+    Box queries over the tokens of one page of a parse_pdf frame
+    """
+    def __init__(self, df, page):
+        """
+        :param df: Dataframe from parse_pdf
+        :param page: zero based page number
+        """
+        on_page = np.flatnonzero(df['page'].values == page)
+        self.ids = df.index.values[on_page]
+        self.texts = df['text'].values[on_page]
+        self.safe_texts = [xml_safe(text) for text in self.texts]
+        self.boxes = np.stack([df[c].values[on_page].astype(np.float64) for c in ('x1', 'y1', 'x2', 'y2')], axis=1)
+        heights = self.boxes[:, 3] - self.boxes[:, 1]
+        tall = heights > TALL_FACTOR * np.median(heights) if len(heights) else np.zeros(0, dtype=bool)
+        self.tall = np.flatnonzero(tall)
+        self.order = np.flatnonzero(~tall)[np.argsort(self.boxes[~tall, 1], kind='stable')]
+        self.sorted_y1 = self.boxes[self.order, 1]
+        self.band_height = max(heights[~tall].max(), 0) if (~tall).any() else 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, x1, y1, x2, y2):
+        """
+        Tokens whose box overlaps the query box with positive area
+        :return: positions of the matching tokens, in frame order
+        """
+        start = np.searchsorted(self.sorted_y1, y1 - self.band_height, side='right')
+        end = np.searchsorted(self.sorted_y1, y2, side='left')
+        cand = np.concatenate([self.order[start:end], self.tall])
+        boxes = self.boxes[cand]
+        hit = (boxes[:, 0] < x2) & (boxes[:, 2] > x1) & (boxes[:, 1] < y2) & (boxes[:, 3] > y1)
+        return np.sort(cand[hit])
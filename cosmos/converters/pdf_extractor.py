@@ -7,7 +7,9 @@ from pdfminer.pdfpage import PDFPage
 from pdfminer.layout import LAParams
 from pdfminer.converter import PDFPageAggregator
 
+import os
 import pandas as pd
+from converters.token_store import token_path, save_tokens
 
 def update_pos(pos1,pos2):
     """
@@ -70,3 +72,17 @@ def parse_pdf(fp):
         "page": pages
                        })
     return df, layout.bbox
+
+
+def extract_tokens(fp, token_dir):
+    """
+    Parse the pdf and persist its tokens, unless the tokens of this version of the pdf are already stored.
+    :param fp: Input file.
+    :param token_dir: token cache directory
+    :return: path of the token file
+    """
+    path = token_path(token_dir, fp)
+    if not os.path.exists(path):
+        df, limit = parse_pdf(fp)
+        save_tokens(df, limit, path)
+    return path
@@ -0,0 +1,72 @@
+"""
+On disk store of the pdfminer tokens of a PDF.
+The frame returned by parse_pdf is written to one npz file with separate
+arrays for every page, so a worker converting one page reads only that
+page. Token ids (the frame index), boxes and utf-8 encoded texts are kept
+exactly. File names carry the size and modification time of the PDF, so
+re-runs reuse the tokens of unchanged PDFs.
+"""
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+BOX_COLUMNS = ['x1', 'y1', 'x2', 'y2']
+
+
+def token_path(token_dir, pdf_path):
+    """
+    :param token_dir: token cache directory
+    :param pdf_path: path to the PDF
+    :return: path of the token file for the current version of the PDF
+    """
+    stat = os.stat(pdf_path)
+    return os.path.join(token_dir, f'{os.path.basename(pdf_path)}.{stat.st_size}.{stat.st_mtime_ns}.npz')
+
+
+def save_tokens(df, limit, path):
+    """
+    :param df: Dataframe from parse_pdf, or None when the PDF has no text
+    :param limit: coordinate range from parse_pdf
+    :param path: output npz path
+    """
+    arrays = {'empty': np.array(df is None)}
+    if df is not None:
+        arrays['limit'] = np.asarray(limit, dtype=np.float64)
+        pages = df['page'].values
+        for page in sorted({p for p in pages if isinstance(p, (int, np.integer))}):
+            rows = np.flatnonzero(pages == page)
+            encoded = [text.encode('utf-8', 'surrogatepass') for text in df['text'].values[rows]]
+            arrays[f'p{page}_ids'] = df.index.values[rows].astype(np.int64)
+            arrays[f'p{page}_boxes'] = df[BOX_COLUMNS].values[rows].astype(np.float64)
+            arrays[f'p{page}_offsets'] = np.cumsum([0] + [len(text) for text in encoded]).astype(np.int64)
+            arrays[f'p{page}_chars'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Write then rename so a reader never sees a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.npz')
+    with os.fdopen(fd, 'wb') as fh:
+        np.savez(fh, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_page_tokens(path, page):
+    """
+    Load the tokens of one page
+    :param path: npz path written by save_tokens
+    :param page: zero based page number
+    :return: (frame of the page's tokens with their original index, coordinate range), (None, None) for PDFs without text
+    """
+    with np.load(path) as data:
+        if bool(data['empty']):
+            return None, None
+        limit = tuple(data['limit'].tolist())
+        if f'p{page}_ids' not in data.files:
+            return pd.DataFrame({'text': [], 'x1': [], 'y1': [], 'x2': [], 'y2': [], 'page': []}), limit
+        ids = data[f'p{page}_ids']
+        boxes = data[f'p{page}_boxes']
+        offsets = data[f'p{page}_offsets']
+        chars = data[f'p{page}_chars'].tobytes()
+    texts = [chars[start:stop].decode('utf-8', 'surrogatepass') for start, stop in zip(offsets[:-1], offsets[1:])]
+    df = pd.DataFrame({'text': texts, 'x1': boxes[:, 0], 'y1': boxes[:, 1], 'x2': boxes[:, 2], 'y2': boxes[:, 3],
+                       'page': np.full(len(ids), page, dtype=np.int64)}, index=ids)
+    return df, limit
@@ -1,6 +1,7 @@
 import click
 from evaluate.evaluate_iccv import evaluate_dir
 from evaluate.evaluate_libs import run_voc, run_coco
+from evaluate.engine import load_pages
 import os
 import yaml
 with open("classes.yaml") as stream:
@@ -10,9 +11,12 @@ with open("classes.yaml") as stream:
 @click.argument("preds_dir")
 @click.argument("annotations_dir")
 @click.argument("out_d")
-def run_eval(preds_dir, annotations_dir, out_d):
-    iccv,confusion = evaluate_dir(preds_dir, annotations_dir, classes)
-    voc = run_voc(preds_dir, annotations_dir,classes)
+@click.option("--processes", default=1, help="Number of processes parsing the xmls")
+def run_eval(preds_dir, annotations_dir, out_d, processes):
+    # Every xml is parsed once and shared by the metrics
+    pages = load_pages(preds_dir, annotations_dir, processes)
+    iccv,confusion = evaluate_dir(preds_dir, annotations_dir, classes, pages=pages)
+    voc = run_voc(preds_dir, annotations_dir,classes, pages=pages)
     os.mkdir(out_d)
     iccv.to_csv(os.path.join(out_d, "iccv.csv"))
     voc.to_csv(os.path.join(out_d,"voc.csv"))
@@ -0,0 +1,194 @@
+"""
+Shared evaluation core.
+Every page is parsed once into label and box arrays, optionally across a
+worker pool, and the parsed pages are handed to every metric. IoUs of a page
+are computed as one predictions x ground truth matrix and matching and the
+per class TP/FP/FN counts are array operations on it.
+"""
+import multiprocessing as mp
+from collections import namedtuple
+from os import listdir
+from os.path import splitext, join
+import numpy as np
+from converters.xml2list import xml2list
+
+PageBoxes = namedtuple('PageBoxes', ['items', 'labels', 'boxes', 'scores'])
+Page = namedtuple('Page', ['identifier', 'pred', 'gt'])
+PageMatch = namedtuple('PageMatch', ['gt_id', 'max_overlap', 'matched'])
+
+
+def page_boxes(items):
+    """
+    :param items: [(type, (x1, y1, x2, y2), score)] as returned by xml2list
+    :return: PageBoxes with the items and their labels, Nx4 boxes and scores as arrays
+    """
+    return PageBoxes(items,
+                     np.array([item[0] for item in items], dtype=object),
+                     np.array([item[1] for item in items]).reshape(-1, 4),
+                     np.array([float(item[2]) for item in items], dtype=np.float64))
+
+
+def load_page(pred_dir, gt_dir, identifier):
+    """
+    :return: Page with the parsed prediction and ground truth xml of identifier
+    """
+    pred = page_boxes(xml2list(join(pred_dir, f"{identifier}.xml")))
+    gt = page_boxes(xml2list(join(gt_dir, f"{identifier}.xml")))
+    return Page(identifier, pred, gt)
+
+
+def _load_task(task):
+    return load_page(*task)
+
+
+def load_pages(pred_dir, gt_dir, processes=1):
+    """
+    Parse every prediction xml of a directory with its ground truth xml
+    :param pred_dir: directory of prediction xmls
+    :param gt_dir: directory of ground truth xmls with the same names
+    :param processes: number of worker processes
+    :return: list of Page in os.listdir order of pred_dir
+    """
+    tasks = [(pred_dir, gt_dir, splitext(f)[0]) for f in listdir(pred_dir)]
+    if processes == 1:
+        return [_load_task(task) for task in tasks]
+    with mp.Pool(processes=processes) as pool:
+        return pool.map(_load_task, tasks, chunksize=max(1, len(tasks) // (4 * processes)))
+
+
+def _as_boxes(boxes):
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def _intersection(a, b):
+    w = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    h = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    inter = w * h
+    inter[(w < 0) | (h < 0)] = 0
+    return inter
+
+
+def box_areas(boxes):
+    """
+    :param boxes: Nx4 (x1, y1, x2, y2)
+    :return: N areas
+    """
+    b = _as_boxes(boxes)
+    return (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+
+def intersection_matrix(boxes1, boxes2):
+    """
+    :param boxes1: Nx4 (x1, y1, x2, y2)
+    :param boxes2: Mx4 (x1, y1, x2, y2)
+    :return: NxM intersection areas, 0 for boxes that do not intersect
+    """
+    return _intersection(_as_boxes(boxes1)[:, None], _as_boxes(boxes2)[None, :])
+
+
+def pair_intersections(boxes1, boxes2):
+    """
+    :param boxes1: Nx4 (x1, y1, x2, y2)
+    :param boxes2: Nx4 (x1, y1, x2, y2)
+    :return: N intersection areas of boxes1[i] and boxes2[i]
+    """
+    return _intersection(_as_boxes(boxes1), _as_boxes(boxes2))
+
+
+def iou_matrix(boxes1, boxes2, contains=False):
+    """
+    calculate_iou of every pair of boxes
+    :param boxes1: Nx4 (x1, y1, x2, y2)
+    :param boxes2: Mx4 (x1, y1, x2, y2)
+    :param contains: IoU is 1.0 where the box of boxes2 contains the box of boxes1
+    :return: NxM IoUs
+    """
+    a = _as_boxes(boxes1)
+    b = _as_boxes(boxes2)
+    inter = intersection_matrix(a, b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = inter / (box_areas(a)[:, None] + box_areas(b)[None, :] - inter)
+    if contains:
+        inside = ((b[None, :, 0] <= a[:, None, 0]) & (b[None, :, 1] <= a[:, None, 1]) &
+                  (b[None, :, 2] >= a[:, None, 2]) & (b[None, :, 3] >= a[:, None, 3]))
+        iou[inside] = 1.0
+    return iou
+
+
+def best_matches(ious):
+    """
+    :param ious: NxM IoU matrix
+    :return: (index of the first ground truth with the highest IoU, that IoU) of every prediction, -1 and 0 without ground truth
+    """
+    if ious.shape[1] == 0:
+        return np.full(ious.shape[0], -1, dtype=np.int64), np.zeros(ious.shape[0])
+    best = np.argmax(ious, axis=1)
+    return best, ious[np.arange(ious.shape[0]), best]
+
+
+def match_page(pred_boxes, gt_boxes, thres=0.5):
+    """
+    Match every prediction to the ground truth box it overlaps most
+    :param pred_boxes: Nx4 predicted boxes
+    :param gt_boxes: Mx4 ground truth boxes
+    :param thres: minimum IoU of a match
+    :return: PageMatch with the gt_id (-1 below thres), the max overlap and the matched mask of every prediction
+    """
+    gt_id, max_overlap = best_matches(iou_matrix(pred_boxes, gt_boxes))
+    gt_id = gt_id.copy()
+    gt_id[max_overlap < thres] = -1
+    return PageMatch(gt_id, max_overlap, (max_overlap >= thres) & (gt_id >= 0))
+
+
+def class_indices(labels, classes):
+    """
+    :param labels: array of labels
+    :param classes: list of classes
+    :return: index of every label in classes
+    """
+    lookup = {cls: i for i, cls in enumerate(classes)}
+    return np.array([lookup[label] for label in labels], dtype=np.int64)
+
+
+def page_counts(page, classes, thres=0.5, multiple_proposals=False, e2e=True):
+    """
+    Per class true positives, false positives and false negatives of one page
+    :param page: Page
+    :param classes: list of classes
+    :param thres: minimum IoU of a match
+    :param multiple_proposals: count every proposal on a ground truth box as a true positive
+    :param e2e: count unmatched ground truth boxes as false negatives
+    :return: (tp, fp, fn) float arrays over classes, confusion matrix of matched boxes (ground truth x prediction)
+    """
+    n = len(classes)
+    m = match_page(page.pred.boxes, page.gt.boxes, thres)
+    gt_ids = m.gt_id[m.matched]
+    pred_cls = class_indices(page.pred.labels[m.matched], classes)
+    gt_cls = class_indices(page.gt.labels[gt_ids], classes)
+    confusion = np.zeros((n, n))
+    np.add.at(confusion, (gt_cls, pred_cls), 1)
+
+    correct = pred_cls == gt_cls
+    # Ground truth boxes with at least one correctly labeled match, one true positive each
+    unique_tp = np.zeros(n)
+    if correct.any():
+        uniq = np.unique(np.stack([pred_cls[correct], gt_ids[correct]], axis=1), axis=0)
+        unique_tp = np.bincount(uniq[:, 0], minlength=n).astype(np.float64)
+    all_tp = np.bincount(pred_cls[correct], minlength=n).astype(np.float64)
+    tp = all_tp if multiple_proposals else unique_tp
+    fp = np.bincount(pred_cls[~correct], minlength=n) + (all_tp - unique_tp)
+    fn = np.bincount(gt_cls[~correct], minlength=n).astype(np.float64)
+    if e2e:
+        unmatched = np.ones(len(page.gt.labels), dtype=bool)
+        unmatched[m.gt_id[m.gt_id >= 0]] = False
+        known = np.isin(page.gt.labels[unmatched], classes)
+        fn += np.bincount(class_indices(page.gt.labels[unmatched][known], classes), minlength=n)
+    return tp, fp.astype(np.float64), fn, confusion
+
+
+def ratio(num, other):
+    """
+    :return: num / (num + other) elementwise, nan where both are 0
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((num == 0) & (other == 0), np.nan, num / (num + other))
@@ -1,6 +1,7 @@
 
 import os
 from converters.xml2list import xml2list
+from evaluate.engine import load_pages, iou_matrix, pair_intersections, best_matches, box_areas
 from PIL import Image, ImageDraw
 import numpy as np
 from tqdm import tqdm
@@ -73,24 +74,18 @@ def calculate_iou(box1, box2, contains=False):
 
 def match_lists(predict_list, target_list):
     list_map = {}
-    for prediction in predict_list:
+    ious = iou_matrix([p[1] for p in predict_list], [t[1] for t in target_list])
+    matches, max_ious = best_matches(ious)
+    for prediction, ind, max_iou in zip(predict_list, matches, max_ious):
         p_cls, p_bb, p_score= prediction
         p_score = 0.1
         # make a tuple because i need to hash predicitons
         p_bb = tuple(p_bb)
-        # Calculate which output annotation has the highest IOU
-        ious = [calculate_iou(p_bb, target[1]) for target in target_list]
-        if len(ious) == 0:
+        # The first output annotation with the highest IOU
+        if ind < 0 or max_iou < 0.1:
             list_map[(p_cls, p_bb, p_score)] = None
         else:
-            max_iou = max(ious)
-            if max_iou < 0.1:
-                list_map[(p_cls, p_bb, p_score)] = None
-                continue
-            for ind, iou in enumerate(ious):
-                if iou == max_iou:
-                    list_map[(p_cls, p_bb, p_score)] = (target_list[ind], iou)
-                    break
+            list_map[(p_cls, p_bb, p_score)] = (target_list[ind], float(max_iou))
     return list_map
 
 
@@ -101,17 +96,18 @@ color_classes =  {"Section Header":"#800000", "Body Text":"#e6194B",
                   "Table Note":"#f032e6", "Abstract":"#a9a9a9", "Other":"#469990", 
                   "Equation label":"#aaffc3", "Reference text":"#9A6324", "Figure Note":"#ffd8b1"}
 
-def run_evaluate(predict_dir, target_dir, output_dir, img_dir=None, simi=False, thres=0):
+def run_evaluate(predict_dir, target_dir, output_dir, img_dir=None, simi=False, thres=0, processes=1, pages=None):
+    if pages is None:
+        pages = load_pages(predict_dir, target_dir, processes)
     fp_list = []
     classification_p_list = []
     total_intersection = 0
     total_prediction = 0
     total_gt = 0
-    for predict_f in os.listdir(predict_dir):
-        predict_path = os.path.join(predict_dir, predict_f)
-        target_path = os.path.join(target_dir, predict_f)
-        predict_list = xml2list(predict_path)
-        target_list = xml2list(target_path)
+    for page in pages:
+        predict_f = f'{page.identifier}.xml'
+        predict_list = page.pred.items
+        target_list = page.gt.items
         if img_dir is not None:
             img_p = os.path.join(img_dir, predict_f[:-4] + '.png')
             img = Image.open(img_p)
@@ -122,24 +118,15 @@ def run_evaluate(predict_dir, target_dir, output_dir, img_dir=None, simi=False,
                 d.rectangle(p_bb, outline=color_classes[p_cls])
                 img.save(os.path.join(output_dir, f'{predict_f[:-4] + ".png"}'))
 
-        list_map = match_lists(predict_list, target_list)
-        tbb_map = {}
-        for predict in predict_list:
+        matches, max_ious = best_matches(iou_matrix(page.pred.boxes, page.gt.boxes))
+        matched = (matches >= 0) & (max_ious >= 0.1)
+        for predict, ind, iou, is_matched in zip(predict_list, matches, max_ious, matched):
             p_cls, p_bb, p_score = predict
-            p_score = 0.1
-            p_bb = tuple(p_bb)
-            matched_target = list_map[(p_cls, p_bb, p_score)]
-            if matched_target is None:
+            if not is_matched:
                 fp_list.append((predict, 'background'))
                 continue
-            t, iou = matched_target
-            t_cls, t_bb, t_score = t
-            t_bb = tuple(t_bb)
+            t_cls, t_bb, t_score = target_list[ind]
             #t_cls = ICDAR_convert[t_cls]
-            if t_bb in tbb_map:
-                tbb_map[t_bb].append(p_bb)
-            else:
-                tbb_map[t_bb] = [p_bb]
             if p_cls == t_cls:
                 if iou < thres:
                     fp_list.append((predict, 'localization'))
@@ -162,22 +149,12 @@ def run_evaluate(predict_dir, target_dir, output_dir, img_dir=None, simi=False,
                         fp_list.append((predict, 'similar'))
                 else:
                     fp_list.append((predict, 'other'))
-        page_intersection = 0
-        page_prediction = 0
-        page_gt = 0
-        for t_bb in tbb_map:
-            for prediction in tbb_map[t_bb]:
-                x_left = max(t_bb[0], prediction[0])
-                y_top = max(t_bb[1], prediction[1])
-                x_right = min(t_bb[2], prediction[2])
-                y_bottom = min(t_bb[3], prediction[3])
-                intersection_area = (x_right - x_left) * (y_bottom - y_top)
-                page_intersection += intersection_area
-                page_prediction += (prediction[2] - prediction[0]) * (prediction[3] - prediction[1])
-            page_gt += (t_bb[2] - t_bb[0]) * (t_bb[3] - t_bb[1])
-        total_intersection += page_intersection
-        total_prediction += page_prediction
-        total_gt += page_gt
+        # Every matched prediction counts, a ground truth box counts once however many predictions it matched
+        matched_p = page.pred.boxes[matched]
+        matched_t = page.gt.boxes[matches[matched]]
+        total_intersection += int(pair_intersections(matched_p, matched_t).sum())
+        total_prediction += int(box_areas(matched_p).sum())
+        total_gt += int(box_areas(np.unique(matched_t, axis=0)).sum())
 
     print('Bounding box Precision')
     bb_precision = total_intersection / total_prediction
@@ -391,8 +368,9 @@ def make_pie_charts(stats_map, output_dir):
 @click.argument('annotations_dir')
 @click.argument('img_dir')
 @click.argument('output_dir')
-def convert(xml_dir, annotations_dir, img_dir, output_dir):
-    fp_list = run_evaluate(xml_dir, annotations_dir, output_dir, img_dir=img_dir)
+@click.option('--processes', default=1, help='Number of processes parsing the xmls')
+def convert(xml_dir, annotations_dir, img_dir, output_dir, processes):
+    fp_list = run_evaluate(xml_dir, annotations_dir, output_dir, img_dir=img_dir, processes=processes)
     smap = calculate_statistics_map(fp_list)
     make_pie_charts(smap, output_dir)
 
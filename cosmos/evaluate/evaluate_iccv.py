@@ -3,33 +3,19 @@ from tqdm import  tqdm
 import click
 import numpy as np
 from os import listdir
-from os.path import splitext, join
+from os.path import splitext, join, basename
+from converters.xml2list import xml2list
 from .ingestion import ingest_file
 from .evaluate_config import EvaluationConfig as args
+from .engine import Page, page_boxes, load_pages, iou_matrix, best_matches, page_counts, ratio
 
 class EmptyGroundTruthError(Exception):
     pass
 
 def get_ious(pred_df, box):
-    X = 0
-    Y = 1
-    X2 = 2
-    Y2 = 3
     xml_box = pred_df[["x0", "y0", "x1", "y1"]].values
-    N, _ = xml_box.shape
-    i_boxes = np.zeros((N,4))
-    i_boxes[:, X] = np.maximum(xml_box[:, X].reshape(-1), box[X].reshape(-1))
-    i_boxes[:, Y] = np.maximum(xml_box[:, Y].reshape(-1), box[ Y].reshape(-1))
-    i_boxes[:, X2] = np.minimum(xml_box[:, X2].reshape(-1), box[X2].reshape(-1))
-    i_boxes[:, Y2] = np.minimum(xml_box[:, Y2].reshape(-1), box[Y2].reshape(-1))
-    i_area = (i_boxes[:, X2] - i_boxes[:, X]) * (i_boxes[:, Y2] - i_boxes[:, Y])
-    i_area[i_boxes[:, X2] < i_boxes[:, X]] = 0
-    i_area[i_boxes[:, Y2] < i_boxes[:, Y]] = 0
-    xml_area = (xml_box[:, X2] - xml_box[:, X]) * (xml_box[:, Y2] - xml_box[:, Y])
-    box_area = (box[X2] - box[X]) * (box[Y2] - box[Y])
-    iou = i_area/(xml_area+ box_area - i_area)
     iou_df = pd.DataFrame({
-        "iou": iou
+        "iou": iou_matrix(xml_box, np.asarray(box).reshape(1, 4))[:, 0]
         })
     return iou_df
 
@@ -51,22 +37,17 @@ def match(pred_df, gt_df, thres=0.5):
         combined_df = pd.DataFrame(columns=[])
         unmatced = gt_df
         return combined_df, gt_df
-    for idx, row in enumerate(gt_df.itertuples()):
-        box = np.array([row.x0, row.y0, row.x1, row.y1])
-        pred_df[f"iou_{idx}"] = get_ious(pred_df, box)
-    overlaps = pred_df.filter(regex=("iou_*")).values
-    matches = np.argmax(overlaps, axis=1)
-    max_overlaps = np.array([pred_df.at[idx, f"iou_{best}"] for idx, best in enumerate(matches)])
-    match_labels = [gt_df.at[match, "label"] for match in matches]
+    overlaps = iou_matrix(pred_df[["x0", "y0", "x1", "y1"]].values, gt_df[["x0", "y0", "x1", "y1"]].values)
+    matches, max_overlaps = best_matches(overlaps)
+    match_labels = gt_df["label"].values[matches]
     mask =  max_overlaps < thres
-    matches[mask] = -1.0
+    matches[mask] = -1
     pred_df["gt_id"] = matches
     pred_df["gt_label"] = match_labels
     pred_df["max_overlap"] = max_overlaps
     combined_df = pred_df.rename(index=str, columns={"label": "pred_label"})
     combined_df = combined_df[combined_df["max_overlap"]>= thres]
-    unmatched_idxs = list(filter(lambda x: x not in matches, range(gt_df.shape[0])))
-    unmatched = gt_df.loc[unmatched_idxs]
+    unmatched = gt_df[~np.isin(np.arange(gt_df.shape[0]), matches)]
     return combined_df, unmatched
 
 def get_tp(combined_df, cls):
@@ -130,57 +111,60 @@ def get_recall(combined_df, unmatched, cls):
 def get_gt_instances(gt_df, cls):
     return gt_df[gt_df["label"] == cls].shape[0]
 
-def evaluate_single(pred_path, gt_path, classes=None, thres=0.5):
-    pred_df = ingest_file(pred_path)
-    gt_df = ingest_file(gt_path)
-    if gt_df.shape[0] ==0:
-        raise EmptyGroundTruthError()
-    combined , unmatched = match(pred_df, gt_df,thres=0.5)
-    prec_cls = {}
-    rec_cls = {}
-    for cls in classes:
-        prec = get_precision(combined, cls)
-        rec = get_recall(combined, unmatched, cls)
-        prec_cls[cls] = prec
-        rec_cls[cls] = rec
-    confusion_df = get_confusion(combined, classes)
-    prec_df = pd.Series(prec_cls,name="precisions")
+def evaluate_page(page, classes, thres=0.5):
+    """
+    :param page: engine.Page with a non empty ground truth
+    :param classes: list of classes
+    :param thres: minimum IoU of a match
+    :return: precision and recall series over classes and their mean, confusion dataframe
+    """
+    tp, fp, fn, confusion = page_counts(page, classes, thres, args.multiple_proposals, args.e2e)
+    confusion_df = pd.DataFrame(confusion, index=pd.Index(classes, name="ground_truth"), columns=classes)
+    prec_df = pd.Series(ratio(tp, fp), index=classes, name="precisions")
     prec_df["total"] = prec_df.mean(skipna=True)
-    rec_df = pd.Series(rec_cls, name="recalls")
+    rec_df = pd.Series(ratio(tp, fn), index=classes, name="recalls")
     rec_df["total"] = rec_df.mean(skipna=True)
     return prec_df, rec_df, confusion_df
 
 
+def evaluate_single(pred_path, gt_path, classes=None, thres=0.5):
+    page = Page(splitext(basename(pred_path))[0], page_boxes(xml2list(pred_path)), page_boxes(xml2list(gt_path)))
+    if len(page.gt.items) == 0:
+        raise EmptyGroundTruthError()
+    return evaluate_page(page, classes, thres)
+
 
 def aggregate(result_dfs):
     result = pd.concat(result_dfs, axis=1).mean(axis=1,skipna=True)
     return result
 
 
-def evaluate_dir(pred_dir, gt_dir, classes=None):
+def evaluate_dir(pred_dir, gt_dir, classes=None, processes=1, pages=None):
+    """
+    :param pred_dir: directory of prediction xmls
+    :param gt_dir: directory of ground truth xmls
+    :param classes: list of classes
+    :param processes: number of processes parsing the xmls
+    :param pages: pages already parsed with engine.load_pages, pred_dir and gt_dir are not read again
+    :return: precision, recall and f1 dataframe, confusion dataframe
+    """
+    if pages is None:
+        pages = load_pages(pred_dir, gt_dir, processes)
     class_counts = dict(zip(classes , [0] *len(classes)))
-    files = listdir(pred_dir)
-    identifiers = [splitext(fp)[0] for fp in files]
     results_prec = []
     results_rec = []
-    confusion_df = None
-    for identifier in tqdm(identifiers):
-        pred_path = join(pred_dir, f"{identifier}.xml")
-        gt_path = join(gt_dir, f"{identifier}.xml")
-        gt_df = ingest_file(gt_path)
+    confusion = None
+    for page in tqdm(pages):
         for cls in classes:
-            sub_df = gt_df[gt_df["label"] == cls]
-            class_counts[cls] += sub_df.shape[0]
-        try:
-            precs, recs, confusions = evaluate_single(pred_path, gt_path, classes)
-        except EmptyGroundTruthError:
+            class_counts[cls] += int(np.sum(page.gt.labels == cls))
+        if len(page.gt.items) == 0:
             continue
+        precs, recs, confusions = evaluate_page(page, classes)
         results_prec.append(precs)
         results_rec.append(recs)
-        if confusion_df is None:
-            confusion_df = confusions
-        else:
-            confusion_df = pd.concat((confusion_df, confusions)).groupby("ground_truth").sum()
+        confusion = confusions if confusion is None else confusion + confusions
+    # Summing more than one page orders the classes like a groupby on ground_truth
+    confusion_df = confusion if len(results_prec) < 2 else confusion.groupby("ground_truth").sum()
     final_df_prec = aggregate(results_prec)
     final_df_rec = aggregate(results_rec)
     df = pd.concat((final_df_prec, final_df_rec),axis=1)
@@ -195,7 +179,8 @@ def evaluate_dir(pred_dir, gt_dir, classes=None):
 @click.argument('pred_dir')
 @click.argument('xml_dir')
 @click.argument('output_dir')
-def run_evaluate(pred_dir, xml_dir, output_dir):
+@click.option('--processes', default=1, help='Number of processes parsing the xmls')
+def run_evaluate(pred_dir, xml_dir, output_dir, processes):
     classes = [ 'Figure Caption',
                 'Figure',
                 'Table Caption',
@@ -208,7 +193,7 @@ def run_evaluate(pred_dir, xml_dir, output_dir):
                 'Reference text',
                 'Other'
               ]
-    df = evaluate_dir(pred_dir, xml_dir, classes=classes)
+    df, confusion_df = evaluate_dir(pred_dir, xml_dir, classes=classes, processes=processes)
     df.to_csv(join(output_dir, 'results.csv'))
 
 
@@ -4,6 +4,7 @@ COCO mAP on this platform
 Author: Josh McGrath
 """
 from .ingestion import ingest_file
+from .engine import load_pages, class_indices
 import os
 from chainercv.evaluations import eval_detection_voc, eval_detection_coco
 import numpy as np
@@ -32,7 +33,7 @@ def format_result(eval_result, classes):
     aps = list(eval_result["ap"])
     map = eval_result["map"]
     aps.append(map)
-    classes.append("mAP")
+    classes = classes + ["mAP"]
     print(aps)
     print(classes)
     print(len(aps))
@@ -44,35 +45,38 @@ def format_result(eval_result, classes):
     print(results_df)
     return results_df
 
-def run_eval(pred_dir, gt_dir, eval_func, classes):
-    identifiers = get_identifiers(pred_dir)
+def run_eval(pred_dir, gt_dir, eval_func, classes, processes=1, pages=None):
+    """
+    :param pred_dir: directory of prediction xmls
+    :param gt_dir: directory of ground truth xmls
+    :param eval_func: chainercv evaluation function
+    :param classes: list of classes
+    :param processes: number of processes parsing the xmls
+    :param pages: pages already parsed with engine.load_pages, pred_dir and gt_dir are not read again
+    :return: AP dataframe
+    """
+    if pages is None:
+        pages = load_pages(pred_dir, gt_dir, processes)
     pred_labels = []
     pred_bboxes = []
     gt_labels = []
     gt_bboxes = []
     scores = []
-    for identifier in tqdm(identifiers):
-        pred_df, gt_df = ingest(pred_dir, gt_dir, identifier)
-        pred_bbox = pred_df[["x0", "y0", "x1", "y1"]].values
-        npred = pred_df.shape[0]
-        pred_label = map_to_integers(pred_df["label"], classes).values
-        score = pred_df['score'].values
-        gt_bbox  = gt_df[["x0", "y0", "x1", "y1"]].values
-        gt_label = map_to_integers(gt_df["label"], classes).values
-        pred_labels.append(pred_label)
-        pred_bboxes.append(pred_bbox)
-        gt_labels.append(gt_label)
-        gt_bboxes.append(gt_bbox)
-        scores.append(score)
+    for page in tqdm(pages):
+        pred_labels.append(class_indices(page.pred.labels, classes))
+        pred_bboxes.append(page.pred.boxes)
+        gt_labels.append(class_indices(page.gt.labels, classes))
+        gt_bboxes.append(page.gt.boxes)
+        scores.append(page.pred.scores)
     eval_result = eval_func(pred_bboxes, pred_labels, scores, gt_bboxes, gt_labels)
     return format_result(eval_result, classes) 
 
 
-def run_voc(pred_dir, gt_dir, classes):
-    return run_eval(pred_dir, gt_dir,eval_detection_voc, classes) 
+def run_voc(pred_dir, gt_dir, classes, processes=1, pages=None):
+    return run_eval(pred_dir, gt_dir,eval_detection_voc, classes, processes, pages) 
 
-def run_coco(pred_dir, gt_dir, classes):
-    return run_eval(pred_dir, gt_dir, eval_detection_coco, classes)
+def run_coco(pred_dir, gt_dir, classes, processes=1, pages=None):
+    return run_eval(pred_dir, gt_dir, eval_detection_coco, classes, processes, pages)
 
 
 @click.command()
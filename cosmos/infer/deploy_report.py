@@ -0,0 +1,118 @@
+"""
+Accuracy versus throughput of the batch norm inference modes.
+Every mode writes its XMLs to out_dir/<mode>, which are scored against the
+annotations and compared to the predictions of the batch statistics mode.
+precision is TP / (TP + FP) at IoU 0.5 with one true positive per ground
+truth box, see evaluate.engine.page_counts. correct_rate is the fraction of
+predictions evaluate.run_evaluate marks correct, any other prediction
+(background, localization, similar or other class) counts against it.
+"""
+import csv
+import os
+import click
+import torch
+from converters.xml2list import xml2list
+from evaluate.evaluate import run_evaluate
+from evaluate.engine import load_pages, page_counts
+from torch_model.model.utils.config_manager import ConfigManager
+from torch_model.inference.inference import InferenceHelper
+from torch_model.inference.deploy import BN_MODES
+from infer.infer import get_loader, load_model
+
+REPORT_FIELDS = ['bn_mode', 'proposals_per_s', 'speedup', 'npredictions', 'precision', 'correct_rate', 'agreement']
+
+
+def label_agreement(xml_dir, reference_dir):
+    """
+    :return: fraction of predicted boxes labeled the same as in reference_dir
+    """
+    agree, total = 0, 0
+    for xml_f in os.listdir(reference_dir):
+        reference = {tuple(bb): cls for cls, bb, _ in xml2list(os.path.join(reference_dir, xml_f))}
+        path = os.path.join(xml_dir, xml_f)
+        predictions = xml2list(path) if os.path.exists(path) else []
+        total += len(reference)
+        agree += sum(1 for cls, bb, _ in predictions if reference.get(tuple(bb)) == cls)
+    return agree / total if total > 0 else 1.0
+
+
+def detection_precision(xml_dir, annotations_dir, thres=0.5):
+    """
+    :return: TP / (TP + FP) over all classes, one true positive per ground truth box, 0 without predictions
+    """
+    pages = load_pages(xml_dir, annotations_dir)
+    classes = sorted({label for page in pages for label in list(page.pred.labels) + list(page.gt.labels)})
+    tp, fp = 0.0, 0.0
+    for page in pages:
+        page_tp, page_fp, _, _ = page_counts(page, classes, thres)
+        tp += page_tp.sum()
+        fp += page_fp.sum()
+    return tp / (tp + fp) if tp + fp > 0 else 0.0
+
+
+def count_predictions(xml_dir):
+    return sum(len(xml2list(os.path.join(xml_dir, xml_f))) for xml_f in os.listdir(xml_dir))
+
+
+def deploy_report(img_dir, proposal_dir, model_config, weights, annotations_dir, out_dir, device_str='cpu',
+                  modes=BN_MODES, calibration_pages=16, store_path=None):
+    """
+    Run inference in every mode and write out_dir/deploy_report.csv
+    :param img_dir: Input image directory
+    :param proposal_dir: Corresponding proposals directory
+    :param model_config: Path to model config
+    :param weights: path to weights file
+    :param annotations_dir: ground truth XML directory, as passed to evaluate.py
+    :param out_dir: output directory
+    :param device_str: Device config
+    :param modes: batch norm modes to compare, the first one is the reference
+    :param calibration_pages: number of pages to calibrate batch norm on
+    :param store_path: Optional directory to keep the ingested window store in
+    :return: list of report rows
+    """
+    cfg = ConfigManager(model_config)
+    loader = get_loader(img_dir, proposal_dir, cfg, store_path)
+    device = torch.device(device_str)
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    for bn_mode in modes:
+        mode_dir = os.path.join(out_dir, bn_mode)
+        eval_dir = os.path.join(out_dir, f'{bn_mode}_eval')
+        os.makedirs(eval_dir, exist_ok=True)
+        model = load_model(model_config, weights, device_str, bn_mode, loader, calibration_pages)
+        with torch.no_grad():
+            rate = InferenceHelper(model, loader, device).run(mode_dir)
+        npredictions = count_predictions(mode_dir)
+        errors = run_evaluate(mode_dir, annotations_dir, eval_dir)
+        rows.append({'bn_mode': bn_mode,
+                     'proposals_per_s': rate,
+                     'speedup': rate / max(rows[0]['proposals_per_s'], 1e-9) if rows else 1.0,
+                     'npredictions': npredictions,
+                     'precision': detection_precision(mode_dir, annotations_dir),
+                     'correct_rate': 1 - len(errors) / npredictions if npredictions > 0 else 0.0,
+                     'agreement': label_agreement(mode_dir, os.path.join(out_dir, modes[0]))})
+        print(rows[-1])
+    with open(os.path.join(out_dir, 'deploy_report.csv'), 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+@click.command()
+@click.argument("img_dir")
+@click.argument("proposal_dir")
+@click.argument("model_config")
+@click.argument("weights")
+@click.argument("annotations_dir")
+@click.argument("out_dir")
+@click.option("--device", default='cpu', help="Device to run on")
+@click.option("--mode", "modes", multiple=True, type=click.Choice(BN_MODES), help="Modes to compare, default all")
+@click.option("--calibration_pages", default=16, help="Pages to calibrate batch norm on")
+def run_cli(img_dir, proposal_dir, model_config, weights, annotations_dir, out_dir, device, modes, calibration_pages):
+    deploy_report(img_dir, proposal_dir, model_config, weights, annotations_dir, out_dir, device,
+                  modes=modes or BN_MODES, calibration_pages=calibration_pages)
+
+
+if __name__ == "__main__":
+    run_cli()
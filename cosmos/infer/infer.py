@@ -1,42 +1,107 @@
 import click
+import os
 from torch_model.model.model import MMFasterRCNN
 from torch_model.model.utils.config_manager import ConfigManager
 import torch
 from torch_model.inference.inference import InferenceHelper
 from torch_model.inference.data_layer.inference_loader import InferenceLoader
+from torch_model.inference.deploy import prepare_model, BN_MODES
 from ingestion.ingest_images import ImageDB
 
 
 
-def run_inference(img_dir, proposal_dir, model_config, weights, out_dir, device_str):
+def calibration_batches(loader, npages=16, max_batch=64):
     """
-    Main function to run inference. Writes a bunch of XMLs to out_dir
-    :param img_dir: Input image directory
-    :param proposal: Corresponding proposals directory
+    Windows of the first pages of a loader, for batch norm calibration
+    :param loader: InferenceLoader
+    :param npages: number of pages to draw windows from
+    :param max_batch: maximum windows per batch
+    """
+    for ind, page in enumerate(loader.pages()):
+        if ind >= npages:
+            break
+        for start in range(0, page.windows.shape[0], max_batch):
+            yield page.windows[start:start + max_batch]
+
+
+def load_model(model_config, weights, device_str, bn_mode='batch', loader=None, calibration_pages=16):
+    """
+    Build a model with loaded weights in the requested inference mode
     :param model_config: Path to model config
     :param weights: path to weights file
-    :param out_dir: Path to output directory
     :param device_str: Device config
+    :param bn_mode: one of BN_MODES, see torch_model.inference.deploy.prepare_model
+    :param loader: InferenceLoader to draw calibration windows from, required unless bn_mode is 'batch'
+    :param calibration_pages: number of pages to calibrate batch norm on
+    :return: MMFasterRCNN
     """
     cfg = ConfigManager(model_config)
     model = MMFasterRCNN(cfg)
     model.load_state_dict(torch.load(weights, map_location={"cuda:0": device_str}))
-    model.eval()
-    def bn_train(m):
-        if type(m) == torch.nn.BatchNorm2d:
-            m.train()
-    model.apply(bn_train)
+    device = torch.device(device_str)
+    model.to(device)
+    batches = calibration_batches(loader, calibration_pages) if loader is not None else None
+    return prepare_model(model, bn_mode, batches, device)
+
+
+def get_loader(img_dir, proposal_dir, cfg, store_path=None):
     session, ingest_objs = ImageDB.initialize_and_ingest(img_dir,
                                                          proposal_dir,
                                                          None,
                                                          cfg.WARPED_SIZE,
                                                          'test',
-                                                         cfg.EXPANSION_DELTA)
-    loader = InferenceLoader(session, ingest_objs, cfg.CLASSES)
+                                                         cfg.EXPANSION_DELTA,
+                                                         store_path=store_path,
+                                                         neighborhood=getattr(cfg, 'NEIGHBORHOOD', 'overlap'),
+                                                         max_neighbors=getattr(cfg, 'MAX_NEIGHBORS', None),
+                                                         extractor=getattr(cfg, 'WINDOW_EXTRACTOR', 'pil'))
+    return InferenceLoader(session, ingest_objs, cfg.CLASSES)
+
+
+def run_inference(img_dir, proposal_dir, model_config, weights, out_dir, device_str, page_batched=True, compare_dir=None,
+                  store_path=None, bn_mode='batch', calibration_pages=16):
+    """
+    Main function to run inference. Writes a bunch of XMLs to out_dir
+    :param img_dir: Input image directory
+    :param proposal: Corresponding proposals directory
+    :param model_config: Path to model config
+    :param weights: path to weights file
+    :param out_dir: Path to output directory
+    :param device_str: Device config
+    :param page_batched: Featurize the windows of a page together instead of one proposal at a time
+    :param compare_dir: Optional directory to also write the per proposal XMLs to, reporting throughput of both paths
+    :param store_path: Optional directory to keep the ingested window store in, reused when it already exists
+    :param bn_mode: 'batch' normalizes with batch statistics, 'frozen', 'fused' and 'int8' are deployment modes
+    :param calibration_pages: number of pages to calibrate batch norm on in the deployment modes
+    """
+    cfg = ConfigManager(model_config)
+    loader = get_loader(img_dir, proposal_dir, cfg, store_path)
     device = torch.device(device_str)
-    model.to(device)
+    model = load_model(model_config, weights, device_str, bn_mode, loader, calibration_pages)
     infer_session = InferenceHelper(model, loader, device)
-    infer_session.run(out_dir)
+    rate = infer_session.run(out_dir, page_batched=page_batched)
+    if compare_dir is not None:
+        baseline_rate = infer_session.run(compare_dir, page_batched=False)
+        print(f"page batched: {rate:.2f} proposals/s, per proposal: {baseline_rate:.2f} proposals/s, "
+              f"speedup {rate / max(baseline_rate, 1e-9):.2f}x")
+        differing = compare_xml_dirs(out_dir, compare_dir)
+        print(f"{len(differing)} XMLs differ from the per proposal path")
+
+
+def compare_xml_dirs(out_dir, compare_dir):
+    """
+    :return: list of XML file names whose contents differ between the two directories
+    """
+    differing = []
+    for xml_f in sorted(set(os.listdir(out_dir)) | set(os.listdir(compare_dir))):
+        paths = [os.path.join(out_dir, xml_f), os.path.join(compare_dir, xml_f)]
+        if not all(os.path.exists(path) for path in paths):
+            differing.append(xml_f)
+            continue
+        with open(paths[0], 'rb') as a, open(paths[1], 'rb') as b:
+            if a.read() != b.read():
+                differing.append(xml_f)
+    return differing
 
 
 @click.command()
@@ -45,8 +110,13 @@ def run_inference(img_dir, proposal_dir, model_config, weights, out_dir, device_
 @click.argument("model_config")
 @click.argument("weights")
 @click.argument("out_dir")
-def run_cli(img_dir, proposal_dir, model_config,weights, out_dir):
-    run_inference(img_dir, proposal_dir, model_config,weights, out_dir, 'cuda:0')
+@click.option("--per_proposal", is_flag=True, help="Use the per proposal path instead of page batching")
+@click.option("--compare_dir", default=None, help="Also run the per proposal path into this directory and compare")
+@click.option("--bn_mode", type=click.Choice(BN_MODES), default='batch', help="Batch norm handling, see deploy.py")
+@click.option("--device", default='cuda:0', help="Device to run on")
+def run_cli(img_dir, proposal_dir, model_config,weights, out_dir, per_proposal, compare_dir, bn_mode, device):
+    run_inference(img_dir, proposal_dir, model_config,weights, out_dir, device,
+                  page_batched=not per_proposal, compare_dir=compare_dir, bn_mode=bn_mode)
 
 if __name__ == "__main__":
     run_cli()
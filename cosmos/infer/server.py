@@ -0,0 +1,221 @@
+"""
+Long lived layout classification server.
+The model is built and its weights loaded once. Pages are posted as a PNG
+plus the proposals csv, concurrent requests are batched by a DynamicBatcher
+and every page gets its VOC XML objects back.
+
+POST /classify  {"page_id": str, "image": base64 PNG, "proposals": csv text}
+GET  /metrics   queue depth, batch sizes and per stage latencies
+GET  /health
+"""
+import base64
+import io
+import json
+import socketserver
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from timeit import default_timer as timer
+import click
+import torch
+from PIL import Image
+from torch_model.model.utils.config_manager import ConfigManager
+from torch_model.inference.inference import InferenceHelper
+from torch_model.inference.data_layer.inference_loader import InferenceLoader
+from torch_model.inference.deploy import BN_MODES
+from ingestion.ingest_images import ImageDB, IngestObjs, ingest_page, proposals_from_csv, compute_neighborhoods
+from infer.infer import get_loader, load_model
+from utils.batcher import DynamicBatcher, LatencyStats
+
+
+class LayoutServer:
+    """
+    Model plus request batcher
+    """
+    def __init__(self, cfg, model, device, max_batch=8, max_latency=0.05, stats=None):
+        """
+        :param cfg: model config
+        :param model: model with its weights loaded
+        :param device: torch device of the model
+        :param max_batch: maximum pages per batch
+        :param max_latency: seconds a page may wait for its batch to fill
+        :param stats: LatencyStats to record into, a new one when not given
+        """
+        self.cfg = cfg
+        self.device = device
+        self.model = model
+        self.stats = stats if stats is not None else LatencyStats()
+        self.batcher = DynamicBatcher(self.classify_pages, max_batch=max_batch, max_latency=max_latency, stats=self.stats)
+
+    @classmethod
+    def load(cls, model_config, weights, device_str='cpu', bn_mode='batch', max_batch=8, max_latency=0.05,
+             calibration_img_dir=None, calibration_proposal_dir=None):
+        """
+        Build the model and load its weights once
+        :param model_config: Path to model config
+        :param weights: path to weights file
+        :param device_str: Device config
+        :param bn_mode: one of BN_MODES, the deployment modes need the calibration directories
+        :param max_batch: maximum pages per batch
+        :param max_latency: seconds a page may wait for its batch to fill
+        :param calibration_img_dir: image directory to calibrate batch norm on
+        :param calibration_proposal_dir: proposal directory to calibrate batch norm on
+        :return: LayoutServer
+        """
+        cfg = ConfigManager(model_config)
+        loader = None
+        if calibration_img_dir is not None:
+            loader = get_loader(calibration_img_dir, calibration_proposal_dir, cfg)
+        start = timer()
+        model = load_model(model_config, weights, device_str, bn_mode, loader)
+        stats = LatencyStats()
+        stats.record('model_load', timer() - start)
+        return cls(cfg, model, torch.device(device_str), max_batch, max_latency, stats)
+
+    def classify_pages(self, pages):
+        """
+        :param pages: list of (page_id, PIL image, proposals BBoxes)
+        :return: list of {"page_id", "objects", "xml"}, in the order of pages
+        """
+        start = timer()
+        store = ImageDB.build()
+        uuids = []
+        names = []
+        for idx, (page_id, image, proposals) in enumerate(pages):
+            # Page ids of concurrent requests may collide, the batch index keeps them apart
+            names.append(f"{idx}_{page_id}")
+            uuids.extend(ingest_page(store, names[-1], image, proposals, self.cfg.WARPED_SIZE,
+                                     extractor=getattr(self.cfg, 'WINDOW_EXTRACTOR', 'pil')))
+        store.finalize()
+        compute_neighborhoods(store, 'test', self.cfg.EXPANSION_DELTA,
+                              policy=getattr(self.cfg, 'NEIGHBORHOOD', 'overlap'),
+                              max_neighbors=getattr(self.cfg, 'MAX_NEIGHBORS', None))
+        self.stats.record('ingest', timer() - start)
+        xml_dict = {}
+        if uuids:
+            start = timer()
+            ingest_objs = IngestObjs(uuids=uuids, class_stats={None: len(uuids)}, nproposals=len(uuids), ngt_boxes=0)
+            loader = InferenceLoader(store, ingest_objs, self.cfg.CLASSES)
+            with torch.no_grad():
+                xml_dict, _ = InferenceHelper(self.model, loader, self.device).predict()
+            self.stats.record('inference', timer() - start)
+        start = timer()
+        results = [self.page_result(page_id, xml_dict.get(name, [])) for (page_id, _, _), name in zip(pages, names)]
+        self.stats.record('serialize', timer() - start)
+        return results
+
+    @staticmethod
+    def page_result(page_id, predictions):
+        """
+        :param page_id: page identifier
+        :param predictions: [(bb, pred, prob)] of the page
+        :return: {"page_id", "objects", "xml"}
+        """
+        objects = [{'name': pred, 'bbox': bb.long().tolist(), 'score': prob} for bb, pred, prob in predictions]
+        return {'page_id': page_id, 'objects': objects, 'xml': InferenceHelper.xml_string(predictions)}
+
+    def classify(self, page_id, image_bytes, proposals_csv, timeout=None):
+        """
+        Decode one request and wait for its batch
+        :param page_id: page identifier
+        :param image_bytes: encoded page image
+        :param proposals_csv: proposals csv text
+        :param timeout: seconds to wait for the result
+        :return: {"page_id", "objects", "xml"}
+        """
+        start = timer()
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+        proposals = proposals_from_csv(io.StringIO(proposals_csv))
+        self.stats.record('decode', timer() - start)
+        return self.batcher((page_id, image, proposals), timeout)
+
+    def metrics(self):
+        return self.batcher.metrics()
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._send(200, server.metrics())
+            elif self.path == '/health':
+                self._send(200, {'status': 'ok'})
+            else:
+                self._send(404, {'error': f'unknown path {self.path}'})
+
+        def do_POST(self):
+            if self.path != '/classify':
+                self._send(404, {'error': f'unknown path {self.path}'})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                result = server.classify(request.get('page_id', ''), base64.b64decode(request['image']),
+                                         request['proposals'])
+            except (KeyError, ValueError, OSError) as e:
+                self._send(400, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+                return
+            self._send(200, result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def classify_page(url, page_id, img_path, proposals_path):
+    """
+    Client helper: post a page to a running server
+    :param url: server url, e.g. http://localhost:8787
+    :param page_id: page identifier
+    :param img_path: page image path
+    :param proposals_path: proposals csv path
+    :return: {"page_id", "objects", "xml"}
+    """
+    with open(img_path, 'rb') as img_f, open(proposals_path) as prop_f:
+        payload = {'page_id': page_id, 'image': base64.b64encode(img_f.read()).decode(), 'proposals': prop_f.read()}
+    request = urllib.request.Request(f"{url}/classify", data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+@click.command()
+@click.argument("model_config")
+@click.argument("weights")
+@click.option("--host", default='127.0.0.1', help="Address to listen on")
+@click.option("--port", default=8787, help="Port to listen on")
+@click.option("--device", default='cpu', help="Device to run on")
+@click.option("--bn_mode", type=click.Choice(BN_MODES), default='batch', help="Batch norm handling, see deploy.py")
+@click.option("--max_batch", default=8, help="Maximum pages per batch")
+@click.option("--max_latency_ms", default=50, help="Milliseconds a page may wait for its batch to fill")
+@click.option("--calibration_img_dir", default=None, help="Images to calibrate batch norm on for the deployment modes")
+@click.option("--calibration_proposal_dir", default=None, help="Proposals of the calibration images")
+def run_cli(model_config, weights, host, port, device, bn_mode, max_batch, max_latency_ms, calibration_img_dir,
+            calibration_proposal_dir):
+    server = LayoutServer.load(model_config, weights, device, bn_mode, max_batch, max_latency_ms / 1000,
+                               calibration_img_dir, calibration_proposal_dir)
+    httpd = ThreadingHTTPServer((host, port), make_handler(server))
+    print(f"Serving on {host}:{port}")
+    try:
+        httpd.serve_forever()
+    finally:
+        server.batcher.stop()
+
+
+if __name__ == "__main__":
+    run_cli()
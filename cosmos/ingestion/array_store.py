@@ -0,0 +1,256 @@
+"""
+Columnar store for ingested proposal windows.
+All warped windows of a run live in one contiguous [N x 3 x W x W] array,
+rows of a page are contiguous, and neighborhoods are kept as a CSR index.
+The store can be saved to a directory of .npy files and memory mapped back,
+so one ingestion can serve several inference or training runs.
+"""
+import json
+import os
+import numpy as np
+
+# NormalizeWrapper defaults, used to store windows as pixels and normalize on read
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+WINDOW_DTYPES = ('uint8', 'float16', 'float32')
+ARRAYS = ['windows', 'bboxes', 'gt_boxes', 'page_codes', 'neighbor_ptr', 'neighbor_idx']
+META = 'meta.json'
+
+
+def write_json(path, obj):
+    """
+    Write obj as json to a temporary file and rename it over path, so path is either complete or absent
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as wf:
+        json.dump(obj, wf)
+    os.replace(tmp_path, path)
+
+
+def normalize(pixels):
+    """
+    ToTensor followed by NormalizeWrapper on uint8 pixels, with the same float32 operations
+    :param pixels: [... x 3 x H x W] uint8 array
+    :return: float32 array
+    """
+    return (pixels.astype(np.float32) / np.float32(255) - MEAN) / STD
+
+
+def denormalize(windows):
+    """
+    Invert normalize. Windows cropped from 8 bit images round trip exactly.
+    :param windows: [... x 3 x H x W] normalized float array
+    :return: uint8 array
+    """
+    pixels = (np.asarray(windows, dtype=np.float32) * STD + MEAN) * 255
+    return np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+
+
+class ArrayStore:
+    """
+    Page indexed array store of proposal windows, boxes, labels and neighborhoods
+    """
+    def __init__(self, window_dtype='uint8'):
+        """
+        :param window_dtype: 'uint8' keeps pixels and normalizes on read (lossless, 4x smaller than float32),
+                             'float16' and 'float32' keep normalized windows
+        """
+        if window_dtype not in WINDOW_DTYPES:
+            raise ValueError(f'window_dtype must be one of {WINDOW_DTYPES}, got {window_dtype}')
+        self.window_dtype = window_dtype
+        self.object_ids = []
+        self.labels = []
+        self.partitions = []
+        self.page_ids = []
+        self.uuid_index = {}
+        self.page_ranges = {}
+        self._chunks = []
+        self.windows = None
+        self.bboxes = None
+        self.gt_boxes = None
+        self.page_codes = None
+        self.neighbor_ptr = None
+        self.neighbor_idx = None
+
+    def __len__(self):
+        return len(self.object_ids)
+
+    def append_page(self, page_id, partition, object_ids, windows, bboxes, gt_boxes, labels):
+        """
+        Add the examples of one page
+        :param page_id: page identifier
+        :param partition: train/val/test partition
+        :param object_ids: list of K uuids
+        :param windows: [K x 3 x W x W] normalized float windows, or uint8 pixels
+        :param bboxes: [K x 4] proposal boxes
+        :param gt_boxes: [K x 4] matched ground truth boxes, rows of nan when there is no ground truth
+        :param labels: list of K labels (str or None)
+        """
+        if self.windows is not None:
+            raise RuntimeError('Cannot append to a finalized store')
+        if len(object_ids) == 0:
+            return
+        if page_id in self.page_ranges:
+            raise ValueError(f'Page {page_id} was already added')
+        start = len(self.object_ids)
+        windows = np.asarray(windows)
+        if windows.dtype == np.uint8:
+            windows = windows if self.window_dtype == 'uint8' else normalize(windows).astype(self.window_dtype)
+        else:
+            windows = denormalize(windows) if self.window_dtype == 'uint8' else windows.astype(self.window_dtype)
+        page_code = len(self.page_ids)
+        self.page_ids.append(page_id)
+        self._chunks.append((windows,
+                             np.asarray(bboxes, dtype=np.float32).reshape(-1, 4),
+                             np.asarray(gt_boxes, dtype=np.float32).reshape(-1, 4),
+                             np.full(len(object_ids), page_code, dtype=np.int32)))
+        for row, object_id in enumerate(object_ids, start=start):
+            self.uuid_index[object_id] = row
+        self.object_ids.extend(object_ids)
+        self.labels.extend(labels)
+        self.partitions.extend([partition] * len(object_ids))
+        self.page_ranges[page_id] = (start, len(self.object_ids))
+
+    def finalize(self, path=None, mmap=True, params=None):
+        """
+        Concatenate the appended pages into the column arrays
+        :param path: optional directory to save the store to
+        :param mmap: when saving, memory map the arrays back instead of keeping them in memory
+        :param params: when saving, json serializable parameters the store was built with, see save
+        :return: self
+        """
+        if self.windows is None:
+            if self._chunks:
+                columns = [np.concatenate(column) for column in zip(*self._chunks)]
+            else:
+                columns = [np.zeros((0, 3, 0, 0), dtype=self.window_dtype), np.zeros((0, 4), dtype=np.float32),
+                           np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int32)]
+            self._chunks = []
+            self.windows, self.bboxes, self.gt_boxes, self.page_codes = columns
+            if self.neighbor_ptr is None:
+                self.set_neighbors(np.zeros(len(self) + 1, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        if path is not None:
+            self.save(path, params)
+            if mmap:
+                loaded = ArrayStore.load(path, mmap=True)
+                self.__dict__.update(loaded.__dict__)
+        return self
+
+    def set_neighbors(self, neighbor_ptr, neighbor_idx):
+        """
+        Set the neighborhoods as a CSR index: the neighbors of row i are neighbor_idx[neighbor_ptr[i]:neighbor_ptr[i+1]]
+        """
+        neighbor_ptr = np.asarray(neighbor_ptr, dtype=np.int64)
+        if neighbor_ptr.shape[0] != len(self) + 1:
+            raise ValueError(f'neighbor_ptr must have {len(self) + 1} entries, got {neighbor_ptr.shape[0]}')
+        self.neighbor_ptr = neighbor_ptr
+        self.neighbor_idx = np.asarray(neighbor_idx, dtype=np.int64)
+
+    def row(self, uuid):
+        """
+        :param uuid: object id
+        :return: row index
+        """
+        return self.uuid_index[uuid]
+
+    def page_rows(self, page_id):
+        """
+        :param page_id: page identifier
+        :return: (start, stop) row range of the page
+        """
+        return self.page_ranges[page_id]
+
+    def page_id(self, row):
+        return self.page_ids[self.page_codes[row]]
+
+    def neighbors(self, row):
+        """
+        :param row: row index
+        :return: array of neighbor row indices
+        """
+        return self.neighbor_idx[self.neighbor_ptr[row]:self.neighbor_ptr[row + 1]]
+
+    def window_view(self, rows):
+        """
+        Stored windows without conversion. Slices of a row range are views into the (possibly memory mapped) array.
+        :param rows: row index, slice or index array
+        :return: stored dtype array
+        """
+        return self.windows[rows]
+
+    def window_array(self, rows):
+        """
+        Normalized float32 windows, as produced by ingestion
+        :param rows: row index, slice or index array
+        :return: float32 array
+        """
+        windows = self.windows[rows]
+        if self.window_dtype == 'uint8':
+            return normalize(windows)
+        return windows.astype(np.float32)
+
+    def save(self, path, params=None):
+        """
+        Write the store to a directory of .npy files plus a json of the non array columns.
+        The json is written last and atomically, a store is only complete once it exists.
+        :param path: output directory
+        :param params: json serializable parameters the store was built with, see saved_params
+        """
+        os.makedirs(path, exist_ok=True)
+        ArrayStore.invalidate(path)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        meta = {'window_dtype': self.window_dtype,
+                'object_ids': self.object_ids,
+                'labels': self.labels,
+                'partitions': self.partitions,
+                'page_ids': self.page_ids,
+                'params': params}
+        write_json(os.path.join(path, META), meta)
+
+    @staticmethod
+    def exists(path):
+        return path is not None and os.path.exists(os.path.join(path, META))
+
+    @staticmethod
+    def saved_params(path):
+        """
+        :param path: store directory
+        :return: the params the saved store was built with, None if it has none
+        """
+        with open(os.path.join(path, META)) as rf:
+            return json.load(rf).get('params')
+
+    @staticmethod
+    def invalidate(path):
+        """
+        Mark the store at path as incomplete, so it is not loaded until it is saved again
+        :param path: store directory
+        """
+        if ArrayStore.exists(path):
+            os.remove(os.path.join(path, META))
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        Load a saved store
+        :param path: store directory
+        :param mmap: memory map the arrays read only instead of reading them into memory
+        :return: ArrayStore
+        """
+        with open(os.path.join(path, META)) as rf:
+            meta = json.load(rf)
+        store = ArrayStore(meta['window_dtype'])
+        store.object_ids = meta['object_ids']
+        store.labels = meta['labels']
+        store.partitions = meta['partitions']
+        store.page_ids = meta['page_ids']
+        for name in ARRAYS:
+            setattr(store, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None))
+        store.uuid_index = {object_id: row for row, object_id in enumerate(store.object_ids)}
+        bounds = np.flatnonzero(np.diff(store.page_codes)) + 1
+        starts = np.concatenate(([0], bounds)).astype(int)
+        stops = np.concatenate((bounds, [len(store.object_ids)])).astype(int)
+        store.page_ranges = {store.page_ids[store.page_codes[start]]: (int(start), int(stop))
+                             for start, stop in zip(starts, stops) if stop > start}
+        return store
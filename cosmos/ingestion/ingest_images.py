@@ -1,5 +1,3 @@
-import sqlalchemy
-from evaluate.evaluate import calculate_iou
 from collections import namedtuple
 import torch
 from torch_model.utils.bbox import BBoxes
@@ -8,6 +6,7 @@ import redis
 import os
 from xml.etree import ElementTree as ET
 from converters.xml2list import xml2list
+import numpy as np
 from numpy import genfromtxt
 from torch_model.utils.matcher import match
 from torchvision.transforms import ToTensor
@@ -15,12 +14,16 @@ from torch_model.train.data_layer.transforms import NormalizeWrapper
 from uuid import uuid4
 from tqdm import tqdm
 import pickle
-from torch_model.train.data_layer.sql_types import Example as Ex
-from torch_model.train.data_layer.sql_types import Neighbor, Base
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from ingestion.array_store import ArrayStore, normalize, write_json
+from ingestion.windows import extract_windows
+from ingestion.neighborhoods import page_neighborhoods, neighborhood_stats
+from timeit import default_timer as timer
+import json
+import random
 import yaml
 Example = namedtuple('Example', ["ex_window", "ex_proposal", "gt_cls", "gt_box"])
+IngestObjs = namedtuple('IngestObjs', 'uuids class_stats nproposals ngt_boxes')
+ExampleData = namedtuple('ExampleData', 'examples proposals_len gt_box_len windows')
 
 normalizer = NormalizeWrapper()
 tens = ToTensor()
@@ -101,15 +104,30 @@ def load_proposal(base_path, identifier):
     :return: BBoxes object denoted proposal
     """
     path = os.path.join(base_path, f"{identifier}.csv")
-    np_arr = genfromtxt(path, delimiter=",")
+    return proposals_from_csv(path)
+
+def proposals_from_csv(source):
+    """
+    Parse a proposals csv
+    :param source: path or file object of the csv
+    :return: BBoxes object denoted proposal
+    """
+    np_arr = genfromtxt(source, delimiter=",")
+    # write_proposals appends the blank row height the page was segmented at as a fifth column
+    ncols = np_arr.shape[-1] if np_arr.size > 0 else 4
+    np_arr = np.ascontiguousarray(np_arr.reshape(-1, ncols)[:, :4])
     bbox_absolute = torch.from_numpy(np_arr).reshape(-1,4)
     return BBoxes(bbox_absolute, "xyxy")
 
-def unpack_page(page, warped_size):
+def unpack_page(page, warped_size, extractor='pil', uint8=False):
     """
     Unpack the objects in a page object
     :param page: Page object to unpack
     :param warped_size: Warped size of image
+    :param extractor: 'pil' crops and resizes each window with PIL, the input the pretrained weights were trained on.
+                      'batched' (opt in with WINDOW_EXTRACTOR in the model config) warps every window in vectorized
+                      grid_sample calls, which approximates the PIL resize, so predictions can differ.
+    :param uint8: return the windows as uint8 pixels instead of normalized floats
     :return: unpacked ExampleData object
     """
     img, gt, proposals, identifier = page
@@ -133,15 +151,18 @@ def unpack_page(page, warped_size):
         proposals.change_format("xyxy")
         # proposals = proposals[idxs, :].reshape(-1,4)
         #matches = list(filter(lambda x: x != -1, matches))
-    windows = []
     proposals_lst = proposals.tolist()
-    for idx, proposal in enumerate(proposals_lst):
-        proposal = [int(c) for c in proposal]
-        img_sub = img.crop(proposal)
-        img_sub = img_sub.resize((warped_size, warped_size))
-        img_data = tens(img_sub)
-        img_data = normalizer(img_data)
-        windows.append(img_data)
+    int_proposals = [[int(c) for c in proposal] for proposal in proposals_lst]
+    if extractor == 'batched':
+        windows = extract_windows(img, int_proposals, warped_size)
+    elif extractor == 'pil':
+        windows = torch.stack([torch.from_numpy(np.asarray(img.crop(proposal).resize((warped_size, warped_size)).convert('RGB'))).permute(2, 0, 1)
+                               for proposal in int_proposals]) if int_proposals else torch.zeros(0, 3, warped_size, warped_size, dtype=torch.uint8)
+    else:
+        raise ValueError(f"Unknown window extractor {extractor}, expected 'batched' or 'pil'")
+    if not uint8:
+        # Same float32 operations as ToTensor followed by NormalizeWrapper
+        windows = torch.from_numpy(normalize(windows.numpy()))
     # switch to list of tensors
     proposals_lst = [torch.tensor(prop) for prop in proposals_lst]
     match_box_lst = None
@@ -155,11 +176,10 @@ def unpack_page(page, warped_size):
     collected = list(zip(windows,proposals_lst,labels,match_box_lst))
     assert len(labels) == len(proposals_lst)
     ret = [Example(*pt) for pt in collected]
-    ExampleData = namedtuple('ExampleData', 'examples proposals_len gt_box_len')
-    return ExampleData(examples=ret, proposals_len=len(proposals_lst), gt_box_len=(len(gt_box_lst) if gt_box_lst is not None else 0))
+    return ExampleData(examples=ret, proposals_len=len(proposals_lst), gt_box_len=(len(gt_box_lst) if gt_box_lst is not None else 0), windows=windows)
 
 
-def db_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, session):
+def db_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, store, extractor='pil'):
     """
     ingest the db
     :param img_dir: Image directory
@@ -167,14 +187,14 @@ def db_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, session):
     :param xml_dir: Path to annotations for train mode, None otherwise
     :param warped_size: Size of warped image
     :param partition: For train mode this corresponds to train/val/test
-    :param session: DB Session to work on
+    :param store: ArrayStore to append the pages to
+    :param extractor: window extractor, see unpack_page
     :return: IngestObjs containing statistics about the DB
     """
     class_stats = {}
     uuids = []
     nproposals = 0
     ngt_boxes = 0
-    examples = []
     for img_name in tqdm(os.listdir(img_dir)):
         name, ext = os.path.splitext(img_name)
         image = load_image(img_dir, name, ext)
@@ -188,10 +208,11 @@ def db_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, session):
                 print("no proposals for ", name)
                 continue
         ret = [image, gt, proposals, name]
-        pts, proposals_len, gt_box_len = unpack_page(ret, warped_size)
-        nproposals += proposals_len
-        ngt_boxes += gt_box_len
-        for pt in pts:
+        unpacked = unpack_page(ret, warped_size, extractor=extractor, uint8=store.window_dtype == 'uint8')
+        nproposals += unpacked.proposals_len
+        ngt_boxes += unpacked.gt_box_len
+        page = []
+        for idx, pt in enumerate(unpacked.examples):
             uuid = str(uuid4())
             label = pt.gt_cls
             if label == 0 or label == "0":
@@ -205,83 +226,187 @@ def db_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, session):
                 class_stats[label] += 1
             else:
                 class_stats[label] = 1
-            ex = Ex(page_id=name, object_id=uuid, window=pt.ex_window, bbox=pt.ex_proposal, gt_box=pt.gt_box, label=pt.gt_cls, partition=partition)
-            examples.append(ex)
-    session.add_all(examples)
-    IngestObjs = namedtuple('IngestObjs', 'uuids class_stats nproposals ngt_boxes')
+            page.append((uuid, idx, pt))
+        if len(page) == 0:
+            continue
+        object_ids, kept, page_pts = zip(*page)
+        gt_boxes = [pt.gt_box.float().expand(4).tolist() if pt.gt_box is not None else [float('nan')] * 4 for pt in page_pts]
+        store.append_page(name, partition, list(object_ids),
+                          unpacked.windows[torch.tensor(kept, dtype=torch.long)].numpy(),
+                          torch.stack([pt.ex_proposal for pt in page_pts]).numpy(),
+                          gt_boxes,
+                          [pt.gt_cls for pt in page_pts])
     return IngestObjs(uuids=uuids, class_stats=class_stats, nproposals=nproposals, ngt_boxes=ngt_boxes)
 
 
-def get_example_for_uuid(uuid, session):
+def ingest_page(store, name, image, proposals, warped_size, partition='test', extractor='pil'):
+    """
+    Append the proposals of one unlabeled page to a store
+    :param store: ArrayStore
+    :param name: page identifier
+    :param image: PIL image of the page
+    :param proposals: BBoxes of the proposals
+    :param warped_size: Size of warped image
+    :param partition: partition of the examples
+    :param extractor: window extractor, see unpack_page
+    :return: list of uuids of the page
+    """
+    if proposals.shape[0] == 0:
+        return []
+    unpacked = unpack_page([image, None, proposals, name], warped_size, extractor=extractor,
+                           uint8=store.window_dtype == 'uint8')
+    uuids = [str(uuid4()) for _ in unpacked.examples]
+    store.append_page(name, partition, uuids, unpacked.windows.numpy(),
+                      torch.stack([pt.ex_proposal for pt in unpacked.examples]).numpy(),
+                      [[float('nan')] * 4] * len(uuids),
+                      [None] * len(uuids))
+    return uuids
+
+
+class StoredExample:
+    """
+    A row of an ArrayStore, with the attributes loaders read from examples
+    """
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def object_id(self):
+        return self.store.object_ids[self.row]
+
+    @property
+    def page_id(self):
+        return self.store.page_id(self.row)
+
+    @property
+    def partition(self):
+        return self.store.partitions[self.row]
+
+    @property
+    def label(self):
+        return self.store.labels[self.row]
+
+    @property
+    def window(self):
+        return torch.from_numpy(self.store.window_array(self.row))
+
+    @property
+    def bbox(self):
+        return torch.from_numpy(np.array(self.store.bboxes[self.row]))
+
+    @property
+    def gt_box(self):
+        gt_box = np.array(self.store.gt_boxes[self.row])
+        return None if np.isnan(gt_box).any() else torch.from_numpy(gt_box)
+
+    def neighbors(self, positive, uuids, store, n_neighbors=5):
+        """
+        :param positive: True for the neighborhood of the example, False for randomly sampled negatives
+        :param uuids: uuids to sample negatives from
+        :param store: ArrayStore
+        :param n_neighbors: number of negatives
+        :return: [StoredExample]
+        """
+        if positive:
+            return [StoredExample(store, int(row)) for row in store.neighbors(self.row)]
+        sampled_uuids = random.sample(uuids, n_neighbors)
+        while self.object_id in sampled_uuids:
+            sampled_uuids = random.sample(uuids, n_neighbors)
+        return [StoredExample(store, row) for row in sorted(store.row(uuid) for uuid in sampled_uuids)]
+
+    def __repr__(self):
+        return f"StoredExample(row={self.row}, page_id={self.page_id}, object_id={self.object_id})"
+
+
+def get_example_for_uuid(uuid, store):
     """
     Helper function to fetch an example for a uuid
     :param uuid: input uuid
-    :param session: DB Session
-    :return: DB Example object
+    :param store: ArrayStore
+    :return: StoredExample
     """
-    ex = session.query(Ex).filter_by(object_id=uuid).one()
-    return ex
+    return StoredExample(store, store.row(uuid))
 
 
-def compute_neighborhoods(session, partition, expansion_delta, orig_size=1920):
+def compute_neighborhoods(store, partition, expansion_delta, orig_size=1920, policy='overlap', max_neighbors=None):
     """
     Compute the neighborhoods for a target image and input to DB
-    :param session: DB Session
+    :param store: ArrayStore
     :param partition: train/val/test partition
     :param expansion_delta: Neighborhood expansion parameter
     :param orig_size: original size of the image
+    :param policy: neighborhood policy, see ingestion.neighborhoods.page_neighborhoods
+    :param max_neighbors: hard cap on the neighborhood size, None for no cap
+    :return: NeighborhoodStats
     """
     print('Computing neighborhoods')
-    avg_nbhd_size = 0.0
-    nbhds = 0.0
-    for ex in tqdm(session.query(Ex).filter(Ex.partition == partition)):
-        orig_bbox = ex.bbox
-        nbhd_bbox = [max(0, orig_bbox[0]-expansion_delta), max(0, orig_bbox[1]-expansion_delta), min(orig_size, orig_bbox[2]+expansion_delta), min(orig_size, orig_bbox[3]+expansion_delta)]
+    start_time = timer()
+    partitions = np.array(store.partitions, dtype=object)
+    sizes = np.zeros(len(store), dtype=np.int64)
+    page_idxs = []
+    ntested = 0
+    for page_id in tqdm(store.page_ids):
+        start, stop = store.page_rows(page_id)
         # Get all the examples on the same page
-        nbhd = []
-        for page_ex in session.query(Ex).filter(Ex.partition == ex.partition).filter(Ex.page_id == ex.page_id).filter(Ex.object_id != ex.object_id):
-            target_bbox = page_ex.bbox
-            iou = calculate_iou(nbhd_bbox, target_bbox)
-            if iou > 0:
-                nbhr = Neighbor(center_object_id=ex.object_id, neighbor_object_id=page_ex.object_id)
-                nbhd.append(nbhr)
-        nbhds += 1.0
-        avg_nbhd_size += len(nbhd)
-        session.add_all(nbhd)
-    print("=== Done Computing Neighborhoods ===")
-    print(f"Average of {avg_nbhd_size/nbhds} neighbors")
-
-def get_neighbors_for_uuid(uuid, session):
+        rows = start + np.flatnonzero(partitions[start:stop] == partition)
+        page_ptr, page_idx, page_tested = page_neighborhoods(store.bboxes[rows], expansion_delta, orig_size,
+                                                                 policy=policy, max_neighbors=max_neighbors)
+        sizes[rows] = np.diff(page_ptr)
+        page_idxs.append(rows[page_idx])
+        ntested += page_tested
+    # Pages are visited in row order, so the per page lists concatenate into the CSR index
+    neighbor_ptr = np.zeros(len(store) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=neighbor_ptr[1:])
+    store.set_neighbors(neighbor_ptr, np.concatenate(page_idxs) if page_idxs else np.zeros(0, dtype=np.int64))
+    stats = neighborhood_stats(neighbor_ptr, np.flatnonzero(partitions == partition), ntested)
+    print(f"=== Done Computing Neighborhoods ({policy}, max {max_neighbors}) ===")
+    print(f"Average of {stats.mean} neighbors (median {stats.median}, max {stats.max}, {stats.isolated} without neighbors), "
+          f"{stats.nneighbors} pairs from {stats.ntested} tested in {timer() - start_time:.2f} s")
+    return stats
+
+def get_neighbors_for_uuid(uuid, store):
     """
     Helper function to get neighbors for a uuid
     :param uuid: Input uuid
-    :param session: Input DB Session
+    :param store: ArrayStore
     :return: neighbors
     """
-    ex = get_example_for_uuid(uuid)
-    return ex.neighbors
+    ex = get_example_for_uuid(uuid, store)
+    return ex.neighbors(True, None, store)
+
 
 
+def store_params(img_dir, proposal_dir, xml_dir, warped_size, partition, expansion_delta, window_dtype, extractor,
+                 neighborhood, max_neighbors):
+    """
+    Parameters a saved store is built with, a store is reused only when they all match
+    :return: dictionary as it round trips through json
+    """
+    def path(p):
+        return os.path.abspath(p) if p is not None else None
+    return json.loads(json.dumps({'img_dir': path(img_dir), 'proposal_dir': path(proposal_dir), 'xml_dir': path(xml_dir),
+                                  'warped_size': warped_size, 'partition': partition, 'expansion_delta': expansion_delta,
+                                  'window_dtype': window_dtype, 'extractor': extractor, 'neighborhood': neighborhood,
+                                  'max_neighbors': max_neighbors}))
+
 
 class ImageDB:
     """
-    SQL alchemy session factory
+    Array store factory
     """
     @staticmethod
-    def build(verbose=False):
+    def build(window_dtype='uint8'):
         """
-        Initlaize the db in memory and return the session
-        :param verbose: Verbose logging
-        :return: DB Session
+        Initialize an empty store
+        :param window_dtype: storage dtype of the windows, see ArrayStore
+        :return: ArrayStore
         """
-        engine = create_engine('sqlite:///:memory:', echo=verbose)  
-        Base.metadata.create_all(engine)
-        Session = sessionmaker()
-        Session.configure(bind=engine)
-        return Session() 
+        return ArrayStore(window_dtype)
 
     @staticmethod
-    def initialize_and_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, expansion_delta):
+    def initialize_and_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, expansion_delta, store_path=None, window_dtype='uint8', extractor='pil',
+                              neighborhood='overlap', max_neighbors=None):
         """
         Initialize and ingest the db from the inputs
         :param img_dir: Image directory
@@ -290,11 +415,36 @@ class ImageDB:
         :param warped_size: Size to warp to
         :param partition: Partition if training
         :param expansion_delta: Neighborhood expansion parameter
-        :return: DB Session, database statistics (IngestObjs object)
+        :param store_path: Optional directory to save the store to and memory map it from. If it already holds a store built with
+                           the same parameters, that store is reused and nothing is ingested, otherwise it is rebuilt.
+        :param window_dtype: storage dtype of the windows, see ArrayStore
+        :param extractor: window extractor, see unpack_page
+        :param neighborhood: neighborhood policy, see compute_neighborhoods
+        :param max_neighbors: hard cap on the neighborhood size, None for no cap
+        :return: ArrayStore, database statistics (IngestObjs object)
         """
-        session = ImageDB.build()
-        ingest_objs = db_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, session)
-        compute_neighborhoods(session, partition, expansion_delta)
-        session.commit()
-        return session, ingest_objs
+        params = store_params(img_dir, proposal_dir, xml_dir, warped_size, partition, expansion_delta, window_dtype, extractor,
+                              neighborhood, max_neighbors)
+        if ArrayStore.exists(store_path) and ArrayStore.saved_params(store_path) != params:
+            print(f'Rebuilding the store at {store_path}, it was built with different parameters')
+            ArrayStore.invalidate(store_path)
+        if ArrayStore.exists(store_path):
+            store = ArrayStore.load(store_path)
+            with open(os.path.join(store_path, 'ingest_objs.json')) as rf:
+                ingest_objs = json.load(rf)
+            # class_stats is stored as pairs since labels may be None
+            ingest_objs['class_stats'] = {label: count for label, count in ingest_objs['class_stats']}
+            ingest_objs = IngestObjs(**ingest_objs)
+            return store, ingest_objs
+        store = ImageDB.build(window_dtype)
+        ingest_objs = db_ingest(img_dir, proposal_dir, xml_dir, warped_size, partition, store, extractor=extractor)
+        store.finalize()
+        compute_neighborhoods(store, partition, expansion_delta, policy=neighborhood, max_neighbors=max_neighbors)
+        if store_path is not None:
+            # ingest_objs.json goes first, the store only exists once its meta.json is written
+            os.makedirs(store_path, exist_ok=True)
+            write_json(os.path.join(store_path, 'ingest_objs.json'),
+                       dict(ingest_objs._asdict(), class_stats=list(ingest_objs.class_stats.items())))
+            store.finalize(store_path, params=params)
+        return store, ingest_objs
 
@@ -0,0 +1,156 @@
+"""
+Neighborhood construction over the proposal boxes of a page.
+With the overlap policy a proposal's neighbors are the other proposals on
+its page overlapping its box expanded by the expansion delta, the same test
+as calculate_iou > 0. Candidates are found with a sweep over the left edges:
+the boxes starting inside the expanded box's x range are a slice of the
+boxes sorted by left edge, and the boxes starting left of it but still open
+at its left edge are an active set kept with a heap on the right edges. Only
+boxes whose x range overlaps the expanded box are tested, so the work of a
+page grows with its overlaps instead of with the square of its proposals.
+The knn and sector_knn policies pick the nearest proposals by center
+distance instead, and every policy can be capped at MAX_NEIGHBORS.
+"""
+import heapq
+from collections import namedtuple
+import numpy as np
+
+NEIGHBORHOOD_POLICIES = ('overlap', 'knn', 'sector_knn')
+NeighborhoodStats = namedtuple('NeighborhoodStats', ['nexamples', 'nneighbors', 'mean', 'median', 'max', 'isolated', 'ntested'])
+
+
+def expand_boxes(bboxes, expansion_delta, orig_size=1920):
+    """
+    :param bboxes: [N x 4] (x1, y1, x2, y2) boxes
+    :param expansion_delta: Neighborhood expansion parameter
+    :param orig_size: original size of the image
+    :return: [N x 4] expanded boxes clipped to the page
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    expanded = np.empty_like(bboxes)
+    expanded[:, :2] = np.maximum(0, bboxes[:, :2] - expansion_delta)
+    expanded[:, 2:] = np.minimum(orig_size, bboxes[:, 2:] + expansion_delta)
+    return expanded
+
+
+def overlap_candidates(bboxes, expanded):
+    """
+    Boxes whose x range overlaps the x range of each expanded box
+    :param bboxes: [N x 4] (x1, y1, x2, y2) boxes
+    :param expanded: [N x 4] query boxes
+    :return: list of N candidate arrays (unsorted), all boxes with x1 < query x2 and x2 > query x1
+    """
+    x1, x2 = bboxes[:, 0], bboxes[:, 2]
+    order = np.argsort(x1, kind='stable')
+    sorted_x1 = x1[order]
+    # Boxes starting in [query x1, query x2)
+    starts = np.searchsorted(sorted_x1, expanded[:, 0], side='left')
+    ends = np.searchsorted(sorted_x1, expanded[:, 2], side='left')
+    cands = [None] * len(bboxes)
+    # Boxes starting left of query x1 that are still open there, swept in query x1 order
+    active = set()
+    closing = []
+    added = 0
+    for i in np.argsort(expanded[:, 0], kind='stable'):
+        qx1 = expanded[i, 0]
+        while added < starts[i]:
+            j = int(order[added])
+            active.add(j)
+            heapq.heappush(closing, (x2[j], j))
+            added += 1
+        while closing and closing[0][0] <= qx1:
+            active.discard(heapq.heappop(closing)[1])
+        open_left = np.fromiter(active, dtype=np.int64, count=len(active))
+        cands[i] = np.concatenate((open_left, order[starts[i]:max(starts[i], ends[i])]))
+    return cands
+
+
+def _nearest(cand, dists, k):
+    """
+    :return: the k candidates with the smallest distances, ties broken by page order
+    """
+    if k is None or cand.shape[0] <= k:
+        return cand
+    keep = np.lexsort((cand, dists))[:k]
+    return cand[keep]
+
+
+def _sector_nearest(cand, dists, angles, k, nsectors):
+    """
+    :return: the nearest candidates of every angular sector, at most k in total
+    """
+    per_sector = 1 if k is None else max(1, k // nsectors)
+    sectors = np.floor((angles + np.pi) / (2 * np.pi / nsectors)).astype(np.int64) % nsectors
+    positions = np.arange(cand.shape[0])
+    kept = np.concatenate([_nearest(positions[sectors == sector], dists[sectors == sector], per_sector) for sector in range(nsectors)])
+    return cand[_nearest(kept, dists[kept], k)]
+
+
+def page_neighborhoods(bboxes, expansion_delta, orig_size=1920, policy='overlap', max_neighbors=None, nsectors=8):
+    """
+    Neighborhoods of the proposals on one page
+    :param bboxes: [N x 4] (x1, y1, x2, y2) boxes
+    :param expansion_delta: Neighborhood expansion parameter
+    :param orig_size: original size of the image
+    :param policy: 'overlap' for every proposal overlapping the expanded box, 'knn' for the nearest proposals by
+                   center distance, 'sector_knn' for the nearest proposals in each of nsectors angular sectors
+    :param max_neighbors: hard cap on the neighborhood size, the nearest proposals by center distance are kept
+    :param nsectors: number of angular sectors for 'sector_knn'
+    :return: CSR (neighbor_ptr [N+1], neighbor_idx) with neighbors in page order, number of pairs tested
+    """
+    if policy not in NEIGHBORHOOD_POLICIES:
+        raise ValueError(f'Unknown neighborhood policy {policy}, expected one of {NEIGHBORHOOD_POLICIES}')
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    n = bboxes.shape[0]
+    expanded = expand_boxes(bboxes, expansion_delta, orig_size)
+    x1, y1, x2, y2 = bboxes.T
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    cands = overlap_candidates(bboxes, expanded) if policy == 'overlap' else None
+    # Boxes with no area never have a positive overlap
+    valid = (x2 > x1) & (y2 > y1)
+    everyone = np.arange(n)
+    neighbor_lists = []
+    ntested = 0
+    for i in range(n):
+        if policy == 'overlap':
+            ex1, ey1, ex2, ey2 = expanded[i]
+            if ex2 <= ex1 or ey2 <= ey1:
+                neighbor_lists.append(np.zeros(0, dtype=np.int64))
+                continue
+            cand = cands[i]
+            ntested += cand.shape[0]
+            cand = np.sort(cand[(x2[cand] > ex1) & (y1[cand] < ey2) & (y2[cand] > ey1) & valid[cand] & (cand != i)])
+        else:
+            cand = everyone[everyone != i]
+            ntested += cand.shape[0]
+        dx, dy = cx[cand] - cx[i], cy[cand] - cy[i]
+        dists = np.hypot(dx, dy)
+        if policy == 'sector_knn':
+            kept = _sector_nearest(cand, dists, np.arctan2(dy, dx), max_neighbors, nsectors)
+        else:
+            kept = _nearest(cand, dists, max_neighbors)
+        neighbor_lists.append(np.sort(kept))
+    neighbor_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(hits) for hits in neighbor_lists], out=neighbor_ptr[1:])
+    neighbor_idx = np.concatenate(neighbor_lists).astype(np.int64) if n > 0 else np.zeros(0, dtype=np.int64)
+    return neighbor_ptr, neighbor_idx, ntested
+
+
+def neighborhood_stats(neighbor_ptr, rows, ntested=0):
+    """
+    :param neighbor_ptr: CSR row pointer
+    :param rows: rows the neighborhoods were computed for
+    :param ntested: number of candidate pairs tested
+    :return: NeighborhoodStats
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    sizes = neighbor_ptr[rows + 1] - neighbor_ptr[rows] if rows.shape[0] > 0 else np.zeros(0, dtype=np.int64)
+    if sizes.shape[0] == 0:
+        return NeighborhoodStats(0, 0, 0.0, 0.0, 0, 0, ntested)
+    return NeighborhoodStats(nexamples=int(sizes.shape[0]),
+                             nneighbors=int(sizes.sum()),
+                             mean=float(sizes.mean()),
+                             median=float(np.median(sizes)),
+                             max=int(sizes.max()),
+                             isolated=int((sizes == 0).sum()),
+                             ntested=int(ntested))
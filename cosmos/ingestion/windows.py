@@ -0,0 +1,75 @@
+"""
+Batched proposal window extraction.
+The page is converted to a tensor once and every proposal is cropped and
+warped to [3 x W x W] by bilinear sampling in grid_sample calls. Proposals
+much larger than the window are supersampled and averaged, which stands in
+for the antialiasing PIL applies when downscaling.
+"""
+import inspect
+import math
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+# grid_sample takes align_corners from torch 1.3, where it defaults to False. Earlier versions behave as True.
+_GRID_KWARGS = {'align_corners': True} if 'align_corners' in inspect.signature(F.grid_sample).parameters else {}
+
+
+def page_tensor(img):
+    """
+    :param img: PIL image
+    :return: [1 x 3 x H x W] float tensor of 0-255 pixel values
+    """
+    arr = np.asarray(img.convert('RGB'), dtype=np.float32)
+    return torch.from_numpy(arr).permute(2, 0, 1).unsqueeze(0).contiguous()
+
+
+def _sample_grid(boxes, out_size, page_h, page_w):
+    """
+    Sampling grid of out_size x out_size pixel centers inside each box, normalized for grid_sample
+    """
+    n = boxes.shape[0]
+    steps = (torch.arange(out_size, dtype=torch.float32) + 0.5) / out_size
+    x1, y1, x2, y2 = [boxes[:, i:i + 1] for i in range(4)]
+    xs = x1 + steps.unsqueeze(0) * (x2 - x1) - 0.5
+    ys = y1 + steps.unsqueeze(0) * (y2 - y1) - 0.5
+    xs = xs * 2 / max(page_w - 1, 1) - 1
+    ys = ys * 2 / max(page_h - 1, 1) - 1
+    grid = torch.empty(n, out_size, out_size, 2)
+    grid[..., 0] = xs.unsqueeze(1).expand(n, out_size, out_size)
+    grid[..., 1] = ys.unsqueeze(2).expand(n, out_size, out_size)
+    return grid
+
+
+def extract_windows(img, proposals, warped_size, max_supersample=4, max_pixels=2 ** 26):
+    """
+    Crop and warp every proposal of a page
+    :param img: PIL image or [1 x 3 x H x W] tensor from page_tensor
+    :param proposals: [N x 4] (x1, y1, x2, y2) integer proposal boxes, as used for PIL crop
+    :param warped_size: output window size
+    :param max_supersample: cap on the samples per output pixel along each axis
+    :param max_pixels: cap on sampled values per grid_sample call
+    :return: [N x 3 x W x W] uint8 tensor
+    """
+    page = img if torch.is_tensor(img) else page_tensor(img)
+    _, _, page_h, page_w = page.shape
+    boxes = torch.as_tensor(np.asarray(proposals, dtype=np.float32).reshape(-1, 4))
+    n = boxes.shape[0]
+    windows = torch.zeros(n, 3, warped_size, warped_size, dtype=torch.uint8)
+    if n == 0:
+        return windows
+    # Downscaled boxes are sampled factor x factor times per output pixel and averaged
+    scale = torch.max(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) / warped_size
+    factors = scale.ceil().clamp(1, max_supersample).long()
+    for factor in factors.unique().tolist():
+        idxs = (factors == factor).nonzero().reshape(-1)
+        out_size = warped_size * factor
+        per_call = max(1, max_pixels // (3 * out_size * out_size))
+        for start in range(0, idxs.shape[0], per_call):
+            chunk = idxs[start:start + per_call]
+            grid = _sample_grid(boxes[chunk], out_size, page_h, page_w)
+            sampled = F.grid_sample(page.expand(chunk.shape[0], -1, -1, -1), grid, mode='bilinear', padding_mode='zeros', **_GRID_KWARGS)
+            if factor > 1:
+                sampled = F.avg_pool2d(sampled, factor)
+            windows[chunk] = sampled.round().clamp(0, 255).to(torch.uint8)
+    return windows
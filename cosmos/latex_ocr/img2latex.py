@@ -15,16 +15,78 @@ from model.utils.text import Vocab
 from model.utils.image import (
     greyscale,
     crop_image,
+    crop_pil,
     pad_image,
+    pad_pil,
     downsample_image,
+    downsample_pil,
     TIMEOUT,
 )
+import numpy as np
 from imgaug import augmenters as iaa
 import os
 import click
 import tensorflow as tf
 
 
+BUCKETS = [
+    [240, 100],
+    [320, 80],
+    [400, 80],
+    [400, 100],
+    [480, 80],
+    [480, 100],
+    [560, 80],
+    [560, 100],
+    [640, 80],
+    [640, 100],
+    [720, 80],
+    [720, 100],
+    [720, 120],
+    [720, 200],
+    [800, 100],
+    [800, 320],
+    [1000, 200],
+    [1000, 400],
+    [1200, 200],
+    [1600, 200],
+    [1600, 1600],
+]
+
+
+def preprocess_image(
+    img,
+    downsample_image_ratio=1,
+    cropping=False,
+    padding=False,
+    img_augment=None,
+    gray_scale=True,
+):
+    """
+    Crop, pad to a bucket, downsample and greyscale an equation image in memory,
+    with the same operations as the file based pipeline
+    :param img: input equation PIL image
+    :param downsample_image_ratio: down sampling ratio
+    :param cropping: whether to crop
+    :param padding: whether to pad
+    :param img_augment: img augmentation filter
+    :param gray_scale: whether to gray scale
+    :return: model input array, processed img array
+    """
+    if cropping:
+        img, _ = crop_pil(img)
+    if padding:
+        img = pad_pil(img, buckets=BUCKETS)
+    img = downsample_pil(img, downsample_image_ratio)
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    img = np.array(img)
+    if img_augment:
+        img = img_augment.augment_image(img)
+    last = greyscale(img) if gray_scale else img
+    return last, img
+
+
 def img2latex(
     model,
     img,
@@ -46,69 +108,59 @@ def img2latex(
     :return: latex prediction, processed img, processed img location
     """
     dir_output = "tmp/"
-    run(["mkdir -p tmp"], TIMEOUT)
+    os.makedirs(dir_output, exist_ok=True)
     name = str(uuid.uuid4())
-    img_path = os.path.join("tmp/", f"{name}.png")
-    img.save(img_path)
-    buckets = [
-        [240, 100],
-        [320, 80],
-        [400, 80],
-        [400, 100],
-        [480, 80],
-        [480, 100],
-        [560, 80],
-        [560, 100],
-        [640, 80],
-        [640, 100],
-        [720, 80],
-        [720, 100],
-        [720, 120],
-        [720, 200],
-        [800, 100],
-        [800, 320],
-        [1000, 200],
-        [1000, 400],
-        [1200, 200],
-        [1600, 200],
-        [1600, 1600],
-    ]
-
     img_path_tmp = dir_output + "{}.png".format(name)
-
-    if cropping:
-        crop_image(img_path, img_path_tmp)
-
-    if padding:
-        pad_image(img_path_tmp if cropping else img_path, img_path_tmp, buckets=buckets)
-
-    if downsample_image_ratio != 1:
-        if cropping or padding:
-            downsample_image(img_path_tmp, img_path_tmp, ratio=downsample_image_ratio)
-        else:
-            downsample_image(img_path, img_path_tmp, ratio=downsample_image_ratio)
-
-    if cropping or padding or downsample_image_ratio != 1:
-        img = imread(img_path_tmp)
-    else:
-        img = imread(img_path)
-
-    if img_augment:
-        img = img_augment.augment_image(img)
-
-    img_obj = Image.fromarray(img)
-    img_obj.save(img_path_tmp)
-
-    if gray_scale:
-        last = greyscale(img)
-    else:
-        last = img
+    last, img = preprocess_image(img, downsample_image_ratio, cropping, padding, img_augment, gray_scale)
+    Image.fromarray(img).save(img_path_tmp)
 
     hyps = model.predict(last)
 
     return hyps[0], img, os.path.abspath(img_path_tmp)
 
 
+def img2latex_batch(
+    model,
+    imgs,
+    downsample_image_ratio=1,
+    cropping=False,
+    padding=False,
+    img_augment=None,
+    gray_scale=True,
+    max_batch=32,
+):
+    """
+    Predict latex codes for a list of equation images without temporary files.
+    Images are preprocessed in memory, grouped by their padded size and each group
+    is decoded in predict_batch calls of at most max_batch images.
+    :param model: model to be used
+    :param imgs: list of input equation images
+    :param downsample_image_ratio: down sampling ratio
+    :param cropping: whether to crop
+    :param padding: whether to pad
+    :param img_augment: img augmentation filter
+    :param gray_scale: whether to gray scale
+    :param max_batch: maximum images per session run
+    :return: list of latex predictions, in the order of imgs
+    """
+    inputs = [
+        preprocess_image(img, downsample_image_ratio, cropping, padding, img_augment, gray_scale)[0]
+        for img in imgs
+    ]
+    groups = {}
+    for idx, arr in enumerate(inputs):
+        groups.setdefault(arr.shape, []).append(idx)
+    hyps = [None] * len(inputs)
+    for idxs in groups.values():
+        for start in range(0, len(idxs), max_batch):
+            chunk = idxs[start:start + max_batch]
+            # the first hypothesis list holds the best (or greedy) decoding of every image
+            preds = model.predict_batch([inputs[idx] for idx in chunk])[0]
+            for idx, pred in zip(chunk, preds):
+                hyps[idx] = pred
+    return hyps
+
+
 def pdf2latex(model, pdf_path):
     """
     Make prediction for PDF
@@ -116,29 +168,7 @@ def pdf2latex(model, pdf_path):
     :param pdf_path: PDF location
     :return:
     """
-    buckets = [
-        [240, 100],
-        [320, 80],
-        [400, 80],
-        [400, 100],
-        [480, 80],
-        [480, 100],
-        [560, 80],
-        [560, 100],
-        [640, 80],
-        [640, 100],
-        [720, 80],
-        [720, 100],
-        [720, 120],
-        [720, 200],
-        [800, 100],
-        [800, 320],
-        [1000, 200],
-        [1000, 400],
-        [1200, 200],
-        [1600, 200],
-        [1600, 1600],
-    ]
+    buckets = BUCKETS
 
     dir_output = "tmp/"
     name = pdf_path.split("/")[-1].split(".")[0]
@@ -326,6 +356,30 @@ def img2latex_api(model, img, downsample_image_ratio, cropping, padding, gray_sc
     return processed_latex
 
 
+def img2latex_batch_api(model, imgs, downsample_image_ratio, cropping, padding, gray_scale):
+    """
+       Predict latex codes for a list of equation images, see img2latex_batch.
+       :param model: model to be used
+       :param imgs: list of input equation images
+       :param downsample_image_ratio: down sampling ratio
+       :param cropping: whether to crop
+       :param padding: whether to pad
+       :param gray_scale:whether to gray scale
+       :return: list of processed latex predictions
+   """
+    seq = iaa.Sequential([iaa.GammaContrast(2)])
+    latex = img2latex_batch(
+        model,
+        imgs,
+        downsample_image_ratio=downsample_image_ratio,
+        cropping=cropping,
+        padding=padding,
+        img_augment=seq,
+        gray_scale=gray_scale,
+    )
+    return [postprocess(l) for l in latex]
+
+
 # downsample_image_ratio=1, cropping=False, padding=False, img_augment=None, gray_scale=True
 @click.command()
 @click.option("--downsample_image_ratio", default=2, help="Ratio to down sampling")
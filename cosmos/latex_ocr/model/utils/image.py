@@ -64,23 +64,37 @@ def downsample(state):
     return state[::2, ::2, :]
 
 
-def pad_image(img, output_path, pad_size=[8,8,8,8], buckets=None):
-    """Pads image with pad size and with buckets
+def pad_pil(old_im, pad_size=[8,8,8,8], buckets=None):
+    """Pads an image in memory with pad size and with buckets
 
     Args:
-        img: (string) path to image
-        output_path: (string) path to output image
+        old_im: PIL image
         pad_size: list of 4 ints
         buckets: ascending ordered list of sizes, [(width, height), ...]
 
+    Returns:
+        new RGB PIL image
+
     """
     top, left, bottom, right = pad_size
-    old_im = Image.open(img)
     old_size = (old_im.size[0] + left + right, old_im.size[1] + top + bottom)
     new_size = get_new_size(old_size, buckets)
     new_im = Image.new("RGB", new_size, (255,255,255))
     new_im.paste(old_im, (left, top))
-    new_im.save(output_path)
+    return new_im
+
+
+def pad_image(img, output_path, pad_size=[8,8,8,8], buckets=None):
+    """Pads image with pad size and with buckets
+
+    Args:
+        img: (string) path to image
+        output_path: (string) path to output image
+        pad_size: list of 4 ints
+        buckets: ascending ordered list of sizes, [(width, height), ...]
+
+    """
+    pad_pil(Image.open(img), pad_size, buckets).save(output_path)
 
 
 def get_new_size(old_size, buckets):
@@ -106,28 +120,49 @@ def get_new_size(old_size, buckets):
         return old_size
 
 
-def crop_image(img, output_path):
-    """Crops image to content
+def crop_pil(old_im):
+    """Crops an image in memory to content
 
     Args:
-        img: (string) path to image
-        output_path: (string) path to output image
+        old_im: PIL image
+
+    Returns:
+        greyscale (mode L) PIL image, True if there was content to crop to
 
     """
-    old_im = Image.open(img).convert('L')
+    old_im = old_im.convert('L')
     img_data = np.asarray(old_im, dtype=np.uint8) # height, width
     nnz_inds = np.where(img_data!=255)
     if len(nnz_inds[0]) == 0:
-        old_im.save(output_path)
-        return False
+        return old_im, False
 
     y_min = np.min(nnz_inds[0])
     y_max = np.max(nnz_inds[0])
     x_min = np.min(nnz_inds[1])
     x_max = np.max(nnz_inds[1])
-    old_im = old_im.crop((x_min, y_min, x_max+1, y_max+1))
-    old_im.save(output_path)
-    return True
+    return old_im.crop((x_min, y_min, x_max+1, y_max+1)), True
+
+
+def crop_image(img, output_path):
+    """Crops image to content
+
+    Args:
+        img: (string) path to image
+        output_path: (string) path to output image
+
+    """
+    new_im, cropped = crop_pil(Image.open(img))
+    new_im.save(output_path)
+    return cropped
+
+
+def downsample_pil(old_im, ratio=2):
+    """Downsample an image in memory by ratio"""
+    if ratio == 1:
+        return old_im
+    old_size = old_im.size
+    new_size = (int(old_size[0]/ratio), int(old_size[1]/ratio))
+    return old_im.resize(new_size, PIL.Image.LANCZOS)
 
 
 def downsample_image(img, output_path, ratio=2):
@@ -135,12 +170,7 @@ def downsample_image(img, output_path, ratio=2):
     # assert ratio>=1, ratio
     if ratio == 1:
         return True
-    old_im = Image.open(img)
-    old_size = old_im.size
-    new_size = (int(old_size[0]/ratio), int(old_size[1]/ratio))
-
-    new_im = old_im.resize(new_size, PIL.Image.LANCZOS)
-    new_im.save(output_path)
+    downsample_pil(Image.open(img), ratio).save(output_path)
     return True
 
 
@@ -0,0 +1,153 @@
+"""
+Spatial index and union-find used to group regions of a page.
+Boxes are (x1, y1, x2, y2). Two boxes overlap when their intersection has
+positive area, which is when calculate_iou of the boxes is positive.
+BoxIndex packs the boxes into leaves once, sort-tile-recursive style: boxes
+are cut into vertical slices by left edge and every slice into runs of about
+sqrt(N) boxes by top edge. An overlap query tests the bounding boxes of the
+leaves and then only the boxes of the leaves it hits, both with numpy, so the
+boxes far from the query on either side and on either axis are never tested.
+"""
+import math
+import numpy as np
+
+
+def union_box(box1, box2):
+    return [min(box1[0], box2[0]), min(box1[1], box2[1]), max(box1[2], box2[2]), max(box1[3], box2[3])]
+
+
+class BoxIndex:
+    """
+    Overlap queries over a fixed set of boxes
+    """
+    def __init__(self, boxes):
+        """
+        :param boxes: list of (x1, y1, x2, y2)
+        """
+        self.boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        n = len(self.boxes)
+        leaf_size = max(8, math.ceil(math.sqrt(n)))
+        slice_size = leaf_size * max(1, math.ceil(math.sqrt(n / leaf_size)))
+        # Vertical slices by left edge, each sorted by top edge
+        self.order = np.argsort(self.boxes[:, 0], kind='stable')
+        for s in range(0, n, slice_size):
+            run = self.order[s:s + slice_size]
+            self.order[s:s + slice_size] = run[np.argsort(self.boxes[run, 1], kind='stable')]
+        # Leaves are runs of leaf_size boxes of a slice, the last run of a slice may be shorter
+        leaves = [(s + i, min(s + i + leaf_size, s + slice_size, n))
+                  for s in range(0, n, slice_size) for i in range(0, min(slice_size, n - s), leaf_size)]
+        self.leaf_starts = np.array([start for start, _ in leaves], dtype=np.int64)
+        self.leaf_ends = np.array([end for _, end in leaves], dtype=np.int64)
+        packed = self.boxes[self.order]
+        self.leaf_boxes = np.zeros((0, 4))
+        if n:
+            self.leaf_boxes = np.stack([np.minimum.reduceat(packed[:, 0], self.leaf_starts),
+                                        np.minimum.reduceat(packed[:, 1], self.leaf_starts),
+                                        np.maximum.reduceat(packed[:, 2], self.leaf_starts),
+                                        np.maximum.reduceat(packed[:, 3], self.leaf_starts)], axis=1)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    @staticmethod
+    def _hits(boxes, box):
+        return (boxes[:, 0] < box[2]) & (boxes[:, 2] > box[0]) & (boxes[:, 1] < box[3]) & (boxes[:, 3] > box[1])
+
+    def _candidates(self, box):
+        # A box overlapping the query lies in a leaf whose bounding box overlaps the query
+        leaves = np.flatnonzero(self._hits(self.leaf_boxes, box))
+        if len(leaves) == 0:
+            return leaves
+        if len(leaves) == 1:
+            cand = self.order[self.leaf_starts[leaves[0]]:self.leaf_ends[leaves[0]]]
+        else:
+            cand = np.concatenate([self.order[self.leaf_starts[i]:self.leaf_ends[i]] for i in leaves])
+        return cand[self._hits(self.boxes[cand], box)]
+
+    def any_overlap(self, box):
+        """
+        :param box: query box
+        :return: True if any indexed box overlaps the query box
+        """
+        return len(self._candidates(box)) > 0
+
+    def overlapping(self, box):
+        """
+        :param box: query box
+        :return: sorted positions of the indexed boxes overlapping the query box
+        """
+        return np.sort(self._candidates(box))
+
+
+class ColumnIndex(BoxIndex):
+    """
+    BoxIndex that also answers whether every box shares a strip of columns with a query box
+    """
+    def __init__(self, boxes):
+        super().__init__(boxes)
+        if len(self.boxes):
+            self.max_x1 = self.boxes[:, 0].max()
+            self.min_x2 = self.boxes[:, 2].min()
+            self.min_width = (self.boxes[:, 2] - self.boxes[:, 0]).min()
+
+    def all_share_columns(self, box):
+        """
+        :param box: query box
+        :return: True if every indexed box has a horizontal intersection of positive width with the query box
+        """
+        if not len(self.boxes):
+            return True
+        return box[2] > box[0] and self.min_width > 0 and self.min_x2 > box[0] and box[2] > self.max_x1
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        """
+        :return: True if i and j were in different sets
+        """
+        ri, rj = self.find(i), self.find(j)
+        if ri == rj:
+            return False
+        # The smaller index stays the root, so groups keep the position of their first member
+        if rj < ri:
+            ri, rj = rj, ri
+        self.parent[rj] = ri
+        return True
+
+
+def merge_overlapping(nbhds):
+    """
+    Merge overlapping boxes into their bounding box until no two boxes overlap
+    :param nbhds: list of (box, score)
+    :return: list of (box, score), one per group in the order of the group's first box, with the group's max score
+    """
+    nbhds = [(list(box), scr) for box, scr in nbhds]
+    while True:
+        index = BoxIndex([box for box, _ in nbhds])
+        uf = UnionFind(len(nbhds))
+        merged = False
+        for i, (box, _) in enumerate(nbhds):
+            for j in index.overlapping(box):
+                if j > i:
+                    merged |= uf.union(i, int(j))
+        if not merged:
+            return nbhds
+        groups = {}
+        for i, (box, scr) in enumerate(nbhds):
+            root = uf.find(i)
+            if root in groups:
+                gbox, gscr = groups[root]
+                groups[root] = (union_box(gbox, box), scr if scr >= gscr else gscr)
+            else:
+                groups[root] = (box, scr)
+        # Merged boxes can overlap boxes their members did not, so repeat until stable
+        nbhds = [groups[root] for root in sorted(groups)]
@@ -1,9 +1,11 @@
 from bs4 import BeautifulSoup
+from lxml import etree
 import re
 import os
 import glob
 import codecs
 from evaluate.evaluate import calculate_iou
+from postprocess.grouping import BoxIndex, ColumnIndex, union_box, merge_overlapping
 
 def not_ocr(text):
     """
@@ -17,6 +19,73 @@ def not_ocr(text):
     """
     return 'ocr' not in text and 'rawtext' not in text and 'unicode' not in text
 
+FIGURE_CAPTION_PATTERN = re.compile(r'^(figure|fig)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', flags=re.IGNORECASE|re.MULTILINE)
+TABLE_CAPTION_PATTERN = re.compile(r'^(table|tbl|tab)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', flags=re.IGNORECASE|re.MULTILINE)
+# The first div with class hocr after the start of an element, in document order
+NEXT_HOCR_XPATH = etree.XPath("(descendant::div | following::div)[contains(concat(' ', normalize-space(@class), ' '), ' hocr ')][1]")
+OCR_LINE_XPATH = etree.XPath(".//span[contains(concat(' ', normalize-space(@class), ' '), ' ocr_line ')]")
+
+
+def is_segment_class(cls):
+    """
+    Match a class attribute the way soup.find_all('div', not_ocr) does: any single class or the whole value
+    :param cls: class attribute value
+    :return: True for region divs
+    """
+    return any(not_ocr(c) for c in cls.split()) or not_ocr(' '.join(cls.split()))
+
+
+def segment_divs(root):
+    """
+    lxml counterpart of soup.find_all('div', not_ocr)
+    :param root: lxml html tree
+    :return: list of region div elements, in document order
+    """
+    return [d for d in root.iter('div') if d.get('class') is not None and is_segment_class(d.get('class'))]
+
+
+def next_hocr(seg):
+    """
+    lxml counterpart of seg.find_next('div', 'hocr')
+    :param seg: region div element
+    :return: hocr div element or None
+    """
+    found = NEXT_HOCR_XPATH(seg)
+    return found[0] if found else None
+
+
+def caption_class(line_text, seg_class):
+    """
+    Caption class implied by the first OCR line of a region
+    :param line_text: text of the first ocr_line
+    :param seg_class: current class of the region
+    :return: new class, or None to keep the current one
+    """
+    clean_line = line_text.strip().replace('\n', ' ').replace('  ', ' ').lower()
+    new_class = None
+    if len(FIGURE_CAPTION_PATTERN.findall(clean_line)) > 0:
+        new_class = "Figure Caption"
+    if len(TABLE_CAPTION_PATTERN.findall(clean_line)) > 0 and seg_class != 'Table':
+        new_class = "Table Caption"
+    return new_class
+
+
+def check_caption_body_lxml(root):
+    """
+    lxml counterpart of check_caption_body, updates the tree in place
+    :param root: lxml html tree of the page
+    :return: root
+    """
+    for seg_type in segment_divs(root):
+        seg_class = ' '.join(seg_type.get('class').split())
+        lines = OCR_LINE_XPATH(seg_type)
+        if len(lines) > 0:
+            new_class = caption_class(''.join(lines[0].itertext()), seg_class)
+            if new_class is not None:
+                seg_type.set('class', new_class)
+    return root
+
+
 def construct_hocr_list(soup):
     """
     Construct a list from the hocr input
@@ -65,13 +134,9 @@ def check_caption_body(soup):
         lines = seg_type.find_all('span', 'ocr_line')
         if len(lines) > 0:
             line = lines[0]
-            clean_line = line.getText().strip().replace('\n', ' ').replace('  ', ' ').lower()
-            matches = re.findall('^(figure|fig)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', clean_line, flags=re.IGNORECASE|re.MULTILINE)
-            if len(matches) >0:
-                seg_type["class"] = "Figure Caption"
-            matches = re.findall('^(table|tbl|tab)(?:\.)? (?:(\d+\w+(?:\.)?)|(\d+))', clean_line, flags=re.IGNORECASE|re.MULTILINE)
-            if len(matches) >0 and seg_class != 'Table':
-                seg_type["class"] = "Table Caption"
+            new_class = caption_class(line.getText(), seg_class)
+            if new_class is not None:
+                seg_type["class"] = new_class
 
     return soup
 
@@ -96,6 +161,8 @@ def group_cls_columnwise(obj_list, g_cls):
     :param obj_list: [(cls, coords, score)] list
     :return: Updated [(cls, coords, score)] list
     """
+    # Same test as check_overlap(obj_list, new_box, check_above_below=True), answered from an index
+    index = ColumnIndex([coords for _, coords, _ in obj_list])
     nbhds = []
     for obj in obj_list:
         cls, coords, scr = obj
@@ -103,21 +170,16 @@ def group_cls_columnwise(obj_list, g_cls):
             if len(nbhds) == 0:
                 nbhds.append((coords, scr))
                 continue
-            new_nbhd_list = []
             added = False
-            for nbhd_bb in nbhds:
-                nbhd_bb, scr2 = nbhd_bb
+            for i, (nbhd_bb, scr2) in enumerate(nbhds):
                 # construct a bounding box over this table and the neighborhood
-                new_box = [min(nbhd_bb[0], coords[0]), min(nbhd_bb[1], coords[1]), max(nbhd_bb[2], coords[2]), max(nbhd_bb[3], coords[3])]
-                if check_overlap(obj_list, new_box, check_above_below=True):
-                    new_nbhd_list.append((new_box, scr if scr >= scr2 else scr2))
+                new_box = union_box(nbhd_bb, coords)
+                if index.all_share_columns(new_box) and not index.any_overlap(new_box):
+                    nbhds[i] = (new_box, scr if scr >= scr2 else scr2)
                     added = True
-                else:
-                    new_nbhd_list.append((nbhd_bb, scr2))
             # If we didn't merge with an existing neighborhood, create a new neighborhood
             if not added:
-                new_nbhd_list.append((coords, scr))
-            nbhds = new_nbhd_list
+                nbhds.append((coords, scr))
     new_obj_list = []
     for obj in obj_list:
         cls, coords, _ = obj
@@ -132,73 +194,44 @@ def group_cls(obj_list, g_cls, do_table_merge=False, merge_over_classes=None):
     Given a list output from xml2list, group the class in that list
     :param obj_list: [(cls, coords, score)] list
     """
+    ccls = [g_cls]
+    if merge_over_classes is not None:
+        ccls.extend(merge_over_classes)
+    # A neighborhood may grow over objects of the classes in ccls, any other object blocks it.
+    # Same test as check_overlap(obj_list, new_box, check_cls=ccls), answered from an index
+    blockers = BoxIndex([coords for cls, coords, _ in obj_list if cls not in ccls])
     nbhds = []
+    # A union over a blocked box is blocked too, so a neighborhood started by a blocked
+    # object never grows and a blocked object never joins one. Only the others are tried.
+    open_nbhds = []
     for obj in obj_list:
         cls, coords, scr = obj
         if cls == g_cls:
-            if len(nbhds) == 0:
+            if blockers.any_overlap(coords):
                 nbhds.append((coords, scr))
                 continue
-            new_nbhd_list = []
             added = False
-            for nbhd_bb in nbhds:
+            for i in open_nbhds:
+                nbhd_bb, scr2 = nbhds[i]
                 # construct a bounding box over this table and the neighborhood
-                nbhd_bb, scr2 = nbhd_bb
-                new_box = [min(nbhd_bb[0], coords[0]), min(nbhd_bb[1], coords[1]), max(nbhd_bb[2], coords[2]), max(nbhd_bb[3], coords[3])]
-                ccls = [g_cls]
-                if merge_over_classes is not None:
-                    ccls.extend(merge_over_classes)
-                if check_overlap(obj_list, new_box, check_cls=ccls):
-                    new_nbhd_list.append((new_box, scr if scr >= scr2 else scr2))
+                new_box = union_box(nbhd_bb, coords)
+                if not blockers.any_overlap(new_box):
+                    nbhds[i] = (new_box, scr if scr >= scr2 else scr2)
                     added = True
-                else:
-                    new_nbhd_list.append((nbhd_bb, scr2))
             # If we didn't merge with an existing neighborhood, create a new neighborhood
             if not added:
-                new_nbhd_list.append((coords, scr))
-            nbhds = new_nbhd_list
+                open_nbhds.append(len(nbhds))
+                nbhds.append((coords, scr))
     if do_table_merge:
-        while True:
-            new_nbhds = []
-            merged_nbhds = []
-            # Now we check for intersecting table neighborhoods
-            for nbhd in nbhds:
-                nbhd, scr = nbhd
-                for nbhd2 in nbhds:
-                    nbhd2, scr2 = nbhd2
-                    if nbhd2 == nbhd:
-                        continue
-                    iou = calculate_iou(nbhd, nbhd2)
-                    if iou > 0:
-                        # merge the neighborhoods
-                        new_box = [min(nbhd[0], nbhd2[0]), min(nbhd[1], nbhd2[1]), max(nbhd[2], nbhd2[2]), max(nbhd[3], nbhd2[3])]
-                        if new_box in new_nbhds:
-                            continue
-                        merged_nbhds.append(nbhd)
-                        merged_nbhds.append(nbhd2)
-                        new_nbhds.append((new_box, scr if scr >= scr2 else scr2))
-            for nbhd in nbhds:
-                nbhd, scr = nbhd
-                if nbhd not in merged_nbhds:
-                    new_nbhds.append((nbhd, scr))
-            if new_nbhds == nbhds:
-                break
-            nbhds = new_nbhds
-
-    filter_objs = []
+        # Now we merge intersecting table neighborhoods
+        nbhds = merge_overlapping(nbhds)
+
     # now we need to check for other overlaps
-    for nbhd in nbhds:
-        nbhd, scr = nbhd
-        for obj in obj_list:
-            cls, coords, _ = obj
-            obj_iou = calculate_iou(coords, nbhd)
-            if obj_iou > 0:
-                filter_objs.append(obj)
-    obj_list = [o for o in obj_list if o not in filter_objs]
+    nbhd_index = BoxIndex([nbhd for nbhd, _ in nbhds])
     new_obj_list = []
     for obj in obj_list:
         cls, coords, _ = obj
-        if cls != g_cls:
+        if cls != g_cls and not nbhd_index.any_overlap(coords):
             new_obj_list.append(obj)
     for nbhd in nbhds:
         nbhd, scr = nbhd
@@ -0,0 +1,127 @@
+"""
+Single parse post-processing of the page html.
+Each page is parsed once with lxml, the caption correction is applied to the
+tree and the same tree is written as the corrected html and as the page's
+VOC xml. Pages run across a worker pool and the timings of every page are
+written to a csv, optionally next to the time of the BeautifulSoup path
+(parse, correct and write the html, then parse it again for the xml).
+"""
+import codecs
+import csv
+import glob
+import multiprocessing as mp
+import os
+import tempfile
+from timeit import default_timer as timer
+import click
+from bs4 import BeautifulSoup
+from lxml import html as lxml_html
+from postprocess.postprocess import check_caption_body, check_caption_body_lxml
+from converters.html2xml import tree2xml, htmlfile2xml
+
+STAT_FIELDS = ['page', 'parse_s', 'correct_s', 'write_html_s', 'write_xml_s', 'total_s', 'bs4_s']
+HTML_PARSER = lxml_html.HTMLParser(encoding='utf-8')
+
+
+def bs4_page(html_f, output_path, xml_path):
+    """
+    The BeautifulSoup path: correct the page, write it, and parse the written page again for the xml
+    :param html_f: page html
+    :param output_path: directory for the corrected html
+    :param xml_path: directory for the xml
+    """
+    out_f = os.path.join(output_path, os.path.basename(html_f))
+    with codecs.open(out_f, "w", "utf-8") as fout:
+        with codecs.open(html_f, "r", "utf-8") as fin:
+            soup = BeautifulSoup(fin, 'html.parser')
+            fout.write(str(check_caption_body(soup)))
+    htmlfile2xml(out_f, xml_path)
+
+
+def postprocess_page(html_f, output_path, xml_path, compare=False):
+    """
+    :param html_f: page html
+    :param output_path: directory for the corrected html
+    :param xml_path: directory for the xml
+    :param compare: also time the BeautifulSoup path, on a scratch directory
+    :return: stat dictionary with the STAT_FIELDS
+    """
+    page_name = os.path.basename(html_f)[:-5]
+    start = timer()
+    tree = lxml_html.parse(html_f, parser=HTML_PARSER)
+    parsed = timer()
+    check_caption_body_lxml(tree.getroot())
+    corrected = timer()
+    tree.write(os.path.join(output_path, os.path.basename(html_f)), method='html', encoding='utf-8')
+    written = timer()
+    tree2xml(tree.getroot(), page_name, xml_path)
+    end = timer()
+    bs4_s = None
+    if compare:
+        with tempfile.TemporaryDirectory() as scratch:
+            bs4_start = timer()
+            bs4_page(html_f, scratch, scratch)
+            bs4_s = timer() - bs4_start
+    return {'page': page_name, 'parse_s': parsed - start, 'correct_s': corrected - parsed,
+            'write_html_s': written - corrected, 'write_xml_s': end - written, 'total_s': end - start, 'bs4_s': bs4_s}
+
+
+def _page_task(task):
+    return postprocess_page(*task)
+
+
+def write_postprocess_stats(stats, output_path):
+    """
+    Write per page post-processing statistics to a csv
+    :param stats: list of stat dictionaries from postprocess_page
+    :param output_path: csv path
+    """
+    with open(output_path, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.DictWriter(fh, fieldnames=STAT_FIELDS)
+        writer.writeheader()
+        writer.writerows(stats)
+
+
+def postprocess_pages(html_path, output_path, xml_path, processes=1, stats_path=None, compare=False):
+    """
+    Post-process every page html of a directory
+    :param html_path: Path to html files
+    :param output_path: Output path for the corrected html
+    :param xml_path: Output path for the xml
+    :param processes: number of worker processes
+    :param stats_path: optional csv to write the per page timings to
+    :param compare: also time the BeautifulSoup path
+    :return: list of stat dictionaries
+    """
+    tasks = [(f, output_path, xml_path, compare) for f in sorted(glob.glob(os.path.join(html_path, "*.html")))]
+    if processes == 1:
+        stats = [_page_task(task) for task in tasks]
+    else:
+        with mp.Pool(processes=processes) as pool:
+            stats = pool.map(_page_task, tasks, chunksize=max(1, len(tasks) // (4 * processes)))
+    if stats_path is not None:
+        write_postprocess_stats(stats, stats_path)
+    total = sum(s['total_s'] for s in stats)
+    print(f"Post-processed {len(stats)} pages in {total:.2f} s of worker time")
+    if compare and stats:
+        print(f"BeautifulSoup path: {sum(s['bs4_s'] for s in stats):.2f} s")
+    return stats
+
+
+@click.command()
+@click.argument('html_dir')
+@click.argument('output_dir')
+@click.argument('xml_dir')
+@click.option('--processes', default=1, help='Number of worker processes')
+@click.option('--compare/--no-compare', default=True, help='Also time the BeautifulSoup path')
+def run_cli(html_dir, output_dir, xml_dir, processes, compare):
+    """
+    Post-process html_dir into output_dir and xml_dir, and write per page timings to output_dir/postprocess_stats.csv
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(xml_dir, exist_ok=True)
+    postprocess_pages(html_dir, output_dir, xml_dir, processes, os.path.join(output_dir, 'postprocess_stats.csv'), compare)
+
+
+if __name__ == '__main__':
+    run_cli()
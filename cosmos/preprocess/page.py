@@ -0,0 +1,99 @@
+"""
+In memory page pipeline.
+A rendered page is decoded once and then resized, segmented into proposals
+and padded as a PIL image inside a single worker. Only the outputs that
+downstream stages read back are written to disk.
+"""
+import os
+from PIL import Image
+from preprocess.preprocess import resize_png, pad_image
+from connected_components.connected_components import write_proposals
+
+
+class Page:
+    """
+    A rendered page held in memory while it moves through preprocessing
+    """
+    def __init__(self, name, image):
+        """
+        :param name: file name of the page, e.g. doc.pdf_1.png
+        :param image: PIL image of the page
+        """
+        self.name = name
+        self.image = image
+        self.proposals = None
+
+    @staticmethod
+    def load(path):
+        """
+        Decode a page from disk
+        :param path: Path to png
+        :return: Page
+        """
+        with Image.open(path) as im:
+            image = im.convert('RGB')
+        return Page(os.path.basename(path), image)
+
+    @property
+    def identifier(self):
+        return os.path.splitext(self.name)[0]
+
+    def resize(self, size=1920):
+        """
+        Resize the page so its longest side is size, see preprocess.resize_png
+        :param size: size to resize to
+        :return: self
+        """
+        _, self.image = resize_png(self.name, image=self.image, size=size)
+        return self
+
+    def propose(self, output_dir, write_annotated=False, **kwargs):
+        """
+        Compute the page proposals and write them to output_dir, see connected_components.write_proposals
+        :param output_dir: Path to proposal directory
+        :param write_annotated: Also write a copy of the page with the proposals drawn on it
+        :param kwargs: extra write_proposals parameters
+        :return: [(tl_x, tl_y, br_x, br_y)] proposals
+        """
+        self.proposals = write_proposals(self.name, output_dir=output_dir, image=self.image,
+                                         write_annotated=write_annotated, **kwargs)
+        return self.proposals
+
+    def padded(self, size=1920):
+        """
+        :param size: size to pad to
+        :return: padded PIL image, the page itself is left unpadded
+        """
+        _, im = pad_image(self.name, image=self.image, size=size)
+        return im
+
+    def save(self, output_dir, image=None):
+        """
+        Write the page (or a derived image of it) to output_dir under the page name
+        :param output_dir: Output directory
+        :param image: optional PIL image to write instead of the page
+        :return: path written
+        """
+        path = os.path.join(output_dir, self.name)
+        (self.image if image is None else image).save(path)
+        return path
+
+
+def process_page(img_path, proposal_dir, image_dir=None, padded_dir=None, write_annotated=False, size=1920):
+    """
+    Run resize, proposals and padding for one rendered page with a single decode
+    :param img_path: Path to the rendered png
+    :param proposal_dir: Path to write the proposal csv to
+    :param image_dir: Directory to write the resized page to, which inference and html conversion read. Defaults to the directory of img_path
+    :param padded_dir: Optional directory to write the padded page to
+    :param write_annotated: Also write a copy of the page with the proposals drawn on it to proposal_dir
+    :param size: size to resize and pad to
+    :return: Page
+    """
+    page = Page.load(img_path)
+    page.resize(size)
+    page.save(os.path.dirname(img_path) if image_dir is None else image_dir)
+    page.propose(proposal_dir, write_annotated=write_annotated)
+    if padded_dir is not None:
+        page.save(padded_dir, image=page.padded(size))
+    return page
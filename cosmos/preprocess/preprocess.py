@@ -55,17 +55,18 @@ def pdf2png(input_dir, tmp_dir):
         call(["./ghost.sh", name, f"{join(input_dir,name)}.pdf", tmp_dir])
 
 
-def resize_png(path, size=1920):
+def resize_png(path, image=None, size=1920):
     """
     Resize the PNG, but do not pad
     :param path: Path to png
+    :param image: optional PIL image object that will be resized instead of opening image at path
     :param size: size to check to
     :return: path to image, Pil.Image
     """
-    im = Image.open(path).convert('RGB')
+    im = Image.open(path).convert('RGB') if image is None else image.convert('RGB')
     w, h = im.size
     if w >= size or h >= size:
-        maxsize = (1920, 1920)
+        maxsize = (size, size)
         im.thumbnail(maxsize, Image.ANTIALIAS)
     else:
         im = resize_image(im, size)
@@ -5,7 +5,7 @@ Script to run an end to end pipeline
 
 from infer.infer import run_inference
 from UnicodeParser.parse_html_to_postgres import parse_html_to_postgres
-from construct_caption_tables.construct import construct
+from construct_caption_tables.construct import construct_all
 import multiprocessing as mp
 from argparse import ArgumentParser
 import torch
@@ -21,12 +21,15 @@ import re
 from converters.model2xml import model2xml
 from converters.xml2list import xml2list
 from converters.list2html import list2html
-from converters.html2xml import htmlfile2xml
-from converters.pdf_extractor import parse_pdf
+from converters.pdf_extractor import extract_tokens
+from converters.token_store import token_path, load_page_tokens
 from tqdm import tqdm
 import shutil
 import preprocess.preprocess as pp
-import postprocess.postprocess as post
+from preprocess.page import process_page
+from preprocess.render import render_pdf, write_render_stats, get_page_sizes, split_page_ranges
+from utils.scheduler import Stage, run_stages, run_serial
+from postprocess.single_parse import postprocess_pages
 from utils.voc_utils import ICDAR_convert
 from connected_components.connected_components import write_proposals
 from proposal_matcher.process import process_doc
@@ -41,9 +44,19 @@ if __name__ == '__main__':
     parser.add_argument("pdfdir", type=str, help="Path to directory of PDFs")
     parser.add_argument('-d', "--device", default='cpu', type=str, help="Path to weights dir")
     parser.add_argument('-w', "--weights", type=str, help='Path to weights file', required=True)
-    parser.add_argument('-t', "--threads", default=160, type=int, help="Number of threads to use")
+    parser.add_argument('-t', "--threads", default=mp.cpu_count(), type=int, help="Number of processes for the html and xml stages")
+    parser.add_argument("--render_workers", default=mp.cpu_count(), type=int, help="Number of concurrent page range renders")
+    parser.add_argument("--page_workers", default=mp.cpu_count(), type=int, help="Number of processes for resize, proposals and padding")
+    parser.add_argument("--pages_per_range", default=8, type=int, help="Pages rendered per task, large PDFs are split into ranges of this size")
     parser.add_argument('-n', "--noingest", help="Ingest html documents and create postgres database", action='store_true')
+    parser.add_argument("--incremental", help="Add the documents to the existing cosmos database instead of recreating it, skipping documents ingested before", action='store_true')
     parser.add_argument('-k', "--keep_pages", help="Keep the page-level PNGs", action='store_true')
+    parser.add_argument("--keep_padded", help="Also write the padded page-level PNGs", action='store_true')
+    parser.add_argument("--render_backend", default='auto', choices=['auto', 'ghostscript', 'mupdf'], help="PDF rasterizer, auto uses PyMuPDF when installed")
+    parser.add_argument("--render_dpi", default=None, type=float, help="Render at a fixed resolution (e.g. 600) instead of directly at the page size")
+    parser.add_argument("--ocr_backend", default='auto', choices=['auto', 'tesserocr', 'pytesseract'], help="OCR engine, auto uses tesserocr when installed")
+    parser.add_argument("--ocr_cache", default=None, type=str, help="Directory to cache region OCR in, defaults to <tmp_path>/ocr_cache")
+    parser.add_argument("--token_cache", default=None, type=str, help="Directory to persist pdfminer tokens in, defaults to <tmp_path>/tokens")
     parser.add_argument('-o', "--output", default='./', help="Output directory")
     parser.add_argument('-p', "--tmp_path", default='tmp', help="Path to directory for temporary files")
     parser.add_argument('--debug', help="Ingest html documents and create postgres database", action='store_true')
@@ -55,47 +68,61 @@ if __name__ == '__main__':
     weights = args.weights
     device = args.device
     tmp = args.tmp_path
+    token_dir = args.token_cache if args.token_cache is not None else os.path.join(tmp, "tokens")
+    ocr_cache = args.ocr_cache if args.ocr_cache is not None else os.path.join(tmp, "ocr_cache")
     xml = os.path.join(args.output, "xml")
     html = os.path.join(args.output, "html")
     img_d = os.path.join(tmp, 'images2')
 
     # Define and create required paths
-    req_paths = [tmp, f'{tmp}/images', f'{tmp}/images2', f'{tmp}/cc_proposals', xml]
+    req_paths = [tmp, f'{tmp}/images', f'{tmp}/images2', f'{tmp}/cc_proposals', token_dir, xml]
     for path in req_paths:
         if not os.path.exists(path):
             os.makedirs(path)
 
-    # do pdfminer for all pdfs and preserve in mem
-    unicodes = {}
     if os.listdir(args.pdfdir) == []:
         print("Input directory is empty! Exiting.")
         sys.exit(1)
-    for pdf_name in os.listdir(args.pdfdir):
-        if not pdf_name.endswith(".pdf"): continue
-        print(os.path.join(args.pdfdir,pdf_name))
-        df, limit = parse_pdf(os.path.join(args.pdfdir,pdf_name))
-        unicodes[pdf_name] = (df, limit)
-
-    # Convert a pdf into a set of images
-    def preprocess_pdfs(pdf_path):
-        if not pdf_path.endswith(".pdf"): return
-        subprocess.run(['gs', '-dBATCH', '-dNOPAUSE', '-sDEVICE=png16m', '-dGraphicsAlphaBits=4',
-                        '-dTextAlphaBits=4', '-r600', f'-sOutputFile="{tmp}/images/{pdf_path}_%d.png"', os.path.join(args.pdfdir, pdf_path)])
-
-    def resize_pngs(img_path):
-        path, im = pp.resize_png(os.path.join(f'{tmp}', 'images', img_path))
-        if path is not None:
-            im.save(os.path.join(f'{tmp}', 'images', img_path))
-        print(os.path.join(f'{tmp}', 'images', img_path))
+
+    # Convert a pdf into a set of images. The pdfminer pass of every pdf runs in the
+    # same pool as the renders and persists its tokens to token_dir
+    def pdf_paths():
+        for pdf_path in os.listdir(args.pdfdir):
+            if not pdf_path.endswith(".pdf"): continue
+            yield pdf_path
+
+    def render_tasks(pdf_path):
+        # Page sizes are read in a worker, a pdf that cannot be read is skipped instead of aborting the run
+        try:
+            sizes = get_page_sizes(os.path.join(args.pdfdir, pdf_path))
+        except Exception as e:
+            print(f'Skipping {pdf_path}, its pages could not be read: {e!r}')
+            return []
+        return [('extract', pdf_path, None, None, None)] + \
+               [('render', pdf_path, first_page, last_page, sizes)
+                for first_page, last_page in split_page_ranges(len(sizes), args.pages_per_range)]
+
+    def preprocess_pdfs(task):
+        kind, pdf_path, first_page, last_page, sizes = task
+        if kind == 'extract':
+            print(os.path.join(args.pdfdir, pdf_path))
+            extract_tokens(os.path.join(args.pdfdir, pdf_path), token_dir)
+            return []
+        # Pages are rendered with their longest side at 1920px so the resize step is a no-op
+        return render_pdf(os.path.join(args.pdfdir, pdf_path), f'{tmp}/images', dpi=args.render_dpi,
+                          backend=args.render_backend, first_page=first_page, last_page=last_page,
+                          name=pdf_path, sizes=sizes)
 
     def flatten_png(img_f):
         subprocess.run(['convert', '-flatten', os.path.join(f'{tmp}', 'images', img_f), os.path.join(f'{tmp}', 'images', img_f)])
 
-    def preprocess_pngs(img_f):
-        pth, padded_img = pp.pad_image(os.path.join(f'{tmp}', 'images', img_f))
-        if pth is not None:
-            padded_img.save(os.path.join(img_d, img_f))
-        print(os.path.join(img_d, img_f))
+    def preprocess_pages(render_stat):
+        img_f = f"{render_stat['pdf']}_{render_stat['page']}.png"
+        # Resize, proposals and padding share one decode of the rendered page
+        process_page(os.path.join(f'{tmp}', 'images', img_f), os.path.join(tmp, "cc_proposals"),
+                     padded_dir=img_d if args.keep_padded else None, write_annotated=args.debug)
+        print(os.path.join(f'{tmp}', 'images', img_f))
+        return [render_stat]
 
     FILE_NAME = re.compile("(.*\.pdf)_([0-9]+)\.png")
 
@@ -104,47 +131,27 @@ if __name__ == '__main__':
         l = xml2list(xpath)
         l = group_cls(l, 'Table', do_table_merge=True, merge_over_classes=['Figure', 'Section Header', 'Page Footer', 'Page Header'])
         l = group_cls(l, 'Figure')
-        pdf_name = FILE_NAME.search(f'{xml_f[:-4]}.png').group(1)
-        list2html(l, f'{xml_f[:-4]}.png', os.path.join(f'{tmp}', 'images'), html, unicodes[pdf_name] if pdf_name in unicodes else None)
-
-    def update_xmls(html_f):
-        hpath = os.path.join(html, html_f)
-        htmlfile2xml(hpath, xml)
-
-    pool = mp.Pool(processes=args.threads)
-
-    print('Start preprocessing pdfs')
-    if args.threads == 1:
-        [preprocess_pdfs(x) for x in os.listdir(args.pdfdir)]
+        match = FILE_NAME.search(f'{xml_f[:-4]}.png')
+        pdf_name, page_num = match.group(1), int(match.group(2))
+        # Only the tokens of this page are read from the token store
+        tokens = token_path(token_dir, os.path.join(args.pdfdir, pdf_name))
+        unicode_df = load_page_tokens(tokens, page_num - 1) if os.path.exists(tokens) else None
+        list2html(l, f'{xml_f[:-4]}.png', os.path.join(f'{tmp}', 'images'), html, unicode_df,
+                  ocr_backend=args.ocr_backend, ocr_cache_dir=ocr_cache)
+
+    # Rendered pages stream into page preprocessing as soon as their range is done
+    print('Begin preprocessing pdfs and pages')
+    stages = [Stage('plan', render_tasks, workers=args.render_workers, maxsize=2 * args.render_workers),
+              Stage('render', preprocess_pdfs, workers=args.render_workers, maxsize=2 * args.render_workers),
+              Stage('preprocess_pages', preprocess_pages, workers=args.page_workers, maxsize=4 * args.page_workers)]
+    if args.render_workers == 1 and args.page_workers == 1:
+        render_stats = run_serial(pdf_paths(), stages)
     else:
-        results = [pool.apply_async(preprocess_pdfs, args=(x,)) for x in os.listdir(args.pdfdir)]
-        [r.get() for r in results]
-    print('End preprocessing pdfs')
+        render_stats = run_stages(pdf_paths(), stages)
+    write_render_stats(render_stats, os.path.join(tmp, 'render_stats.csv'))
+    print('End preprocessing pdfs and pages')
 
-    print('Begin resizing pngs')
-    if args.threads == 1:
-        [resize_pngs(x) for x in os.listdir(os.path.join(f'{tmp}', 'images'))]
-    else:
-        results = [pool.apply_async(resize_pngs, args=(x,)) for x in os.listdir(os.path.join(f'{tmp}', 'images'))]
-        [r.get() for r in results]
-    print('End resizing pngs')
-
-    print('Begin writing proposals')
-    if args.threads == 1:
-        [write_proposals(os.path.join(f'{tmp}', 'images', x), output_dir=os.path.join(tmp,"cc_proposals")) for x in os.listdir(os.path.join(f'{tmp}', 'images'))]
-    else:
-        results = [pool.apply_async(write_proposals, args=(os.path.join(f'{tmp}', 'images', x),), kwds={"output_dir" : os.path.join(tmp,"cc_proposals")}) for x in os.listdir(os.path.join(f'{tmp}', 'images'))]
-        [r.get() for r in results]
-    print('End writing proposals')
-
-
-    print('Begin preprocessing pngs')
-    if args.threads == 1:
-        [preprocess_pngs(x) for x in os.listdir(os.path.join(f'{tmp}', 'images'))]
-    else:
-        results = [pool.apply_async(preprocess_pngs, args=(x,)) for x in os.listdir(os.path.join(f'{tmp}', 'images'))]
-        [r.get() for r in results]
-    print('End preprocessing pngs')
+    pool = mp.Pool(processes=args.threads)
 
     with open('test.txt', 'w') as wf:
         for f in os.listdir(f'{tmp}/images'):
@@ -172,8 +179,9 @@ if __name__ == '__main__':
     if not os.path.exists(tmp_html):
         os.makedirs(tmp_html)
 
+    # Each page is parsed once, the corrected tree is written as html and as the page's xml
     print("Running postprocessing")
-    post.postprocess(html, tmp_html)
+    postprocess_pages(html, tmp_html, xml, processes=args.threads, stats_path=os.path.join(tmp, 'postprocess_stats.csv'))
 
     # replace old html with corrected stuff.
     if not args.debug:
@@ -181,18 +189,9 @@ if __name__ == '__main__':
         shutil.rmtree(html)
         shutil.move(tmp_html, html)
 
-    print('Begin updating xmls')
-    if args.threads == 1:
-        [update_xmls(x) for x in os.listdir(html) if x != 'img']
-    else:
-        results = [pool.apply_async(update_xmls, args=(x,)) for x in os.listdir(html) if x != 'img']
-        [r.get() for r in results]
-    print('End updating xmls')
-
-    # Construct handles multiprocessing within it.
-
-    construct(html, 'Figure Caption', 'Figure', os.path.join(args.output, 'figures.csv'), processes=args.threads)
-    construct(html, 'Table Caption', 'Table', os.path.join(args.output, 'tables.csv'), processes=args.threads)
+    # Construct handles multiprocessing within it. Both tables come from one parse of every page.
+    construct_all(html, [('Figure Caption', 'Figure', os.path.join(args.output, 'figures.csv')),
+                         ('Table Caption', 'Table', os.path.join(args.output, 'tables.csv'))], processes=args.threads)
 
     # Parse html files to postgres db
     input_folder = ingestion_settings['input_folder']
@@ -216,16 +215,19 @@ if __name__ == '__main__':
         conn = psycopg2.connect(db_template_str)
         conn.set_isolation_level(0)
         cur = conn.cursor()
-        try:
-            cur.execute("""DROP DATABASE cosmos""")
-        except:
-            print("Cannot drop db cosmos")
+        # Incremental runs keep the existing database and only create it on the first run
+        if not args.incremental:
+            try:
+                cur.execute("""DROP DATABASE cosmos""")
+            except:
+                print("Cannot drop db cosmos")
         try:
             cur.execute("""CREATE DATABASE cosmos""")
         except:
             print("Cannot create db cosmos")
         conn.close()
-        parse_html_to_postgres(input_folder, output_html, merge_folder, output_words, output_equations, db_connect_str, strip_tags, ignored_file_when_link, output_csv, corenlp_fd)
+        parse_html_to_postgres(input_folder, output_html, merge_folder, output_words, output_equations, db_connect_str, strip_tags, ignored_file_when_link, output_csv, corenlp_fd,
+                               incremental=args.incremental, processes=args.threads)
 
     if args.keep_pages:
         if not os.path.exists(args.output + "/images/"):
@@ -0,0 +1,24 @@
+'''
+Test the incremental ingestion bookkeeping
+'''
+
+from UnicodeParser.ingest_state import html_hash, document_name, plan_ingestion
+
+
+def test_plan_ingestion():
+    hashes = {'a.pdf': '1', 'b.pdf': '2', 'c.pdf': '3'}
+    ingested = {'a.pdf': '1', 'b.pdf': 'old', 'd.pdf': '4'}
+    new, changed, unchanged = plan_ingestion(hashes, ingested)
+    assert new == ['c.pdf']
+    assert changed == ['b.pdf']
+    assert unchanged == ['a.pdf']
+
+
+def test_hash_follows_contents(tmpdir):
+    f = tmpdir.join('paper.pdf.html')
+    f.write('<html></html>')
+    first = html_hash(str(f))
+    assert first == html_hash(str(f))
+    f.write('<html><body/></html>')
+    assert html_hash(str(f)) != first
+    assert document_name(str(f)) == 'paper.pdf'
@@ -0,0 +1,71 @@
+"""
+Testing for the run-length connected components labeling
+"""
+
+import numpy as np
+from connected_components.labeling import label_components, UnionFind
+
+
+def flood_fill_boxes(bmap):
+    """
+    Brute force 8-connected bounding boxes, used as the reference
+    """
+    seen = np.zeros(bmap.shape, dtype=bool)
+    boxes = []
+    for x, y in zip(*np.nonzero(bmap)):
+        if seen[x, y]:
+            continue
+        stack = [(x, y)]
+        seen[x, y] = True
+        pts = []
+        while stack:
+            cx, cy = stack.pop()
+            pts.append((cx, cy))
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    nx, ny = cx + dx, cy + dy
+                    if 0 <= nx < bmap.shape[0] and 0 <= ny < bmap.shape[1] and bmap[nx, ny] and not seen[nx, ny]:
+                        seen[nx, ny] = True
+                        stack.append((nx, ny))
+        xs, ys = zip(*pts)
+        boxes.append(((min(xs), min(ys), max(xs), max(ys)), len(pts)))
+    return boxes
+
+
+def test_diagonal_and_u_shapes():
+    bmap = np.zeros((8, 8), dtype=np.uint8)
+    # diagonal line is a single component under 8-connectivity
+    for i in range(4):
+        bmap[i, i] = 1
+    # U shape only joins at the bottom row
+    bmap[4:8, 5] = 1
+    bmap[4:8, 7] = 1
+    bmap[7, 5:8] = 1
+    components = label_components(bmap)
+    assert components.boxes.tolist() == [[0, 0, 3, 3], [4, 5, 7, 7]]
+    assert components.counts.tolist() == [4, 9]
+
+
+def test_empty_map():
+    components = label_components(np.zeros((5, 5)))
+    assert components.boxes.shape == (0, 4)
+    assert components.counts.shape == (0,)
+
+
+def test_matches_flood_fill():
+    rng = np.random.RandomState(0)
+    bmap = rng.rand(60, 45) > 0.6
+    components = label_components(bmap, return_labels=True)
+    expected = flood_fill_boxes(bmap)
+    actual = list(zip(map(tuple, components.boxes.tolist()), components.counts.tolist()))
+    assert sorted(actual) == sorted(expected)
+    assert components.labels.max() == len(expected)
+    assert ((components.labels > 0) == bmap).all()
+
+
+def test_union_find_transitive():
+    uf = UnionFind(6)
+    uf.union([5, 4, 1], [4, 3, 3])
+    roots = uf.roots()
+    assert roots[5] == roots[4] == roots[3] == roots[1] == 1
+    assert roots[0] == 0 and roots[2] == 2
@@ -0,0 +1,67 @@
+"""
+Testing for the summed-area table whitespace detector
+"""
+
+import numpy as np
+from connected_components.whitespace import InkTable
+
+
+def sliding_blank_rows(inp_np, blank_row_h):
+    """
+    Sequential sliding window scan, used as the reference
+    """
+    blank_row = np.zeros((blank_row_h, inp_np.shape[1]))
+    curr_top = 0
+    curr_bot = blank_row_h
+    white_rows = []
+    while curr_bot < inp_np.shape[0]-1:
+        sub_img = inp_np[curr_top:curr_bot, :]
+        if (sub_img == blank_row).all():
+            if len(white_rows) == 0 or white_rows[-1] < curr_top:
+                white_rows.append(curr_bot)
+            else:
+                white_rows[-1] = curr_bot
+        elif curr_top == 0:
+            white_rows.append(0)
+        elif curr_bot == inp_np.shape[0]-2:
+            white_rows.append(inp_np.shape[0]-1)
+        curr_top += 1
+        curr_bot = curr_top + blank_row_h
+    return white_rows
+
+
+def random_page(seed, h=200, w=150):
+    rng = np.random.RandomState(seed)
+    bmap = np.zeros((h, w), dtype=np.uint8)
+    for _ in range(12):
+        y, x = rng.randint(0, h - 5), rng.randint(0, w - 5)
+        bmap[y:y + rng.randint(1, 20), x:x + rng.randint(1, 40)] = 1
+    return bmap
+
+
+def test_blank_rows_match_sliding_window():
+    for seed in range(5):
+        bmap = random_page(seed)
+        table = InkTable(bmap)
+        for blank_h in (1, 3, 15):
+            assert table.blank_rows(blank_h) == sliding_blank_rows(bmap, blank_h)
+            assert table.blank_cols(blank_h) == sliding_blank_rows(bmap.T, blank_h)
+
+
+def test_region_queries():
+    bmap = random_page(7)
+    table = InkTable(bmap)
+    top, left, bottom, right = 20, 30, 120, 110
+    region = bmap[top:bottom, left:right]
+    assert table.ink(top, left, bottom, right) == region.sum()
+    assert table.blank_rows(5, top, left, bottom, right) == sliding_blank_rows(region, 5)
+    assert table.crop(top, left, bottom, right).blank_cols(5) == sliding_blank_rows(region.T, 5)
+    ys, xs = np.nonzero(region)
+    assert table.ink_bbox(top, left, bottom, right) == (ys.min(), xs.min(), ys.max(), xs.max())
+
+
+def test_blank_region():
+    table = InkTable(np.zeros((30, 30)))
+    assert table.is_blank(0, 0, 30, 30)
+    assert table.ink_bbox() is None
+    assert table.blank_rows(5) == sliding_blank_rows(np.zeros((30, 30)), 5) == [28]
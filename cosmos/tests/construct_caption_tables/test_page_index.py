@@ -0,0 +1,59 @@
+"""
+Testing the per page region index and the table construction built on it
+"""
+
+import multiprocessing as mp
+import dominate
+import pandas as pd
+import pytest
+from dominate.tags import div, img
+from dominate.util import raw
+from construct_caption_tables.page_index import PageRegions, associate, page_rows
+from construct_caption_tables.construct import construct_all
+
+
+def write_page(path, regions):
+    doc = dominate.document(title='page')
+    with doc:
+        for ind, (cls, coords, text) in enumerate(regions):
+            with div(id=f'{cls}{ind}', cls=cls):
+                img(src=f'img/page/{cls}{ind}.png')
+                words = f"<p class='ocr_par'><span class='ocr_line'><span class='ocrx_word'>{text}</span></span></p>"
+                div(raw(words), cls='hocr', data_coordinates=' '.join(str(c) for c in coords), data_score='0.5')
+                div(raw(words), cls='text_unicode', data_coordinates=' '.join(str(c) for c in coords), id=str(ind))
+    with open(path, 'w', encoding='utf-8') as wf:
+        wf.write(doc.render())
+
+
+def test_associate_picks_closest_corner():
+    targets = [('Figure Caption', (100, 500, 400, 520), 1), ('Figure Caption', (100, 50, 400, 70), 1)]
+    figures = [('Figure', (100, 100, 400, 490), 1), ('Figure', (110, 80, 400, 600), 1)]
+    assert associate(targets, figures) == [figures[0], figures[1]]
+    assert associate(targets, []) == [None, None]
+
+
+def test_page_rows(tmpdir):
+    path = str(tmpdir.join('doc.pdf_1.html'))
+    write_page(path, [('Figure', (100, 100, 400, 490), 'plot'), ('Figure Caption', (100, 500, 400, 520), 'Figure 1'),
+                      ('Figure', (100, 900, 400, 1000), 'other')])
+    page = PageRegions(path)
+    assert [r.cls for r in page.regions] == ['Figure', 'Figure Caption', 'Figure']
+    rows = page_rows(page, 'Figure Caption', 'Figure')
+    assert rows['target_img_path'] == ['img/page/Figure Caption1.png', None]
+    assert rows['assoc_img_path'] == ['img/page/Figure0.png', 'img/page/Figure2.png']
+    assert rows['target_unicode'] == ['Figure 1 Figure 1', None]
+    assert page_rows(page, 'Table Caption', 'Table') is None
+
+
+def test_construct_all_streams_pages_and_stops_workers_on_failure(tmpdir):
+    html_dir = tmpdir.mkdir('html')
+    write_page(str(html_dir.join('doc.pdf_1.html')), [('Figure', (100, 100, 400, 490), 'plot'),
+                                                      ('Figure Caption', (100, 500, 400, 520), 'Figure 1')])
+    out = str(tmpdir.join('figures.csv'))
+    construct_all(str(html_dir), [('Figure Caption', 'Figure', out)], processes=2)
+    assert list(pd.read_csv(out)['target_unicode']) == ['Figure 1 Figure 1']
+    # An unparsable page fails the run without leaving workers behind
+    html_dir.join('doc.pdf_2.html').write('')
+    with pytest.raises(Exception):
+        construct_all(str(html_dir), [('Figure Caption', 'Figure', out)], processes=2)
+    assert mp.active_children() == []
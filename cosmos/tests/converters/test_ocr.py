@@ -0,0 +1,38 @@
+'''
+Test the OCR engine layer
+'''
+
+from PIL import Image
+import converters.ocr as ocr
+
+
+class FakeEngine:
+    def __init__(self):
+        self.calls = []
+
+    def ocr_regions(self, img, rects):
+        self.calls.append(list(rects))
+        return [f"<span title='bbox {x1} {y1} {x2} {y2}'></span>" for x1, y1, x2, y2 in rects]
+
+
+def test_translate_hocr():
+    hocr = "<div class='ocr_page' title='image \"\"; bbox 10 20 110 220; ppageno 0'><span title='bbox 15 25 40 30; x_wconf 90'>"
+    translated = ocr.translate_hocr(hocr, 10, 20)
+    assert "bbox 0 0 100 200" in translated
+    assert "bbox 5 5 30 10; x_wconf 90" in translated
+
+
+def test_cache_skips_unchanged_regions(tmpdir, monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(ocr, 'get_engine', lambda backend, lang: engine)
+    img = Image.new('RGB', (50, 40), 'white')
+    rects = [(0, 0, 10, 10), (5, 5, 20, 30)]
+    first = ocr.ocr_page_regions(img, rects, backend='pytesseract', cache_dir=str(tmpdir))
+    assert engine.calls == [rects]
+    second = ocr.ocr_page_regions(img, rects + [(1, 2, 3, 4)], backend='pytesseract', cache_dir=str(tmpdir))
+    assert second[:2] == first
+    assert engine.calls[1] == [(1, 2, 3, 4)]
+    # Different pixels miss the cache
+    img.putpixel((0, 0), (0, 0, 0))
+    ocr.ocr_page_regions(img, rects, backend='pytesseract', cache_dir=str(tmpdir))
+    assert engine.calls[2] == rects
@@ -0,0 +1,53 @@
+'''
+Test the page token index against the pandas box filter
+'''
+
+import numpy as np
+import pandas as pd
+from converters.page_tokens import PageTokenIndex, xml_safe
+
+
+def valid_xml_char_ordinal(c):
+    codepoint = ord(c)
+    return (0x20 <= codepoint <= 0xD7FF or codepoint in (0x9, 0xA, 0xD) or
+            0xE000 <= codepoint <= 0xFFFD or 0x10000 <= codepoint <= 0x10FFFF)
+
+
+def random_frame(rng, n=300):
+    x1 = rng.randint(0, 600, n).astype(float)
+    y1 = rng.randint(0, 800, n).astype(float)
+    return pd.DataFrame({'text': [f'w{i}' for i in range(n)], 'x1': x1, 'y1': y1,
+                         'x2': x1 + rng.randint(1, 60, n), 'y2': y1 + rng.randint(1, 20, n),
+                         'page': rng.randint(0, 3, n)})
+
+
+def test_query_matches_pandas_mask():
+    rng = np.random.RandomState(0)
+    df = random_frame(rng)
+    for page in range(3):
+        index = PageTokenIndex(df, page)
+        df_page = df[df['page'] == page]
+        for _ in range(50):
+            qx1, qy1 = rng.uniform(0, 600), rng.uniform(0, 800)
+            qx2, qy2 = qx1 + rng.uniform(0, 150), qy1 + rng.uniform(-5, 60)
+            mask = ~((df_page['x1'] >= qx2) | (df_page['x2'] <= qx1) | (df_page['y1'] >= qy2) | (df_page['y2'] <= qy1))
+            assert list(index.ids[index.query(qx1, qy1, qx2, qy2)]) == list(df_page[mask].index)
+
+
+def test_band_ignores_tall_outliers():
+    # 20 rows of 10 px high words and one token spanning the whole column
+    x1 = np.tile(np.arange(0, 500, 50), 20).astype(float)
+    y1 = np.repeat(np.arange(0, 400, 20), 10).astype(float)
+    df = pd.DataFrame({'text': [f'w{i}' for i in range(200)] + ['tall'],
+                       'x1': np.append(x1, 0), 'y1': np.append(y1, 0),
+                       'x2': np.append(x1 + 40, 20), 'y2': np.append(y1 + 10, 400), 'page': 0})
+    index = PageTokenIndex(df, 0)
+    assert index.band_height == 10
+    assert list(index.tall) == [200]
+    assert list(index.query(0, 102, 45, 108)) == [50, 200]
+    assert list(index.query(60, 102, 500, 108)) == list(range(51, 60))
+
+
+def test_xml_safe_matches_char_filter():
+    s = 'a\x00b\x0bc\td\ufffe\ufffd\ud7ff\U0001f600 x\x1f'
+    assert xml_safe(s) == ''.join(c for c in s if valid_xml_char_ordinal(c))
@@ -0,0 +1,47 @@
+'''
+Test the per page token store
+'''
+
+import os
+import time
+import pandas as pd
+from converters.token_store import token_path, save_tokens, load_page_tokens
+
+
+def frame():
+    return pd.DataFrame({'text': ['alpha', '', 'β-γ\x00', 'x\ud835', 'last'],
+                         'x1': [1.0, 2.0, 3.5, 4.0, 5.0], 'y1': [1.0, 2.0, 3.0, 4.0, 5.0],
+                         'x2': [2.0, 3.0, 4.5, 5.0, 6.0], 'y2': [3.0, 4.0, 5.0, 6.0, 7.0],
+                         'page': [0, 0, 1, 1, 1]})
+
+
+def test_roundtrip_per_page(tmpdir):
+    df = frame()
+    path = str(tmpdir.join('doc.npz'))
+    save_tokens(df, (0, 0, 612, 792), path)
+    for page in (0, 1):
+        df_page, limit = load_page_tokens(path, page)
+        expected = df[df['page'] == page]
+        assert limit == (0, 0, 612, 792)
+        assert list(df_page.index) == list(expected.index)
+        assert list(df_page['text']) == list(expected['text'])
+        for c in ('x1', 'y1', 'x2', 'y2', 'page'):
+            assert list(df_page[c]) == list(expected[c])
+    df_page, _ = load_page_tokens(path, 5)
+    assert len(df_page) == 0
+
+
+def test_empty_pdf(tmpdir):
+    path = str(tmpdir.join('empty.npz'))
+    save_tokens(None, None, path)
+    assert load_page_tokens(path, 0) == (None, None)
+
+
+def test_token_path_changes_with_pdf(tmpdir):
+    pdf = tmpdir.join('a.pdf')
+    pdf.write('one')
+    first = token_path(str(tmpdir), str(pdf))
+    assert first == token_path(str(tmpdir), str(pdf))
+    pdf.write('changed')
+    os.utime(str(pdf), ns=(time.time_ns() + 10 ** 9, time.time_ns() + 10 ** 9))
+    assert token_path(str(tmpdir), str(pdf)) != first
@@ -0,0 +1,42 @@
+"""
+Testing for the vectorized evaluation core
+"""
+import numpy as np
+from evaluate.engine import Page, page_boxes, iou_matrix, best_matches, page_counts
+from evaluate.evaluate import calculate_iou
+
+classes = ['Body Text', 'Figure', 'Table']
+
+
+def test_iou_matrix_matches_calculate_iou():
+    boxes1 = [[0, 0, 10, 10], [5, 5, 15, 15], [2, 2, 4, 4], [10, 0, 20, 10]]
+    boxes2 = [[0, 0, 10, 10], [20, 20, 30, 30], [0, 0, 5, 5]]
+    for contains in (False, True):
+        ious = iou_matrix(boxes1, boxes2, contains)
+        for i, b1 in enumerate(boxes1):
+            for j, b2 in enumerate(boxes2):
+                assert ious[i, j] == calculate_iou(b1, b2, contains)
+
+
+def test_best_matches_takes_first_maximum():
+    ious = np.array([[0.2, 0.5, 0.5], [0.0, 0.0, 0.0]])
+    matches, max_ious = best_matches(ious)
+    assert list(matches) == [1, 0]
+    assert list(max_ious) == [0.5, 0.0]
+    matches, _ = best_matches(np.zeros((2, 0)))
+    assert list(matches) == [-1, -1]
+
+
+def test_page_counts():
+    gt = page_boxes([('Body Text', [0, 0, 10, 10], 0), ('Figure', [20, 20, 40, 40], 0), ('Table', [50, 50, 60, 60], 0)])
+    pred = page_boxes([('Body Text', [0, 0, 10, 10], 1), ('Body Text', [0, 0, 10, 9], 1),
+                       ('Body Text', [20, 20, 40, 40], 1), ('Table', [80, 80, 90, 90], 1)])
+    tp, fp, fn, confusion = page_counts(Page('page', pred, gt), classes)
+    # A second proposal on a ground truth box and a mislabeled match are false positives
+    assert list(tp) == [1, 0, 0]
+    assert list(fp) == [2, 0, 0]
+    # The mislabeled figure and the table nothing matched are false negatives
+    assert list(fn) == [0, 1, 1]
+    assert confusion[0, 0] == 2 and confusion[1, 0] == 1 and confusion.sum() == 3
+    tp, _, _, _ = page_counts(Page('page', pred, gt), classes, multiple_proposals=True)
+    assert list(tp) == [2, 0, 0]
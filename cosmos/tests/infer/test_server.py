@@ -0,0 +1,141 @@
+"""
+Testing the layout server's HTTP layer with a stub model: request decoding,
+batching of concurrent pages, colliding page ids and the error responses.
+Needs torch and is skipped without it.
+"""
+
+import base64
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+import pytest
+from PIL import Image
+
+CLASSES = ['Body Text', 'Figure']
+
+
+def load_server():
+    try:
+        import torch
+        from infer import server
+    except ImportError as e:
+        pytest.skip(f'layout server dependencies are not installed: {e}')
+    return torch, server
+
+
+def stub_model(torch, fail=False):
+    class Featurizer(torch.nn.Module):
+        def forward(self, windows, device):
+            return windows.float().mean(dim=(1, 2, 3)).reshape(-1, 1, 1, 1)
+
+    class StubModel:
+        cls_names = CLASSES
+        featurizer = Featurizer()
+
+        def classify(self, center_maps, neighbor_maps, radii, angles, ex_color, bb, device):
+            if fail:
+                raise RuntimeError('model failure')
+            # Wide boxes are figures
+            wide = float(bb[0, 2] - bb[0, 0]) >= 50
+            return torch.tensor([[0.2, 0.8]] if wide else [[0.7, 0.3]])
+
+    return StubModel()
+
+
+class Served:
+    def __init__(self, fail=False, max_batch=3, max_latency=2.0):
+        torch, server = load_server()
+        cfg = SimpleNamespace(WARPED_SIZE=32, EXPANSION_DELTA=10, CLASSES=CLASSES)
+        self.layout = server.LayoutServer(cfg, stub_model(torch, fail), torch.device('cpu'), max_batch, max_latency)
+        self.batches = []
+        classify_pages = self.layout.classify_pages
+
+        def recorded(pages):
+            self.batches.append([page_id for page_id, _, _ in pages])
+            return classify_pages(pages)
+
+        self.layout.batcher.process_fn = recorded
+        self.httpd = server.ThreadingHTTPServer(('127.0.0.1', 0), server.make_handler(self.layout))
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def post(self, payload):
+        request = urllib.request.Request(f'{self.url}/classify', data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.layout.batcher.stop()
+
+
+def page_png():
+    buf = io.BytesIO()
+    Image.new('RGB', (200, 200), 'white').save(buf, format='PNG')
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def payload(page_id, proposals):
+    return {'page_id': page_id, 'image': page_png(), 'proposals': ''.join(f'{x1},{y1},{x2},{y2}\n' for x1, y1, x2, y2 in proposals)}
+
+
+def test_concurrent_pages_share_a_batch_and_keep_their_results():
+    served = Served()
+    try:
+        requests = [payload('p', [[10, 10, 100, 60], [20, 100, 40, 120]]),
+                    payload('p', [[0, 0, 30, 30]]),
+                    payload('q', [[50, 50, 150, 150]])]
+        results = [None] * len(requests)
+
+        def post(ind):
+            results[ind] = served.post(requests[ind])
+
+        threads = [threading.Thread(target=post, args=(ind,)) for ind in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        assert len(served.batches) == 1 and sorted(served.batches[0]) == ['p', 'p', 'q']
+        # The two pages with id 'p' each get their own proposals back
+        by_boxes = {tuple(tuple(o['bbox']) for o in result['objects']): (code, result) for code, result in results}
+        code, result = by_boxes[((10, 10, 100, 60), (20, 100, 40, 120))]
+        assert code == 200 and result['page_id'] == 'p'
+        assert [o['name'] for o in result['objects']] == ['Figure', 'Body Text']
+        assert result['xml'].count('<object>') == 2 and '<name>Figure</name>' in result['xml']
+        code, result = by_boxes[((0, 0, 30, 30),)]
+        assert code == 200 and result['page_id'] == 'p' and [o['name'] for o in result['objects']] == ['Body Text']
+        code, result = by_boxes[((50, 50, 150, 150),)]
+        assert code == 200 and result['page_id'] == 'q' and [o['name'] for o in result['objects']] == ['Figure']
+    finally:
+        served.close()
+
+
+def test_bad_requests_are_400():
+    served = Served(max_batch=1)
+    try:
+        request = payload('p', [[10, 10, 100, 60]])
+        del request['proposals']
+        assert served.post(request)[0] == 400
+        request = payload('p', [[10, 10, 100, 60]])
+        request['image'] = base64.b64encode(b'not an image').decode()
+        assert served.post(request)[0] == 400
+        assert served.batches == []
+    finally:
+        served.close()
+
+
+def test_model_failure_is_500():
+    served = Served(fail=True, max_batch=1)
+    try:
+        code, result = served.post(payload('p', [[10, 10, 100, 60]]))
+        assert code == 500 and 'model failure' in result['error']
+    finally:
+        served.close()
@@ -0,0 +1,51 @@
+"""
+Testing for the columnar window store
+"""
+
+import numpy as np
+from ingestion.array_store import ArrayStore, normalize, denormalize
+
+
+def build_store(window_dtype='uint8'):
+    rng = np.random.RandomState(0)
+    windows = normalize(rng.randint(0, 256, size=(5, 3, 8, 8)).astype(np.uint8))
+    store = ArrayStore(window_dtype)
+    store.append_page('doc.pdf_1', 'test', ['a', 'b'], windows[:2], np.arange(8).reshape(2, 4), np.full((2, 4), np.nan), [None, 'Figure'])
+    store.append_page('doc.pdf_2', 'test', ['c', 'd', 'e'], windows[2:], np.arange(12).reshape(3, 4), np.zeros((3, 4)), ['Table', None, 'Body Text'])
+    store.finalize()
+    store.set_neighbors([0, 1, 1, 3, 3, 3], [1, 3, 4])
+    return store, windows
+
+
+def test_uint8_windows_round_trip():
+    store, windows = build_store()
+    assert store.windows.dtype == np.uint8
+    assert np.array_equal(store.window_array(slice(0, 5)), windows)
+    assert np.array_equal(denormalize(windows), store.window_view(slice(0, 5)))
+
+
+def test_float16_windows():
+    store, windows = build_store('float16')
+    assert np.allclose(store.window_array(slice(0, 5)), windows, atol=1e-2)
+
+
+def test_save_and_memory_map(tmpdir):
+    store, windows = build_store()
+    store.finalize(str(tmpdir))
+    assert isinstance(store.windows, np.memmap)
+    loaded = ArrayStore.load(str(tmpdir))
+    assert loaded.page_rows('doc.pdf_2') == (2, 5)
+    assert loaded.page_id(loaded.row('d')) == 'doc.pdf_2'
+    assert loaded.neighbors(loaded.row('c')).tolist() == [3, 4]
+    assert loaded.neighbors(loaded.row('b')).tolist() == []
+    assert loaded.labels == [None, 'Figure', 'Table', None, 'Body Text']
+    assert np.array_equal(loaded.window_array(slice(2, 5)), windows[2:])
+
+
+def test_saved_params_and_invalidate(tmpdir):
+    store, _ = build_store()
+    store.finalize(str(tmpdir), params={'warped_size': 64, 'max_neighbors': None})
+    assert ArrayStore.saved_params(str(tmpdir)) == {'warped_size': 64, 'max_neighbors': None}
+    assert not tmpdir.join('meta.json.tmp').exists()
+    ArrayStore.invalidate(str(tmpdir))
+    assert not ArrayStore.exists(str(tmpdir))
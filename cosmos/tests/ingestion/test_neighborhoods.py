@@ -0,0 +1,77 @@
+"""
+Testing for the sort-and-sweep neighborhood builder
+"""
+
+import numpy as np
+from evaluate.evaluate import calculate_iou
+from ingestion.neighborhoods import page_neighborhoods, neighborhood_stats
+
+
+def pairwise_neighborhoods(bboxes, expansion_delta, orig_size=1920):
+    """
+    The original per pair neighborhood test, used as the reference
+    """
+    neighborhoods = []
+    for i, orig_bbox in enumerate(bboxes):
+        nbhd_bbox = [max(0, orig_bbox[0]-expansion_delta), max(0, orig_bbox[1]-expansion_delta), min(orig_size, orig_bbox[2]+expansion_delta), min(orig_size, orig_bbox[3]+expansion_delta)]
+        neighborhoods.append([j for j, target_bbox in enumerate(bboxes) if j != i and calculate_iou(nbhd_bbox, target_bbox) > 0])
+    return neighborhoods
+
+
+def random_boxes(seed, n=60):
+    rng = np.random.RandomState(seed)
+    tl = rng.randint(0, 1800, size=(n, 2))
+    wh = rng.randint(1, 300, size=(n, 2))
+    return np.concatenate([tl, np.minimum(tl + wh, 1920)], axis=1).astype(np.float32)
+
+
+def test_matches_pairwise_iou():
+    for seed in range(5):
+        bboxes = random_boxes(seed)
+        for delta in (0, 50):
+            ptr, idx, _ = page_neighborhoods(bboxes, delta)
+            expected = pairwise_neighborhoods(bboxes.tolist(), delta)
+            assert [idx[ptr[i]:ptr[i + 1]].tolist() for i in range(len(bboxes))] == expected
+
+
+def test_touching_boxes_are_not_neighbors():
+    bboxes = np.array([[0, 0, 10, 10], [10, 0, 20, 10], [30, 30, 40, 40]], dtype=np.float32)
+    ptr, idx, _ = page_neighborhoods(bboxes, 0)
+    assert ptr.tolist() == [0, 0, 0, 0]
+    ptr, idx, _ = page_neighborhoods(bboxes, 50)
+    stats = neighborhood_stats(ptr, np.arange(3))
+    assert stats.nneighbors == 6 and stats.max == 2 and stats.isolated == 0
+
+
+def test_sweep_only_tests_x_overlaps():
+    # A row of disjoint boxes: every box only tests itself, not every box to its left
+    bboxes = np.array([[20 * i, 0, 20 * i + 10, 10] for i in range(90)], dtype=np.float32)
+    ptr, idx, ntested = page_neighborhoods(bboxes, 0)
+    assert ntested == 90 and len(idx) == 0
+    ptr, idx, ntested = page_neighborhoods(bboxes, 15)
+    assert ntested == 90 + 2 * 89 and len(idx) == 2 * 89
+
+
+def test_cap_keeps_nearest_overlaps():
+    bboxes = random_boxes(3, n=80)
+    full_ptr, full_idx, _ = page_neighborhoods(bboxes, 200)
+    ptr, idx, _ = page_neighborhoods(bboxes, 200, max_neighbors=4)
+    centers = (bboxes[:, :2] + bboxes[:, 2:]) / 2
+    for i in range(len(bboxes)):
+        full = full_idx[full_ptr[i]:full_ptr[i + 1]]
+        capped = idx[ptr[i]:ptr[i + 1]]
+        assert len(capped) == min(4, len(full))
+        assert set(capped) <= set(full)
+        dists = np.linalg.norm(centers[full] - centers[i], axis=1)
+        if len(full) > 4:
+            assert np.linalg.norm(centers[capped] - centers[i], axis=1).max() <= np.sort(dists)[3] + 1e-6
+
+
+def test_knn_policies():
+    bboxes = random_boxes(4, n=30)
+    ptr, idx, _ = page_neighborhoods(bboxes, 0, policy='knn', max_neighbors=5)
+    assert (np.diff(ptr) == 5).all()
+    ptr, idx, _ = page_neighborhoods(bboxes, 0, policy='sector_knn', max_neighbors=8, nsectors=4)
+    assert (np.diff(ptr) <= 8).all() and (np.diff(ptr) > 0).all()
+    for i in range(len(bboxes)):
+        assert i not in idx[ptr[i]:ptr[i + 1]]
@@ -0,0 +1,60 @@
+"""
+Testing for batched proposal window extraction
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from ingestion.windows import extract_windows
+
+
+def random_page(seed, h=120, w=100):
+    rng = np.random.RandomState(seed)
+    return Image.fromarray(rng.randint(0, 256, size=(h, w, 3)).astype(np.uint8))
+
+
+def test_same_size_box_copies_pixels():
+    img = random_page(0)
+    windows = extract_windows(img, [[10, 20, 42, 52], [0, 0, 32, 32]], 32)
+    arr = np.asarray(img)
+    assert windows.shape == (2, 3, 32, 32)
+    assert np.array_equal(windows[0].numpy(), arr[20:52, 10:42].transpose(2, 0, 1))
+    assert np.array_equal(windows[1].numpy(), arr[0:32, 0:32].transpose(2, 0, 1))
+
+
+def test_constant_regions_and_padding():
+    arr = np.zeros((200, 200, 3), dtype=np.uint8)
+    arr[:100, :100] = (200, 100, 50)
+    img = Image.fromarray(arr)
+    # a large box is supersampled, a small one upsampled, one lies outside the page
+    windows = extract_windows(img, [[0, 0, 96, 96], [10, 10, 20, 20], [300, 300, 340, 340]], 16).numpy()
+    assert (windows[0] == np.array([200, 100, 50]).reshape(3, 1, 1)).all()
+    assert (windows[1] == np.array([200, 100, 50]).reshape(3, 1, 1)).all()
+    assert (windows[2] == 0).all()
+
+
+def document_page(rng, h=500, w=400):
+    # Short dark strokes like text on white, with a smooth photo-like patch
+    img = Image.new('RGB', (w, h), 'white')
+    draw = ImageDraw.Draw(img)
+    for _ in range(400):
+        x, y = rng.randint(0, w - 10), rng.randint(0, h - 5)
+        draw.line([x, y, x + rng.randint(2, 10), y + rng.randint(-4, 5)], fill=tuple(int(c) for c in rng.randint(0, 120, 3)))
+    patch = Image.fromarray(rng.randint(0, 256, size=(150, 150, 3)).astype(np.uint8)).filter(ImageFilter.GaussianBlur(3))
+    img.paste(patch, (w - 180, h - 200))
+    return img
+
+
+def test_batched_windows_stay_close_to_pil():
+    rng = np.random.RandomState(0)
+    img = document_page(rng)
+    proposals = []
+    for _ in range(100):
+        x, y = rng.randint(0, 380), rng.randint(0, 480)
+        w, h = rng.randint(8, 300, size=2)
+        proposals.append([x, y, min(400, x + w), min(500, y + h)])
+    batched = extract_windows(img, proposals, 32).numpy().astype(np.float64)
+    pil = np.stack([np.asarray(img.crop(p).resize((32, 32)).convert('RGB')).transpose(2, 0, 1) for p in proposals])
+    diff = np.abs(batched - pil)
+    # Sharp strokes can differ a lot on single pixels, the windows as a whole stay within a few levels of PIL
+    assert diff.mean() < 2
+    assert diff.reshape(len(proposals), -1).mean(axis=1).max() < 5
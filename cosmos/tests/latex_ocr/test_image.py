@@ -0,0 +1,159 @@
+"""
+Testing the in-memory im2latex image preprocessing against the file based path
+and the batched prediction grouping. The img2latex tests need its TensorFlow
+and imgaug dependencies and are skipped without them.
+"""
+
+import numpy as np
+import PIL
+import pytest
+from PIL import Image
+from latex_ocr.model.utils.image import crop_pil, pad_pil, downsample_pil, crop_image, pad_image, downsample_image, get_new_size
+
+BUCKETS = [[240, 100], [320, 80], [400, 100], [1600, 1600]]
+MODES = ['RGB', 'L', 'RGBA']
+
+
+def equation_image(mode, seed=0):
+    """
+    White image with a few dark strokes away from the border
+    """
+    rng = np.random.RandomState(seed)
+    arr = np.full((60, 150, 4), 255, dtype=np.uint8)
+    for _ in range(5):
+        y, x = rng.randint(10, 45), rng.randint(15, 120)
+        arr[y:y + rng.randint(2, 12), x:x + rng.randint(2, 20), :3] = rng.randint(0, 200, size=3)
+    arr[:, :, 3] = 255
+    arr[20:30, 20:40, 3] = 128
+    return Image.fromarray(arr, 'RGBA').convert(mode)
+
+
+def reference_crop(img, output_path):
+    """
+    The original file based crop_image
+    """
+    old_im = Image.open(img).convert('L')
+    img_data = np.asarray(old_im, dtype=np.uint8)
+    nnz_inds = np.where(img_data != 255)
+    if len(nnz_inds[0]) == 0:
+        old_im.save(output_path)
+        return False
+    old_im = old_im.crop((np.min(nnz_inds[1]), np.min(nnz_inds[0]), np.max(nnz_inds[1]) + 1, np.max(nnz_inds[0]) + 1))
+    old_im.save(output_path)
+    return True
+
+
+def reference_pad(img, output_path, pad_size=[8, 8, 8, 8], buckets=None):
+    """
+    The original file based pad_image
+    """
+    top, left, bottom, right = pad_size
+    old_im = Image.open(img)
+    new_size = get_new_size((old_im.size[0] + left + right, old_im.size[1] + top + bottom), buckets)
+    new_im = Image.new("RGB", new_size, (255, 255, 255))
+    new_im.paste(old_im, (left, top))
+    new_im.save(output_path)
+
+
+def reference_downsample(img, output_path, ratio=2):
+    """
+    The original file based downsample_image
+    """
+    old_im = Image.open(img)
+    new_size = (int(old_im.size[0] / ratio), int(old_im.size[1] / ratio))
+    old_im.resize(new_size, PIL.Image.LANCZOS).save(output_path)
+
+
+def test_steps_match_file_path(tmpdir):
+    for mode in MODES:
+        img = equation_image(mode)
+        src = str(tmpdir.join(f'{mode}.png'))
+        img.save(src)
+        out = str(tmpdir.join(f'{mode}_out.png'))
+
+        cropped, found = crop_pil(img)
+        assert found and reference_crop(src, out)
+        assert np.array_equal(np.array(cropped), np.array(Image.open(out)))
+        assert crop_image(src, out)
+        assert np.array_equal(np.array(cropped), np.array(Image.open(out)))
+
+        reference_pad(src, out, buckets=BUCKETS)
+        assert np.array_equal(np.array(pad_pil(img, buckets=BUCKETS)), np.array(Image.open(out)))
+        pad_image(src, out, buckets=BUCKETS)
+        assert np.array_equal(np.array(pad_pil(img, buckets=BUCKETS)), np.array(Image.open(out)))
+
+        reference_downsample(src, out)
+        assert np.array_equal(np.array(downsample_pil(img)), np.array(Image.open(out)))
+        downsample_image(src, out)
+        assert np.array_equal(np.array(downsample_pil(img)), np.array(Image.open(out)))
+
+
+def test_chain_matches_file_round_trips(tmpdir):
+    for mode in MODES:
+        img = equation_image(mode, seed=1)
+        path = str(tmpdir.join(f'{mode}.png'))
+        img.save(path)
+        # The file pipeline writes and reads the image back between every step
+        reference_crop(path, path)
+        reference_pad(path, path, buckets=BUCKETS)
+        reference_downsample(path, path)
+        in_memory = downsample_pil(pad_pil(crop_pil(img)[0], buckets=BUCKETS))
+        assert np.array_equal(np.array(in_memory), np.array(Image.open(path)))
+
+
+def test_crop_blank_image():
+    blank = Image.new('RGB', (30, 20), (255, 255, 255))
+    cropped, found = crop_pil(blank)
+    assert not found and cropped.size == (30, 20) and cropped.mode == 'L'
+
+
+def load_img2latex():
+    try:
+        from latex_ocr import img2latex
+    except ImportError as e:
+        pytest.skip(f'img2latex dependencies missing: {e}')
+    return img2latex
+
+
+def test_preprocess_image_matches_file_path(tmpdir):
+    img2latex = load_img2latex()
+    for mode in MODES:
+        img = equation_image(mode, seed=2)
+        path = str(tmpdir.join(f'{mode}.png'))
+        img.save(path)
+        reference_crop(path, path)
+        reference_pad(path, path, buckets=img2latex.BUCKETS)
+        reference_downsample(path, path)
+        expected = np.array(Image.open(path))
+        last, processed = img2latex.preprocess_image(img, downsample_image_ratio=2, cropping=True, padding=True)
+        assert np.array_equal(processed, expected)
+        assert np.array_equal(last, img2latex.greyscale(expected))
+
+
+class FakeModel:
+    """
+    Records the batches it is given and predicts the shape and pixel sum of every image
+    """
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, images):
+        self.batches.append([image.shape for image in images])
+        return [[f'{image.shape}:{int(image.sum())}' for image in images]]
+
+
+def test_img2latex_batch_groups_and_keeps_order():
+    img2latex = load_img2latex()
+    sizes = [(150, 60), (40, 20), (150, 60), (90, 30), (40, 20), (150, 60), (40, 20)]
+    imgs = [Image.fromarray(np.random.RandomState(i).randint(0, 256, size=(h, w, 3)).astype(np.uint8)) for i, (w, h) in enumerate(sizes)]
+    model = FakeModel()
+    hyps = img2latex.img2latex_batch(model, imgs, max_batch=2)
+    expected = []
+    for img in imgs:
+        last, _ = img2latex.preprocess_image(img)
+        expected.append(f'{last.shape}:{int(last.sum())}')
+    assert hyps == expected
+    for batch in model.batches:
+        assert 1 <= len(batch) <= 2 and len(set(batch)) == 1
+    # three sizes, with 3, 3 and 1 images, in chunks of at most 2
+    assert sorted(len(batch) for batch in model.batches) == [1, 1, 1, 2, 2]
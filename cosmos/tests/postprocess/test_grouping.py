@@ -0,0 +1,46 @@
+"""
+Testing for the region grouping engine
+"""
+
+from postprocess.grouping import BoxIndex, ColumnIndex, merge_overlapping
+from postprocess.postprocess import group_cls
+
+
+def test_index_overlap_is_strict():
+    index = BoxIndex([[0, 0, 10, 10], [20, 0, 30, 10]])
+    assert index.any_overlap([5, 5, 15, 15])
+    assert not index.any_overlap([10, 0, 20, 10])
+    assert list(index.overlapping([5, 0, 25, 5])) == [0, 1]
+
+
+def test_column_index():
+    index = ColumnIndex([[0, 0, 10, 10], [5, 20, 15, 30]])
+    assert index.all_share_columns([6, 0, 9, 40])
+    assert not index.all_share_columns([10, 0, 20, 40])
+
+
+def test_merge_overlapping_chains():
+    nbhds = [([0, 0, 10, 10], 0.5), ([8, 0, 20, 10], 0.9), ([40, 40, 50, 50], 0.1), ([19, 5, 30, 30], 0.2)]
+    assert merge_overlapping(nbhds) == [([0, 0, 30, 30], 0.9), ([40, 40, 50, 50], 0.1)]
+
+
+def test_table_merge_emits_each_neighborhood_once():
+    obj_list = [('Table', [10, 10, 20, 20], 1), ('Body Text', [21, 10, 24, 20], 1), ('Table', [15, 15, 30, 30], 1)]
+    assert group_cls(obj_list, 'Table', do_table_merge=True) == [('Table', [10, 10, 30, 30], 1)]
+
+
+def test_index_leaves_cover_boxes():
+    boxes = [[x, y, x + 5, y + 5] for x in range(0, 200, 10) for y in range(0, 100, 10)]
+    index = BoxIndex(boxes)
+    assert len(index.leaf_starts) > 1
+    assert sorted(index.order) == list(range(len(boxes)))
+    for start, end, leaf in zip(index.leaf_starts, index.leaf_ends, index.leaf_boxes):
+        members = index.boxes[index.order[start:end]]
+        assert (members[:, :2] >= leaf[:2]).all() and (members[:, 2:] <= leaf[2:]).all()
+    assert list(index.overlapping([52, 52, 63, 63])) == [55, 56, 65, 66]
+
+
+def test_blocked_table_starts_closed_neighborhood():
+    obj_list = [('Table', [0, 0, 10, 10], 1), ('Body Text', [5, 5, 8, 8], 1),
+                ('Table', [20, 0, 30, 10], 1), ('Table', [40, 0, 50, 10], 1)]
+    assert group_cls(obj_list, 'Table') == [('Table', [0, 0, 10, 10], 1), ('Table', [20, 0, 50, 10], 1)]
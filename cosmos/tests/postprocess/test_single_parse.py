@@ -0,0 +1,47 @@
+"""
+Testing the single parse post-processing against the BeautifulSoup path
+"""
+
+import os
+import dominate
+from dominate.tags import div
+from dominate.util import raw
+from converters.xml2list import xml2list
+from postprocess.single_parse import bs4_page, postprocess_pages
+
+
+def hocr(text):
+    return (f"<div class='ocr_page' title='bbox 0 0 100 20'><div class='ocr_carea'><p class='ocr_par'>"
+            f"<span class='ocr_line' title='bbox 0 0 100 20'><span class='ocrx_word'>{text}</span></span>"
+            f"</p></div></div>")
+
+
+def write_page(path, regions):
+    doc = dominate.document(title='page')
+    with doc:
+        for ind, (cls, text, coords) in enumerate(regions):
+            with div(id=f'{cls}{ind}', cls=cls):
+                div(raw(hocr(text)), cls='hocr', data_coordinates=' '.join(str(c) for c in coords), data_score='0.9')
+                div(text, cls='equation_unicode')
+    with open(path, 'w', encoding='utf-8') as wf:
+        wf.write(doc.render())
+
+
+def test_matches_bs4_path(tmpdir):
+    html_dir, new_dir, bs4_dir = tmpdir.mkdir('html'), tmpdir.mkdir('new'), tmpdir.mkdir('bs4')
+    write_page(str(html_dir.join('doc.pdf_1.html')),
+               [('Body Text', 'Figure 3. A plot', [10, 10, 200, 40]), ('Table', 'Table 2 results', [10, 50, 200, 90]),
+                ('Body Text', 'Tab. 4 is below', [10, 100, 200, 140]), ('Figure', 'ünïcode & text', [10, 150, 200, 300]),
+                ('Section Header', 'Results', [10, 310, 200, 330])])
+    stats = postprocess_pages(str(html_dir), str(new_dir), str(new_dir), compare=True)
+    bs4_page(str(html_dir.join('doc.pdf_1.html')), str(bs4_dir), str(bs4_dir))
+    assert stats[0]['page'] == 'doc.pdf_1' and stats[0]['bs4_s'] is not None
+    new_list = xml2list(str(new_dir.join('doc.pdf_1.xml')), feather=False)
+    bs4_list = xml2list(str(bs4_dir.join('doc.pdf_1.xml')), feather=False)
+    assert new_list == bs4_list
+    assert [cls for cls, _, _ in new_list] == ['Figure Caption', 'Table', 'Table Caption', 'Figure', 'Section Header']
+    # The corrected html gives the same xml through the BeautifulSoup reader
+    reread_dir = tmpdir.mkdir('reread')
+    bs4_page(str(new_dir.join('doc.pdf_1.html')), str(reread_dir), str(reread_dir))
+    assert xml2list(str(reread_dir.join('doc.pdf_1.xml')), feather=False) == bs4_list
+    assert 'ünïcode' in open(str(new_dir.join('doc.pdf_1.html')), encoding='utf-8').read()
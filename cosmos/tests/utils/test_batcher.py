@@ -0,0 +1,40 @@
+"""
+Testing for the dynamic request batcher
+"""
+
+import threading
+import pytest
+from utils.batcher import DynamicBatcher
+
+
+def test_concurrent_requests_are_batched():
+    sizes = []
+    gate = threading.Event()
+
+    def process(items):
+        gate.wait(1)
+        sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = DynamicBatcher(process, max_batch=4, max_latency=0.5)
+    futures = [batcher.submit(i) for i in range(10)]
+    gate.set()
+    assert [future.result(5) for future in futures] == [i * 2 for i in range(10)]
+    batcher.stop(5)
+    assert sum(sizes) == 10
+    assert max(sizes) <= 4
+    assert len(sizes) < 10
+    metrics = batcher.metrics()
+    assert metrics['items'] == 10
+    assert metrics['queue_depth'] == 0
+    assert set(metrics['latency']) == {'queue', 'batch', 'total'}
+
+
+def test_failure_reaches_every_caller():
+    def process(items):
+        raise ValueError('bad batch')
+
+    batcher = DynamicBatcher(process, max_batch=2, max_latency=0.01)
+    with pytest.raises(ValueError, match='bad batch'):
+        batcher(1, timeout=5)
+    batcher.stop(5)
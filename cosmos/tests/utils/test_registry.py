@@ -0,0 +1,37 @@
+"""
+Testing for the process level resource registry
+"""
+
+import multiprocessing as mp
+import pytest
+from utils import registry
+
+loads = []
+
+
+def load_words():
+    loads.append(1)
+    return {'alpha', 'beta'}
+
+
+def child_loads(_):
+    registry.get('test_words')
+    return len(loads)
+
+
+def test_resource_loads_once_per_process():
+    registry.register('test_words', load_words)
+    assert not registry.is_loaded('test_words')
+    assert registry.get('test_words') == {'alpha', 'beta'}
+    assert registry.get('test_words') is registry.get('test_words')
+    assert len(loads) == 1
+    stats = [s for s in registry.load_stats() if s.name == 'test_words']
+    assert len(stats) == 1 and stats[0].load_s >= 0
+    # A forked worker loads its own copy, once
+    with mp.get_context('fork').Pool(1) as pool:
+        assert pool.map(child_loads, range(3)) == [2, 2, 2]
+
+
+def test_unknown_resource():
+    with pytest.raises(KeyError):
+        registry.get('not_registered')
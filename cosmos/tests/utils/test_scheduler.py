@@ -0,0 +1,45 @@
+"""
+Testing for the streaming stage scheduler
+"""
+
+import os
+import signal
+import pytest
+from utils.scheduler import Stage, run_stages, run_serial
+
+
+def split_range(n):
+    return [(n, page) for page in range(n)]
+
+
+def square(item):
+    n, page = item
+    if n == 3 and page == 1:
+        raise ValueError('bad page')
+    return [n * 100 + page]
+
+
+def test_stages_stream_every_item():
+    stages = [Stage('split', split_range, workers=2, maxsize=2), Stage('square', lambda item: [item], workers=3, maxsize=1)]
+    expected = sorted(run_serial(range(12), stages))
+    assert len(expected) == sum(range(12))
+    assert sorted(run_stages(range(12), stages)) == expected
+
+
+def test_stage_failure_is_reported():
+    stages = [Stage('split', split_range, workers=2), Stage('square', square, workers=2)]
+    with pytest.raises(RuntimeError, match='square failed'):
+        run_stages([1, 3, 4], stages)
+
+
+def crash(item):
+    if item == 2:
+        # A worker killed mid item, as by the OOM killer
+        os.kill(os.getpid(), signal.SIGKILL)
+    return [item]
+
+
+def test_dead_worker_fails_the_run():
+    stages = [Stage('split', lambda item: [item], workers=2), Stage('crash', crash, workers=2)]
+    with pytest.raises(RuntimeError, match='crash-worker'):
+        run_stages(range(5), stages)
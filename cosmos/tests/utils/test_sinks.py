@@ -0,0 +1,26 @@
+"""
+Testing the streaming table sinks
+"""
+
+import pandas as pd
+from utils.sinks import CsvSink, ParquetSink, table_sink
+
+
+def test_csv_sink_matches_concat(tmpdir):
+    dfs = [pd.DataFrame({'a': ['x', None], 'b': [1, 2]}), pd.DataFrame({'a': ['y'], 'b': [3]})]
+    path = str(tmpdir.join('out.csv'))
+    with CsvSink(path) as sink:
+        for df in dfs:
+            sink.write(df)
+            # Every chunk is on disk as soon as it is written
+            assert len(pd.read_csv(path)) == sink.rows
+    expected = str(tmpdir.join('expected.csv'))
+    pd.concat(dfs).to_csv(expected, index=False)
+    assert open(path).read() == open(expected).read()
+
+
+def test_sink_is_created_lazily(tmpdir):
+    path = tmpdir.join('empty.csv')
+    table_sink(str(path)).close()
+    assert not path.exists()
+    assert isinstance(table_sink(str(tmpdir.join('t.parquet'))), ParquetSink)
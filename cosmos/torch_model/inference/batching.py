@@ -0,0 +1,91 @@
+"""
+Page batched featurization for inference
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+
+def batch_norm_in_training(module):
+    """
+    :param module: nn.Module
+    :return: True if any BatchNorm2d in the module normalizes with batch statistics
+    """
+    return any(isinstance(m, nn.BatchNorm2d) and m.training for m in module.modules())
+
+
+def _grouped_bn_forward(bn, group_size, x):
+    n, c, h, w = x.shape
+    groups = n // group_size
+    if groups == 1:
+        return F.batch_norm(x, None, None, bn.weight, bn.bias, True, 0.0, bn.eps)
+    # Fold the groups into the channel dimension so each (group, channel) pair gets its own statistics
+    folded = x.view(groups, group_size, c, h, w).transpose(0, 1).reshape(group_size, groups * c, h, w)
+    weight = bn.weight.repeat(groups) if bn.weight is not None else None
+    bias = bn.bias.repeat(groups) if bn.bias is not None else None
+    out = F.batch_norm(folded, None, None, weight, bias, True, 0.0, bn.eps)
+    return out.view(group_size, groups, c, h, w).transpose(0, 1).reshape(n, c, h, w)
+
+
+@contextmanager
+def grouped_batch_norm(module, group_size):
+    """
+    Make train mode batch norm layers compute their statistics over consecutive groups of group_size
+    samples, so one forward pass over G groups gives the outputs of G separate forward passes.
+    Running statistics are not updated inside the context.
+    :param module: nn.Module
+    :param group_size: number of samples per group
+    """
+    bns = [m for m in module.modules() if isinstance(m, nn.BatchNorm2d) and m.training]
+    for bn in bns:
+        bn.forward = partial(_grouped_bn_forward, bn, group_size)
+    try:
+        yield module
+    finally:
+        for bn in bns:
+            del bn.forward
+
+
+def _featurize_chunked(featurizer, windows, device, max_batch):
+    return torch.cat([featurizer(windows[start:start + max_batch], device) for start in range(0, windows.shape[0], max_batch)])
+
+
+def featurize_page(featurizer, windows, ncenters, neighbor_idxs, device, max_batch=64):
+    """
+    Featurize the windows of a page in as few backbone passes as possible
+    :param featurizer: Featurizer module
+    :param windows: [M x 3 x W x W] page windows, the first ncenters are the proposals
+    :param ncenters: number of proposals
+    :param neighbor_idxs: per proposal LongTensor of window indices of its neighbors
+    :param device: Device config
+    :param max_batch: maximum windows per backbone pass
+    :return: [ncenters x D x H x W] proposal maps, per proposal [K x D x H x W] neighbor maps
+    """
+    if not batch_norm_in_training(featurizer):
+        # Features do not depend on the batch: featurize every window once and gather neighbors by index
+        maps = _featurize_chunked(featurizer, windows, device, max_batch)
+        return maps[:ncenters], [maps[idxs.to(maps.device)] for idxs in neighbor_idxs]
+    # Train mode batch norm normalizes with batch statistics. The per proposal path featurizes each
+    # proposal alone and each neighbor set as one batch, so reproduce those groups exactly.
+    with grouped_batch_norm(featurizer, 1):
+        centers = _featurize_chunked(featurizer, windows[:ncenters], device, max_batch)
+    # Identical neighbor sets give identical maps, bucket the distinct sets by size
+    buckets = OrderedDict()
+    for idxs in neighbor_idxs:
+        key = tuple(idxs.tolist())
+        buckets.setdefault(len(key), OrderedDict())[key] = None
+    set_maps = {}
+    for size, sets in buckets.items():
+        sets = list(sets)
+        per_pass = max(1, max_batch // size)
+        with grouped_batch_norm(featurizer, size):
+            for start in range(0, len(sets), per_pass):
+                chunk = sets[start:start + per_pass]
+                idxs = torch.tensor([ind for key in chunk for ind in key], dtype=torch.long, device=windows.device)
+                maps = featurizer(windows[idxs], device)
+                for ind, key in enumerate(chunk):
+                    set_maps[key] = maps[ind * size:(ind + 1) * size]
+    return centers, [set_maps[tuple(idxs.tolist())] for idxs in neighbor_idxs]
@@ -5,16 +5,18 @@ Utilities for loading inference data into the model
 from ingestion.ingest_images import load_image, load_proposal, get_example_for_uuid
 from torch.utils.data import Dataset
 import torch
+import numpy as np
 import os
 from os.path import splitext
 from torch_model.train.data_layer.xml_loader import XMLLoader
 from torchvision.transforms import ToTensor
 from torch_model.train.data_layer.transforms import NormalizeWrapper
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 normalizer = NormalizeWrapper(mean=[0.485, 0.456, 0.406],std=[0.229, 0.224, 0.225])
 tens = ToTensor()
 Document = namedtuple("Document", ["windows", "proposals", "identifier"])
+PageExamples = namedtuple("PageExamples", ["page_id", "center_bbs", "windows", "neighbor_idxs", "neighbor_boxes"])
 
 class InferenceLoader(XMLLoader):
     """
@@ -24,7 +26,7 @@ class InferenceLoader(XMLLoader):
     def __init__(self, session, ingest_objs, classes):
         """
         Init function
-        :param session: DB Session
+        :param session: ArrayStore holding the ingested examples
         :param ingest_objs: Database statistics object
         :param classes: List of classes
         """
@@ -54,4 +56,48 @@ class InferenceLoader(XMLLoader):
         ex_db = get_example_for_uuid(uuid, self.session)
         return example, ex_db
 
-#
+    def pages(self):
+        """
+        Group the examples by page for page batched inference. The windows of a page are one slice of
+        the store, neighbors refer to them by index. Proposals keep the dataset order within a page.
+        :return: generator of PageExamples
+        """
+        store = self.session
+        page_rows = OrderedDict()
+        for uuid in self.uuids:
+            row = store.row(uuid)
+            page_rows.setdefault(store.page_id(row), []).append(row)
+        for page_id, rows in page_rows.items():
+            start, stop = store.page_rows(page_id)
+            centers = set(rows)
+            order = rows + [row for row in range(start, stop) if row not in centers]
+            if order == list(range(start, stop)):
+                windows = store.window_array(slice(start, stop))
+            else:
+                windows = store.window_array(np.array(order))
+            windows = [torch.from_numpy(windows)]
+            index = {row: idx for idx, row in enumerate(order)}
+            nwindows = len(order)
+            zero_idx = None
+            neighbor_idxs = []
+            neighbor_boxes = []
+            for row in rows:
+                neighbors = store.neighbors(row)
+                if len(neighbors) == 0:
+                    # Same placeholder as XMLLoader: two blank windows with zero boxes
+                    if zero_idx is None:
+                        zero_idx = nwindows
+                        nwindows += 1
+                        windows.append(torch.zeros((1,) + tuple(windows[0].shape[1:])))
+                    neighbor_idxs.append(torch.tensor([zero_idx, zero_idx], dtype=torch.long))
+                    neighbor_boxes.append(torch.zeros(2, 4))
+                    continue
+                for nbhr in neighbors:
+                    if nbhr not in index:
+                        index[nbhr] = nwindows
+                        nwindows += 1
+                        windows.append(torch.from_numpy(store.window_array(slice(nbhr, nbhr + 1))))
+                neighbor_idxs.append(torch.tensor([index[nbhr] for nbhr in neighbors], dtype=torch.long))
+                neighbor_boxes.append(torch.from_numpy(store.bboxes[neighbors]))
+            yield PageExamples(page_id=page_id, center_bbs=[torch.from_numpy(np.array(store.bboxes[row])) for row in rows],
+                               windows=torch.cat(windows), neighbor_idxs=neighbor_idxs, neighbor_boxes=neighbor_boxes)
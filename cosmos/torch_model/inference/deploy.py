@@ -0,0 +1,144 @@
+"""
+Deployment mode for CPU inference.
+Batch norm statistics are calibrated on a sample of pages and frozen, batch
+norm is folded into the preceding convolutions, the backbone runs in
+channels last memory format and the linear layers of the embedder and head
+can be dynamically quantized to int8.
+"""
+import torch
+from torch import nn
+
+BN_MODES = ('batch', 'frozen', 'fused', 'int8')
+
+
+class _Identity(nn.Module):
+    def forward(self, x):
+        return x
+
+
+class ChannelsLast(nn.Module):
+    """
+    Run a module on channels last inputs and hand back contiguous outputs
+    """
+    def __init__(self, module):
+        super(ChannelsLast, self).__init__()
+        self.module = module.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        return self.module(x.contiguous(memory_format=torch.channels_last)).contiguous()
+
+
+def set_batch_norm_training(module, training):
+    for m in module.modules():
+        if isinstance(m, nn.BatchNorm2d):
+            m.train(training)
+
+
+def calibrate_batch_norm(featurizer, batches, device):
+    """
+    Replace the running statistics of every batch norm layer by their average over the calibration batches
+    :param featurizer: Featurizer module
+    :param batches: iterable of [N x 3 x W x W] window tensors
+    :param device: Device config
+    :return: number of calibration windows
+    """
+    bns = [m for m in featurizer.modules() if isinstance(m, nn.BatchNorm2d)]
+    momentums = [bn.momentum for bn in bns]
+    for bn in bns:
+        bn.reset_running_stats()
+        # A momentum of None keeps a cumulative average over all calibration batches
+        bn.momentum = None
+        bn.train()
+    nwindows = 0
+    with torch.no_grad():
+        for windows in batches:
+            featurizer(windows.to(device), device)
+            nwindows += windows.shape[0]
+    for bn, momentum in zip(bns, momentums):
+        bn.momentum = momentum
+        bn.eval()
+    return nwindows
+
+
+def fuse_conv_bn(conv, bn):
+    """
+    :param conv: Conv2d
+    :param bn: eval mode BatchNorm2d following conv
+    :return: Conv2d computing bn(conv(x))
+    """
+    fused = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, stride=conv.stride,
+                      padding=conv.padding, dilation=conv.dilation, groups=conv.groups, bias=True)
+    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias.detach() if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    with torch.no_grad():
+        fused.weight.copy_(conv.weight.detach() * scale.reshape(-1, 1, 1, 1))
+        fused.bias.copy_((bias - bn.running_mean) * scale + bn.bias.detach())
+    return fused.to(conv.weight.device)
+
+
+def fold_batch_norm(module):
+    """
+    Fold every batch norm layer that directly follows a convolution into it, in place.
+    Covers consecutive Sequential entries and the convK/bnK attribute pairs of ResNet blocks.
+    :param module: nn.Module with frozen batch norm statistics
+    :return: number of folded layers
+    """
+    nfolded = 0
+    children = list(module.named_children())
+    for (prev_name, prev), (name, child) in zip(children, children[1:]):
+        if isinstance(module, nn.Sequential) and isinstance(prev, nn.Conv2d) and isinstance(child, nn.BatchNorm2d):
+            setattr(module, prev_name, fuse_conv_bn(prev, child))
+            setattr(module, name, _Identity())
+            nfolded += 1
+    for name, child in list(module.named_children()):
+        conv = getattr(module, 'conv' + name[2:], None) if name.startswith('bn') else None
+        if isinstance(child, nn.BatchNorm2d) and isinstance(conv, nn.Conv2d):
+            setattr(module, 'conv' + name[2:], fuse_conv_bn(conv, child))
+            setattr(module, name, _Identity())
+            nfolded += 1
+    for child in module.children():
+        nfolded += fold_batch_norm(child)
+    return nfolded
+
+
+def quantize_linear(model):
+    """
+    Dynamically quantize the linear layers of the embedder and head to int8
+    :param model: MMFasterRCNN on the CPU
+    """
+    model.embedder = torch.quantization.quantize_dynamic(model.embedder, {nn.Linear}, dtype=torch.qint8)
+    model.head = torch.quantization.quantize_dynamic(model.head, {nn.Linear}, dtype=torch.qint8)
+
+
+def prepare_model(model, bn_mode, calibration_batches=None, device=torch.device('cpu')):
+    """
+    Put a model with loaded weights in one of the inference modes
+    :param model: MMFasterRCNN
+    :param bn_mode: 'batch' normalizes with batch statistics (the training behavior), 'frozen' calibrates and freezes
+                    the statistics, 'fused' also folds them into the convolutions and uses channels last, 'int8'
+                    also quantizes the embedder and head
+    :param calibration_batches: iterable of window tensors to calibrate on, required unless bn_mode is 'batch'
+    :param device: Device config
+    :return: model
+    """
+    if bn_mode not in BN_MODES:
+        raise ValueError(f'Unknown bn_mode {bn_mode}, expected one of {BN_MODES}')
+    model.eval()
+    if bn_mode == 'batch':
+        set_batch_norm_training(model, True)
+        return model
+    if calibration_batches is None:
+        raise ValueError(f'bn_mode {bn_mode} needs calibration batches')
+    nwindows = calibrate_batch_norm(model.featurizer, calibration_batches, device)
+    print(f"calibrated batch norm on {nwindows} windows")
+    if bn_mode == 'frozen':
+        return model
+    nfolded = fold_batch_norm(model.featurizer)
+    print(f"folded {nfolded} batch norm layers")
+    if hasattr(torch, 'channels_last'):
+        model.featurizer.backbone = ChannelsLast(model.featurizer.backbone)
+    if bn_mode == 'int8':
+        if device.type != 'cpu':
+            raise ValueError('int8 quantization is only supported on the cpu')
+        quantize_linear(model)
+    return model
@@ -1,10 +1,12 @@
 from torch.utils.data import DataLoader
 import torch
 from torch_model.train.data_layer.xml_loader import get_colorfulness, get_radii, get_angles
+from torch_model.inference.batching import featurize_page
 from pascal_voc_writer import Writer
-from os.path import join, isdir
-from os import mkdir
+from os.path import join, isdir, exists
+from os import mkdir, replace, remove
 from tqdm import tqdm
+from timeit import default_timer as timer
 
 class InferenceHelper:
     def __init__(self, model, dataset, device):
@@ -18,17 +20,47 @@ class InferenceHelper:
         self.device = device
         self.cls = [val for val in model.cls_names]
 
-    def run(self,out):
+    def run(self, out, page_batched=True, max_batch=64):
         """
         run inference
         :param out: the directory to output xmls
-        :return:
+        :param page_batched: featurize the windows of a page together instead of one proposal at a time
+        :param max_batch: maximum windows per backbone pass in page batched mode
+        :return: proposals per second
 
         """
         if not isdir(out):
             mkdir(out)
+        start = timer()
+        if page_batched:
+            # Every page's xml is written as soon as its proposals are classified, nothing is kept for the corpus
+            _, nproposals = self._run_pages(max_batch, on_page=lambda pid, preds: self._write_xml(pid, preds, out))
+        else:
+            xml_dict, nproposals = self._run_proposals()
+            self._write_xmls(xml_dict, out)
+        elapsed = timer() - start
+        print(f"{nproposals} proposals in {elapsed:.2f} s, {nproposals / max(elapsed, 1e-9):.2f} proposals/s")
+        return nproposals / max(elapsed, 1e-9)
+
+    def predict(self, page_batched=True, max_batch=64):
+        """
+        Classify every proposal of the dataset
+        :param page_batched: featurize the windows of a page together instead of one proposal at a time
+        :param max_batch: maximum windows per backbone pass in page batched mode
+        :return: {page_id: [(bb, pred, prob)]}, number of proposals
+        """
+        if page_batched:
+            return self._run_pages(max_batch)
+        return self._run_proposals()
+
+    def _run_proposals(self):
+        """
+        Per proposal inference, every proposal featurizes its own window and its neighbors
+        :return: {page_id: [(bb, pred, prob)]}, number of proposals
+        """
         loader = DataLoader(self.dataset, batch_size=1, collate_fn=self.dataset.collate)
         xml_dict = {}
+        nproposals = 0
         for ex in tqdm(loader):
             batch, db_ex = ex
             page_id = db_ex.page_id
@@ -40,24 +72,85 @@ class InferenceHelper:
             windows_sub = windows[0]
             ex_sub = ex[0].unsqueeze(0)
             rois, cls_scores = self.model(ex_sub, windows_sub,radii, angles, ex_color, batch.center_bbs, self.device)
-            #probabilities = torch.nn.functional.softmax(cls_scores).squeeze()
-            probs, pred_idxs = torch.max(cls_scores, dim=1)
-            probabilities = cls_scores.squeeze()
-            bb = batch.center_bbs[0]
-            pred = self.cls[pred_idxs[0]]
-            if page_id in xml_dict:
-                xml_dict[page_id].append((bb, pred, float(probabilities[pred_idxs[0]].item())))
-            else:
-                xml_dict[page_id]= [(bb, pred, float(probabilities[pred_idxs[0]].item()))]
+            self._add_prediction(xml_dict, page_id, batch.center_bbs[0], cls_scores)
+            nproposals += 1
+        return xml_dict, nproposals
 
+    def _run_pages(self, max_batch, on_page=None):
+        """
+        Page batched inference, the backbone runs over all windows of a page in a few passes
+        :param max_batch: maximum windows per backbone pass
+        :param on_page: optional function called with (page_id, [(bb, pred, prob)]) when a page is done,
+                        finished pages are then not kept in the returned dict
+        :return: {page_id: [(bb, pred, prob)]}, number of proposals
+        """
+        xml_dict = {}
+        nproposals = 0
+        for page in tqdm(self.dataset.pages()):
+            windows = page.windows.to(self.device)
+            ncenters = len(page.center_bbs)
+            center_maps, neighbor_maps = featurize_page(self.model.featurizer, windows, ncenters,
+                                                        page.neighbor_idxs, self.device, max_batch)
+            for idx, bb in enumerate(page.center_bbs):
+                ex_color = get_colorfulness(windows[idx:idx+1]).to(self.device).reshape(-1,1)
+                radii = get_radii(bb, page.neighbor_boxes[idx]).to(self.device).reshape(-1,1)
+                angles = get_angles(bb, page.neighbor_boxes[idx]).to(self.device).reshape(-1,1)
+                cls_scores = self.model.classify(center_maps[idx:idx+1], neighbor_maps[idx], radii, angles,
+                                                 ex_color, bb.unsqueeze(0), self.device)
+                self._add_prediction(xml_dict, page.page_id, bb, cls_scores)
+            nproposals += ncenters
+            if on_page is not None and page.page_id in xml_dict:
+                on_page(page.page_id, xml_dict.pop(page.page_id))
+        return xml_dict, nproposals
+
+    def _add_prediction(self, xml_dict, page_id, bb, cls_scores):
+        #probabilities = torch.nn.functional.softmax(cls_scores).squeeze()
+        probs, pred_idxs = torch.max(cls_scores, dim=1)
+        probabilities = cls_scores.squeeze()
+        pred = self.cls[pred_idxs[0]]
+        if page_id in xml_dict:
+            xml_dict[page_id].append((bb, pred, float(probabilities[pred_idxs[0]].item())))
+        else:
+            xml_dict[page_id]= [(bb, pred, float(probabilities[pred_idxs[0]].item()))]
+
+    @staticmethod
+    def xml_string(predictions):
+        """
+        VOC xml of one page, rendered in memory
+        :param predictions: [(bb, pred, prob)] of the page
+        :return: xml text, the same as the file _write_xml writes
+        """
+        writer = Writer("", 1000,1000)
+        for obj in predictions:
+            bb, pred, probs = obj
+            x0, y0, x1, y1 = bb.long().tolist()
+            writer.addObject(pred, x0, y0, x1, y1,difficult=float(probs))
+        return writer.annotation_template.render(**writer.template_parameters)
+
+    @staticmethod
+    def _write_xml(pid, predictions, out):
+        """
+        Write the xml of one page. The file is renamed into place, so a reader never sees a partial xml,
+        and the temporary file is removed if writing fails
+        :param pid: page id
+        :param predictions: [(bb, pred, prob)] of the page
+        :param out: output directory
+        """
+        xml = InferenceHelper.xml_string(predictions)
+        tmp_path = join(out, f".{pid}.xml.tmp")
+        try:
+            with open(tmp_path, 'w') as wf:
+                wf.write(xml)
+            replace(tmp_path, join(out, f"{pid}.xml"))
+        except BaseException:
+            if exists(tmp_path):
+                remove(tmp_path)
+            raise
 
+    @staticmethod
+    def _write_xmls(xml_dict, out):
         for pid in xml_dict:
-            writer = Writer("", 1000,1000)
-            for obj in xml_dict[pid]:
-                bb, pred, probs = obj
-                x0, y0, x1, y1 = bb.long().tolist()
-                writer.addObject(pred, x0, y0, x1, y1,difficult=float(probs))
-            writer.save(join(out, f"{pid}.xml"))
+            InferenceHelper._write_xml(pid, xml_dict[pid], out)
 
     def _get_predictions(self, windows, proposals):
         """
@@ -7,29 +7,28 @@ import torch
 from torch import nn
 from torch.nn.functional import softmax
 
-# TODO this code does not yet support batching
 
 class ScaledDotProductAttention(nn.Module):
     def __init__(self):
         super(ScaledDotProductAttention, self).__init__()
 
-    def forward(self, Q, K, V):
+    def forward(self, Q, K, V, mask=None):
         """
-        Scaled Dot Product Attention for Images
-        Q = [1 x Dims]
-        K = [M x Dims]
-        V = [M x H x W x 3]
+        Scaled Dot Product Attention for Images, batched over examples and heads
+        Q = [B x heads x Dims]
+        K = [B x heads x M x Dims]
+        V = [B x M x D x H x W]
+        mask = [B x M], nonzero for real neighbors. Every example needs at least one.
+        :return: [B x heads x D x H x W]
         """
-        neighbors, dim = K.shape
-        logits = torch.matmul(Q, K.t())
+        B, nheads, neighbors, dim = K.shape
+        logits = torch.matmul(K, Q.unsqueeze(-1)).squeeze(-1)
         logits = torch.div(logits, dim)
-        weights = softmax(logits, dim=1)
-        weighted_V = []
-        for idx in range(V.shape[0]):
-            weighted_V.append(V[idx]*weights[0,idx])
-        V = torch.stack(weighted_V)
-        del weighted_V
-        return torch.sum(V, dim=0)
+        if mask is not None:
+            logits = logits.masked_fill((mask == 0).unsqueeze(1), float('-inf'))
+        weights = softmax(logits, dim=2)
+        out = torch.bmm(weights, V.reshape(B, neighbors, -1))
+        return out.view((B, nheads) + tuple(V.shape[2:]))
 
 
 
@@ -42,8 +41,26 @@ class MultiHeadAttention(nn.Module):
         self.Q_heads = nn.ModuleList([nn.Linear(emb_dim, emb_dim) for i in range(nheads)])
         self.K_heads = nn.ModuleList([nn.Linear(emb_dim, emb_dim) for i in range(nheads)])
 
-    def forward(self, Q, K,V):
-        new_qs = [Q_head(Q) for Q_head in self.Q_heads]
-        new_ks = [K_head(K) for K_head in self.K_heads]
-        head_results = torch.stack([self.attention(new_qs[i], new_ks[i], V) for i in range(self.nheads)])
-        return head_results
+    @staticmethod
+    def _project(heads, x):
+        """
+        Apply every head's projection in one broadcast matmul
+        :param heads: ModuleList of Linear
+        :param x: [... x Dims]
+        :return: [... x heads x Dims]
+        """
+        weight = torch.stack([head.weight for head in heads])
+        bias = torch.stack([head.bias for head in heads])
+        return torch.matmul(x.unsqueeze(-2).unsqueeze(-2), weight.transpose(1, 2)).squeeze(-2) + bias
+
+    def forward(self, Q, K, V, mask=None):
+        """
+        :param Q: [B x Dims] query embeddings
+        :param K: [B x M x Dims] neighbor embeddings
+        :param V: [B x M x D x H x W] neighbor maps
+        :param mask: [B x M] padding mask, nonzero for real neighbors
+        :return: [B x heads x D x H x W]
+        """
+        new_qs = self._project(self.Q_heads, Q)
+        new_ks = self._project(self.K_heads, K).transpose(1, 2)
+        return self.attention(new_qs, new_ks, V, mask)
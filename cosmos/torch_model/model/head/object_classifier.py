@@ -40,22 +40,18 @@ class MultiModalClassifier(nn.Module):
     def forward(self, roi_maps,attn_maps, colors,proposals=None):
         """
 
-        :param roi_maps: [NxLxDHxW]
-        :return:
+        :param roi_maps: [N x D x H x W]
+        :param attn_maps: [N x nheads x D x H x W]
+        :param colors: [N x 1]
+        :return: [N x ncls] class scores
         """
         N, D, H, W = roi_maps.shape
         x = roi_maps.view(N, self.depth * self.width * self.height)
-        attn_maps = attn_maps.view(N, self.nheads, self.depth * self.width *self.height)
-        attn_processed = []
-        for i in range(self.nheads):
-            sub_maps = attn_maps[0,i]
-            processed = self.attn_FC(sub_maps)
-            processed.reshape(-1)
-            attn_processed.append(processed)
-        attn_processed = torch.stack(attn_processed)
+        attn_maps = attn_maps.reshape(N, self.nheads, self.depth * self.width *self.height)
+        attn_processed = self.attn_FC(attn_maps)
         x = self.FC(x)
-        x = torch.cat((x, attn_processed))
-        x = x.view(1,(self.nheads+1)*self.intermediate)
+        x = torch.cat((x.unsqueeze(1), attn_processed), dim=1)
+        x = x.view(N,(self.nheads+1)*self.intermediate)
         x = torch.cat((x, colors), dim=1)
         x = self.dropout(x)
         x = relu(x)
@@ -39,26 +39,56 @@ class MMFasterRCNN(nn.Module):
         self.cls_names = cfg.CLASSES
 
 
-    def forward(self, input_windows,neighbor_windows, radii, angles, colors,proposals, device):
+    def forward(self, input_windows,neighbor_windows, radii, angles, colors,proposals, device, neighbor_mask=None):
         """
         Process an Image through the network
-        :param input_windows: Tensor representing target window pixels
-        :param neighbor_windows: Tensor representing neighbor window pixels
-        :param radii: neighborhood embedding radii
-        :param angles: neighborhood angle input
-        :param colors: Color input
+        :param input_windows: Tensor representing target window pixels, [N x 3 x W x W]
+        :param neighbor_windows: Tensor representing neighbor window pixels, [M x 3 x W x W] for a single
+                                 example or [N x M x 3 x W x W] padded neighborhoods for a batch
+        :param radii: neighborhood embedding radii, [M x 1] or [N x M]
+        :param angles: neighborhood angle input, [M x 1] or [N x M]
+        :param colors: Color input, [N x 1]
         :param proposals: proposals list
         :param device: Device config
+        :param neighbor_mask: [N x M] padding mask of a batch, nonzero for real neighbors
         :return: proposals, associated class scores
         """
         maps = self.featurizer(input_windows, device)
-        V = self.featurizer(neighbor_windows, device)
-        Q = self.embedder(maps, torch.tensor([[0.0]]).to(device),torch.tensor([[0.0]]).to(device))
-        K = self.embedder(V, radii, angles)
-        attn_maps = self.attention(Q,K,V)
-        cls_scores = self.head(maps, attn_maps,colors, proposals)
+        if neighbor_windows.dim() == 4:
+            V = self.featurizer(neighbor_windows, device)
+        else:
+            N, M = neighbor_windows.shape[:2]
+            if neighbor_mask is None:
+                neighbor_mask = torch.ones(N, M, device=neighbor_windows.device) > 0
+            # Only real neighbors go through the backbone, padding stays out of the batch norm statistics
+            real = self.featurizer(neighbor_windows[neighbor_mask], device)
+            V = real.new_zeros((N, M) + tuple(real.shape[1:]))
+            V[neighbor_mask] = real
+        cls_scores = self.classify(maps, V, radii, angles, colors, proposals, device, neighbor_mask)
         return proposals, cls_scores
 
+    def classify(self, maps, V, radii, angles, colors, proposals, device, neighbor_mask=None):
+        """
+        Classify featurized windows given their featurized neighbors
+        :param maps: Target window feature maps, [N x D x H x W]
+        :param V: Neighbor window feature maps, [M x D x H x W] for a single example or [N x M x D x H x W]
+        :param radii: neighborhood embedding radii, [M x 1] or [N x M]
+        :param angles: neighborhood angle input, [M x 1] or [N x M]
+        :param colors: Color input, [N x 1]
+        :param proposals: proposals list
+        :param device: Device config
+        :param neighbor_mask: [N x M] padding mask, nonzero for real neighbors
+        :return: class scores
+        """
+        if V.dim() == 4:
+            V = V.unsqueeze(0)
+        N, M = V.shape[:2]
+        zeros = torch.zeros(N, 1, device=maps.device)
+        Q = self.embedder(maps, zeros, zeros)
+        K = self.embedder(V.reshape((N * M,) + tuple(V.shape[2:])), radii.reshape(-1, 1), angles.reshape(-1, 1))
+        attn_maps = self.attention(Q, K.view(N, M, -1), V, neighbor_mask)
+        return self.head(maps, attn_maps,colors, proposals)
+
  
     def set_weights(self,mean, std):
         '''
@@ -22,13 +22,16 @@ def get_anno_dir(root):
 def get_proposal_dir(root):
     return join(root, "proposals")
 
-def get_dataset(dir, warped_size, expansion_delta, img_type, partition):
+def get_dataset(dir, warped_size, expansion_delta, img_type, partition, neighborhood='overlap', max_neighbors=None, extractor='pil'):
     session, ingest_objs = ImageDB.initialize_and_ingest(get_img_dir(dir),
                                                          get_proposal_dir(dir),
                                                          get_anno_dir(dir),
                                                          warped_size,
                                                          partition,
-                                                         expansion_delta)
+                                                         expansion_delta,
+                                                         neighborhood=neighborhood,
+                                                         max_neighbors=max_neighbors,
+                                                         extractor=extractor)
     dataset = XMLLoader(session, ingest_objs)
     embedding_dataset = ImageEmbeddingDataset(session, ingest_objs)
     return dataset
@@ -41,8 +44,11 @@ class ModelBuilder:
         self.device = device
         with open(start_train) as stream:
             self.train_config = yaml.load(stream)
-        self.train_set = get_dataset(train_dir, warped_size, expansion_delta, "png", 'train')
-        self.val_set = get_dataset(val_dir, warped_size, expansion_delta, "png", 'val')
+        neighborhood = getattr(self.config, "NEIGHBORHOOD", "overlap")
+        max_neighbors = getattr(self.config, "MAX_NEIGHBORS", None)
+        extractor = getattr(self.config, "WINDOW_EXTRACTOR", "pil")
+        self.train_set = get_dataset(train_dir, warped_size, expansion_delta, "png", 'train', neighborhood, max_neighbors, extractor)
+        self.val_set = get_dataset(val_dir, warped_size, expansion_delta, "png", 'val', neighborhood, max_neighbors, extractor)
 
     def build(self, params):
         self.build_cfg(params)
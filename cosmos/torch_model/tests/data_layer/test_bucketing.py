@@ -0,0 +1,37 @@
+from cosmos.torch_model.train.data_layer.bucketing import NeighborBucketSampler, padding_waste, sequential_batches
+import unittest
+import numpy as np
+
+
+class TestBucketing(unittest.TestCase):
+    def setUp(self):
+        self.counts = np.array([2, 16, 3, 2, 15, 4, 16, 2, 3])
+
+    def test_padding_waste(self):
+        stats = padding_waste([2, 4, 4], [[0, 1], [2]])
+        self.assertEqual(stats.real, 10)
+        self.assertEqual(stats.padded, 12)
+        self.assertAlmostEqual(stats.waste, 2 / 12)
+
+    def test_batches_cover_examples(self):
+        sampler = NeighborBucketSampler(self.counts, 4, seed=0)
+        batches = sampler.batches()
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(self.counts))))
+        self.assertTrue(all(len(batch) <= 4 for batch in batches))
+
+    def test_bucketing_reduces_waste(self):
+        sampler = NeighborBucketSampler(self.counts, 3, seed=0)
+        bucketed = padding_waste(self.counts, sampler.batches())
+        sequential = padding_waste(self.counts, sequential_batches(len(self.counts), 3))
+        self.assertEqual(bucketed.real, sequential.real)
+        self.assertLess(bucketed.padded, sequential.padded)
+
+    def test_no_shuffle_is_sorted(self):
+        sampler = NeighborBucketSampler(self.counts, 2, shuffle=False)
+        flat = [i for batch in sampler for i in batch]
+        self.assertEqual(list(self.counts[flat]), sorted(self.counts))
+
+
+if __name__ == '__main__':
+    unittest.main()
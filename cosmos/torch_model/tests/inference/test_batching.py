@@ -0,0 +1,50 @@
+import unittest
+import torch
+from torch import nn
+from cosmos.torch_model.inference.batching import grouped_batch_norm, featurize_page
+
+
+class TinyFeaturizer(nn.Module):
+    def __init__(self):
+        super(TinyFeaturizer, self).__init__()
+        self.backbone = nn.Sequential(nn.Conv2d(3, 4, 3), nn.BatchNorm2d(4), nn.ReLU())
+
+    def forward(self, windows, device):
+        return self.backbone(windows)
+
+
+class TestBatching(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.featurizer = TinyFeaturizer()
+        self.windows = torch.rand(7, 3, 9, 9)
+        self.neighbor_idxs = [torch.tensor([1, 2]), torch.tensor([0, 2, 3]), torch.tensor([1, 2]), torch.tensor([6, 6])]
+
+    def test_grouped_batch_norm_matches_separate_passes(self):
+        self.featurizer.train()
+        separate = torch.cat([self.featurizer(self.windows[i:i + 2], None) for i in range(0, 6, 2)])
+        with grouped_batch_norm(self.featurizer, 2):
+            grouped = self.featurizer(self.windows[:6], None)
+        self.assertTrue(torch.allclose(separate, grouped, atol=1e-6))
+        # the patched forward is removed on exit
+        self.assertTrue(torch.allclose(self.featurizer(self.windows[:2], None), separate[:2], atol=1e-6))
+
+    def test_featurize_page_train_mode(self):
+        self.featurizer.train()
+        centers, neighbors = featurize_page(self.featurizer, self.windows, 4, self.neighbor_idxs, None, max_batch=3)
+        for i in range(4):
+            self.assertTrue(torch.allclose(centers[i:i + 1], self.featurizer(self.windows[i:i + 1], None), atol=1e-6))
+            expected = self.featurizer(self.windows[self.neighbor_idxs[i]], None)
+            self.assertTrue(torch.allclose(neighbors[i], expected, atol=1e-6))
+
+    def test_featurize_page_eval_mode(self):
+        self.featurizer.eval()
+        centers, neighbors = featurize_page(self.featurizer, self.windows, 4, self.neighbor_idxs, None)
+        maps = self.featurizer(self.windows, None)
+        self.assertTrue(torch.allclose(centers, maps[:4], atol=1e-6))
+        for idxs, nbhd in zip(self.neighbor_idxs, neighbors):
+            self.assertTrue(torch.allclose(nbhd, maps[idxs], atol=1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
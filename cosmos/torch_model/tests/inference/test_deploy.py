@@ -0,0 +1,51 @@
+import unittest
+import torch
+from torch import nn
+from cosmos.torch_model.inference.deploy import calibrate_batch_norm, fold_batch_norm
+
+
+class TinyBlock(nn.Module):
+    def __init__(self):
+        super(TinyBlock, self).__init__()
+        self.conv1 = nn.Conv2d(4, 4, 3, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(4)
+
+    def forward(self, x):
+        return torch.relu(self.bn1(self.conv1(x))) + x
+
+
+class TinyFeaturizer(nn.Module):
+    def __init__(self):
+        super(TinyFeaturizer, self).__init__()
+        self.backbone = nn.Sequential(nn.Conv2d(3, 4, 3), nn.BatchNorm2d(4), nn.ReLU(), TinyBlock())
+
+    def forward(self, windows, device):
+        return self.backbone(windows)
+
+
+class TestDeploy(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.featurizer = TinyFeaturizer()
+        self.windows = torch.rand(12, 3, 9, 9)
+
+    def test_calibration_averages_batches(self):
+        nwindows = calibrate_batch_norm(self.featurizer, [self.windows[:6], self.windows[6:]], None)
+        self.assertEqual(nwindows, 12)
+        bn = self.featurizer.backbone[1]
+        self.assertFalse(bn.training)
+        expected = self.featurizer.backbone[0](self.windows).mean(dim=(0, 2, 3))
+        self.assertTrue(torch.allclose(bn.running_mean, expected, atol=1e-5))
+
+    def test_fold_matches_frozen(self):
+        calibrate_batch_norm(self.featurizer, [self.windows], None)
+        with torch.no_grad():
+            frozen = self.featurizer(self.windows, None)
+            self.assertEqual(fold_batch_norm(self.featurizer), 2)
+            folded = self.featurizer(self.windows, None)
+        self.assertFalse(any(isinstance(m, nn.BatchNorm2d) for m in self.featurizer.modules()))
+        self.assertTrue(torch.allclose(frozen, folded, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
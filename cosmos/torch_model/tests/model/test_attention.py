@@ -0,0 +1,46 @@
+import unittest
+import torch
+from cosmos.torch_model.model.attention.transformer import MultiHeadAttention
+from cosmos.torch_model.model.head.object_classifier import MultiModalClassifier
+
+
+class TestBatchedAttention(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.attention = MultiHeadAttention(3, 8)
+        self.lengths = [4, 2, 3]
+        self.Q = torch.rand(3, 8)
+        self.K = torch.rand(3, 4, 8)
+        self.V = torch.rand(3, 4, 5, 2, 2)
+        self.mask = torch.arange(4).unsqueeze(0) < torch.tensor(self.lengths).unsqueeze(1)
+
+    def test_masked_batch_matches_unpadded_examples(self):
+        batched = self.attention(self.Q, self.K, self.V, self.mask)
+        self.assertEqual(tuple(batched.shape), (3, 3, 5, 2, 2))
+        for i, length in enumerate(self.lengths):
+            single = self.attention(self.Q[i:i + 1], self.K[i:i + 1, :length], self.V[i:i + 1, :length])
+            self.assertTrue(torch.allclose(batched[i:i + 1], single, atol=1e-6))
+
+    def test_heads_match_their_projections(self):
+        out = self.attention(self.Q[:1], self.K[:1], self.V[:1])
+        for h in range(3):
+            q = self.attention.Q_heads[h](self.Q[:1])
+            k = self.attention.K_heads[h](self.K[0])
+            weights = torch.softmax(torch.matmul(q, k.t()) / 8, dim=1)
+            expected = (weights[0].view(-1, 1, 1, 1) * self.V[0]).sum(dim=0)
+            self.assertTrue(torch.allclose(out[0, h], expected, atol=1e-6))
+
+    def test_classifier_rows_are_independent(self):
+        head = MultiModalClassifier(2, 2, 5, 6, 3, 4)
+        head.eval()
+        roi_maps = torch.rand(3, 5, 2, 2)
+        attn_maps = torch.rand(3, 3, 5, 2, 2)
+        colors = torch.rand(3, 1)
+        batched = head(roi_maps, attn_maps, colors)
+        for i in range(3):
+            single = head(roi_maps[i:i + 1], attn_maps[i:i + 1], colors[i:i + 1])
+            self.assertTrue(torch.allclose(batched[i:i + 1], single, atol=1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
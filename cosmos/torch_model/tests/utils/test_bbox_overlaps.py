@@ -1,3 +1,5 @@
+import os
+import tempfile
 from PIL import Image
 from PIL import ImageDraw
 from utils.bbox_overlaps import bbox_overlaps
@@ -27,7 +29,8 @@ for box in gt_boxes:
 for box in boxes:
     draw.rectangle(bbox_to_coords(box), outline="#00f")
 
-base_image.save("overlap.png", "PNG")
+# Written outside the source tree for inspection
+base_image.save(os.path.join(tempfile.gettempdir(), "overlap.png"), "PNG")
 bboxes = torch.tensor(boxes).float()
 gt_boxes = torch.tensor(gt_boxes).float()
 out = bbox_overlaps(bboxes, gt_boxes)
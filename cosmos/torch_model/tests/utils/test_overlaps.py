@@ -1,3 +1,5 @@
+import os
+import tempfile
 from PIL import Image
 from PIL import ImageDraw
 image_size = 500
@@ -16,4 +18,5 @@ def bbox_to_coords(bbox):
 
 draw.rectangle(bbox_to_coords(box_1), outline="#f00")
 draw.rectangle(bbox_to_coords(box_2), outline="#00f")
-base_image.save("overlap.png", "PNG")
+# Written outside the source tree for inspection
+base_image.save(os.path.join(tempfile.gettempdir(), "overlap.png"), "PNG")
@@ -0,0 +1,73 @@
+"""
+Neighbor count bucketing for the training loaders.
+XMLLoader.collate pads the neighbor windows of a batch to its largest
+neighborhood, so batches are formed from examples with similar neighbor
+counts and the padding this costs is reported.
+"""
+from collections import namedtuple
+import numpy as np
+from torch.utils.data import Sampler
+
+PaddingStats = namedtuple('PaddingStats', ['nbatches', 'real', 'padded', 'waste'])
+
+
+def padding_waste(counts, batches):
+    """
+    :param counts: per example neighbor counts
+    :param batches: list of example index lists
+    :return: PaddingStats with the real and padded neighbor windows and the padded fraction
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    real, padded = 0, 0
+    for batch in batches:
+        sizes = counts[np.asarray(batch, dtype=np.int64)]
+        if sizes.shape[0] == 0:
+            continue
+        real += int(sizes.sum())
+        padded += int(sizes.max()) * sizes.shape[0]
+    waste = 1 - real / padded if padded > 0 else 0.0
+    return PaddingStats(nbatches=len(batches), real=real, padded=padded, waste=waste)
+
+
+def sequential_batches(n, batch_size):
+    """
+    :return: the batches of a DataLoader without a sampler
+    """
+    return [list(range(start, min(start + batch_size, n))) for start in range(0, n, batch_size)]
+
+
+class NeighborBucketSampler(Sampler):
+    """
+    Batch sampler grouping examples of similar neighbor counts.
+    Examples are sorted by neighbor count, ties in random order, and cut into
+    batches, then the batch order is shuffled every epoch.
+    """
+    def __init__(self, counts, batch_size, shuffle=True, seed=None):
+        """
+        :param counts: per example neighbor counts, as padded by collate
+        :param batch_size: examples per batch
+        :param shuffle: shuffle ties and the batch order
+        :param seed: random seed
+        """
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.batch_size = int(batch_size)
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+
+    def batches(self):
+        """
+        :return: list of example index lists for one epoch
+        """
+        n = self.counts.shape[0]
+        tiebreak = self.rng.permutation(n) if self.shuffle else np.arange(n)
+        order = np.lexsort((tiebreak, self.counts))
+        batches = [order[start:start + self.batch_size].tolist() for start in range(0, n, self.batch_size)]
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        return iter(self.batches())
+
+    def __len__(self):
+        return (self.counts.shape[0] + self.batch_size - 1) // self.batch_size
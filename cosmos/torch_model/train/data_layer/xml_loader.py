@@ -18,12 +18,11 @@ import pickle
 from torch_model.utils.matcher import match
 from collections import namedtuple
 #from dataclasses import dataclass
+import numpy as np
 from uuid import uuid4
 from tqdm import tqdm
 from torch_model.utils.bbox import BBoxes
 from ingestion.ingest_images import db_ingest, get_example_for_uuid, compute_neighborhoods, ImageDB
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
 from dataclasses import dataclass
 
 normalizer = NormalizeWrapper()
@@ -40,7 +39,7 @@ class Example:
   neighbor_angles: torch.Tensor
   colorfulness: torch.Tensor
 
-Batch = namedtuple('Batch', ['center_bbs', 'labels', 'center_windows', 'neighbor_boxes', 'neighbor_windows', 'neighbor_radii', 'neighbor_angles', 'colorfulness'])
+Batch = namedtuple('Batch', ['center_bbs', 'labels', 'center_windows', 'neighbor_boxes', 'neighbor_windows', 'neighbor_radii', 'neighbor_angles', 'colorfulness', 'neighbor_mask'])
 
 def containsNone(lst):
     flag = False
@@ -140,7 +139,19 @@ class XMLLoader(Dataset):
         neighbor_windows = pad_sequence(neighbor_windows).permute(1,0,2,3,4)
         neighbor_radii =  pad_sequence([ex.neighbor_radii for ex in batch], padding_value=-1).permute(1,0)
         neighbor_angles = pad_sequence([ex.neighbor_angles for ex in batch], padding_value=-1).permute(1,0)
-        return Batch(center_bbs=center_bbs, labels=labels, center_windows=center_windows, neighbor_boxes=neighbor_boxes, neighbor_windows=neighbor_windows,neighbor_radii=neighbor_radii, neighbor_angles=neighbor_angles, colorfulness=colorfulness)
+        # nonzero where a neighbor is real, zero where pad_sequence padded
+        lengths = torch.tensor([len(ex.neighbor_windows) for ex in batch])
+        neighbor_mask = torch.arange(neighbor_windows.shape[1]).unsqueeze(0) < lengths.unsqueeze(1)
+        return Batch(center_bbs=center_bbs, labels=labels, center_windows=center_windows, neighbor_boxes=neighbor_boxes, neighbor_windows=neighbor_windows,neighbor_radii=neighbor_radii, neighbor_angles=neighbor_angles, colorfulness=colorfulness, neighbor_mask=neighbor_mask)
+
+    def neighbor_counts(self):
+        """
+        :return: per example number of neighbor windows after collate, empty neighborhoods hold two placeholders
+        """
+        sizes = np.diff(self.session.neighbor_ptr)
+        counts = np.array([sizes[self.session.row(uuid)] for uuid in self.uuids], dtype=np.int64)
+        counts[counts == 0] = 2
+        return counts
 
     def get_weight_vec(self, classes):
         weight_per_class = {}                                    
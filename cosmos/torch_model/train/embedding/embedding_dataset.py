@@ -15,7 +15,7 @@ class ImageEmbeddingDataset(XMLLoader):
     def __init__(self, session, ingest_objs,classes):
         """
         Create an image embedding db
-        :param db: a sqlalchemy session to query for images
+        :param session: ArrayStore holding the ingested examples
         """
         super(ImageEmbeddingDataset, self).__init__(session, ingest_objs, classes)
 
@@ -12,6 +12,7 @@ from torch import optim
 from torch.utils.data import DataLoader, WeightedRandomSampler
 from tqdm import tqdm
 from torch_model.train.anchor_targets.head_target_layer import HeadTargetLayer
+from torch_model.train.data_layer.bucketing import NeighborBucketSampler, padding_waste, sequential_batches
 from functools import partial
 from tensorboardX import SummaryWriter
 
@@ -64,12 +65,20 @@ class TrainerHelper:
                            
         self.model.train(mode=True)
         iteration = 0
+        batch_size = int(self.params["BATCH_SIZE"])
+        counts = self.train_set.neighbor_counts()
+        sampler = NeighborBucketSampler(counts, batch_size)
+        sequential = padding_waste(counts, sequential_batches(len(counts), batch_size))
         for epoch in tqdm(range(int(self.params["EPOCHS"])),desc="epochs", leave=False):
             tot_cls_loss = 0.0
+            batches = sampler.batches()
+            bucketed = padding_waste(counts, batches)
+            print(f"  neighbor padding waste: {bucketed.waste:.3f} bucketed, {sequential.waste:.3f} sequential "
+                  f"({bucketed.padded} vs {sequential.padded} padded windows)")
             train_loader = DataLoader(self.train_set,
-                            batch_size=int(self.params["BATCH_SIZE"]),
+                            batch_sampler=batches,
                             collate_fn=self.train_set.collate,
-                            num_workers=int(self.params["BATCH_SIZE"]*2))
+                            num_workers=batch_size*2)
          
             for batch in tqdm(train_loader, desc="training"):
                 # print(batch)  
@@ -80,16 +89,8 @@ class TrainerHelper:
                 ex = batch.center_windows.to(self.device)
                 colors = batch.colorfulness.to(self.device)
                 gt_cls = batch.labels.to(self.device)
-                batch_cls_scores = []
-                for i in range(windows.shape[0]):
-                  windows_sub = windows[i]
-                  ex_sub = ex[i].unsqueeze(0)
-                  radii_sub = radii[i].reshape(-1,1)
-                  angles_sub = angles[i].reshape(-1,1)
-                  colors_sub = colors[i].reshape(-1,1)
-                  rois, cls_scores= self.model(ex_sub, windows_sub,radii_sub,angles_sub,colors_sub, batch.center_bbs, self.device)
-                  batch_cls_scores.append(cls_scores)
-                batch_cls_scores = torch.cat(batch_cls_scores)
+                mask = batch.neighbor_mask.to(self.device)
+                rois, batch_cls_scores = self.model(ex, windows, radii, angles, colors.reshape(-1,1), batch.center_bbs, self.device, mask)
                 loss = self.head_target_layer(batch_cls_scores, gt_cls.reshape(-1).long(), self.device)
                 tot_cls_loss += float(loss)
                 loss.backward()
@@ -126,15 +127,10 @@ class TrainerHelper:
           radii = batch.neighbor_radii.to(self.device)
           angles = batch.neighbor_angles.to(self.device)
           gt_cls = batch.labels.to(self.device)
-          for i in range(windows.shape[0]):
-            windows_sub = windows[i]
-            ex_sub = ex[i].unsqueeze(0)
-            radii_sub = radii[i].reshape(-1,1)
-            angles_sub = angles[i].reshape(-1,1)
-            colors_sub = colors[i].reshape(-1,1)
-            rois, cls_scores= self.model(ex_sub, windows_sub, radii_sub, angles_sub,colors_sub,batch.center_bbs, self.device)
-            cls_loss = self.head_target_layer(cls_scores, gt_cls.reshape(-1).long(), self.device)
-            tot_cls_loss += float(cls_loss)
+          mask = batch.neighbor_mask.to(self.device)
+          rois, cls_scores= self.model(ex, windows, radii, angles, colors.reshape(-1,1), batch.center_bbs, self.device, mask)
+          cls_loss = self.head_target_layer(cls_scores, gt_cls.reshape(-1).long(), self.device)
+          tot_cls_loss += float(cls_loss)
         if to_tensorboard:
                 self.output_batch_losses(
                                  tot_cls_loss/len(self.val_set),
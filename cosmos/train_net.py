@@ -28,13 +28,16 @@ def get_anno_dir(root):
 def get_proposal_dir(root):
     return join(root, "proposals")
 
-def get_dataset(dir, warped_size, expansion_delta, img_type, partition):
+def get_dataset(dir, warped_size, expansion_delta, img_type, partition, neighborhood='overlap', max_neighbors=None, extractor='pil'):
     session, ingest_objs = ImageDB.initialize_and_ingest(get_img_dir(dir),
                                                          get_proposal_dir(dir),
                                                          get_anno_dir(dir),
                                                          warped_size,
                                                          partition,
-                                                         expansion_delta)
+                                                         expansion_delta,
+                                                         neighborhood=neighborhood,
+                                                         max_neighbors=max_neighbors,
+                                                         extractor=extractor)
     dataset = XMLLoader(session, ingest_objs, classes)
     embedding_dataset = ImageEmbeddingDataset(session, ingest_objs, classes)
     return dataset, embedding_dataset
@@ -53,12 +56,18 @@ def train(model_config, train_config, train_dir, val_dir):
       cfg.WARPED_SIZE,
       cfg.EXPANSION_DELTA,
       "png",
-      "train")
+      "train",
+      getattr(cfg, "NEIGHBORHOOD", "overlap"),
+      getattr(cfg, "MAX_NEIGHBORS", None),
+      getattr(cfg, "WINDOW_EXTRACTOR", "pil"))
   val_loader, embedding_val_loader = get_dataset(val_dir,
       cfg.WARPED_SIZE,
       cfg.EXPANSION_DELTA,
       "png",
-      "val")
+      "val",
+      getattr(cfg, "NEIGHBORHOOD", "overlap"),
+      getattr(cfg, "MAX_NEIGHBORS", None),
+      getattr(cfg, "WINDOW_EXTRACTOR", "pil"))
 
   train_params = None
   with open(train_config) as fh:
@@ -0,0 +1,143 @@
+"""
+Dynamic request batching.
+Requests from concurrent callers are queued and a single worker thread
+drains them in batches: a batch starts with the oldest waiting request and
+takes whatever else arrives until it is full or the oldest request has
+waited max_latency seconds. Queue depth, batch sizes and per stage
+latencies are kept for monitoring.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class LatencyStats:
+    """
+    Latencies of the most recent samples of every stage
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def summary(self):
+        """
+        :return: {stage: {count, mean_ms, p50_ms, p95_ms, max_ms}}
+        """
+        with self.lock:
+            snapshot = {stage: (np.array(samples), self.counts[stage]) for stage, samples in self.samples.items()}
+        return {stage: {'count': count,
+                        'mean_ms': float(samples.mean() * 1000),
+                        'p50_ms': float(np.percentile(samples, 50) * 1000),
+                        'p95_ms': float(np.percentile(samples, 95) * 1000),
+                        'max_ms': float(samples.max() * 1000)}
+                for stage, (samples, count) in snapshot.items()}
+
+
+class DynamicBatcher:
+    """
+    Batch items submitted from many threads for a function that processes a list of items at once
+    """
+    def __init__(self, process_fn, max_batch=8, max_latency=0.05, stats=None):
+        """
+        :param process_fn: maps a list of items to a list of results in the same order
+        :param max_batch: maximum items per call
+        :param max_latency: seconds the oldest item may wait for the batch to fill
+        :param stats: LatencyStats to record into, a new one by default
+        """
+        self.process_fn = process_fn
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.stats = stats if stats is not None else LatencyStats()
+        self.queue = queue.Queue()
+        self.nbatches = 0
+        self.nitems = 0
+        self.batch_sizes = deque(maxlen=1000)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        :param item: input item
+        :return: Future of the result
+        """
+        if self._stopped.is_set():
+            raise RuntimeError('Batcher is stopped')
+        future = Future()
+        self.queue.put((item, future, time.monotonic()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _next_batch(self):
+        try:
+            first = self.queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first[2] + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while not (self._stopped.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            items, futures, submitted = zip(*batch)
+            start = time.monotonic()
+            for t in submitted:
+                self.stats.record('queue', start - t)
+            try:
+                results = self.process_fn(list(items))
+                if len(results) != len(items):
+                    raise RuntimeError(f'process_fn returned {len(results)} results for {len(items)} items')
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            end = time.monotonic()
+            self.stats.record('batch', end - start)
+            for t in submitted:
+                self.stats.record('total', end - t)
+            self.nbatches += 1
+            self.nitems += len(items)
+            self.batch_sizes.append(len(items))
+
+    def metrics(self):
+        """
+        :return: dict of queue depth, batch counts and per stage latencies
+        """
+        return {'queue_depth': self.queue.qsize(),
+                'batches': self.nbatches,
+                'items': self.nitems,
+                'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                'max_batch': self.max_batch,
+                'max_latency_ms': self.max_latency * 1000,
+                'latency': self.stats.summary()}
+
+    def stop(self, timeout=None):
+        """
+        Process what is queued and stop the worker thread
+        """
+        self._stopped.set()
+        self._thread.join(timeout)
@@ -0,0 +1,69 @@
+"""
+Process level registry of lazily loaded resources.
+A resource is registered with a loader function and is loaded the first time
+a process asks for it, then reused for the life of the process. Pool workers
+that never ask for a resource never load it. Load time and the change in
+resident memory are recorded for every load.
+"""
+import os
+import threading
+from collections import namedtuple
+from timeit import default_timer as timer
+
+LoadStats = namedtuple('LoadStats', ['name', 'pid', 'load_s', 'rss_delta_kb', 'rss_kb'])
+
+_loaders = {}
+_resources = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def current_rss_kb():
+    """
+    :return: resident set size of this process in KB, 0 where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return 0
+
+
+def register(name, loader):
+    """
+    :param name: resource name
+    :param loader: function without arguments that loads the resource
+    """
+    _loaders[name] = loader
+
+
+def get(name):
+    """
+    :param name: registered resource name
+    :return: the resource, loaded on the first call in this process
+    """
+    key = (name, os.getpid())
+    if key not in _resources:
+        with _lock:
+            if key not in _resources:
+                if name not in _loaders:
+                    raise KeyError(f'No resource registered as {name}')
+                rss = current_rss_kb()
+                start = timer()
+                _resources[key] = _loaders[name]()
+                end_rss = current_rss_kb()
+                _stats[key] = LoadStats(name, os.getpid(), timer() - start, end_rss - rss, end_rss)
+                print(f"Loaded {name} in process {os.getpid()} in {_stats[key].load_s:.2f} s, "
+                      f"+{_stats[key].rss_delta_kb} KB resident")
+    return _resources[key]
+
+
+def is_loaded(name):
+    return (name, os.getpid()) in _resources
+
+
+def load_stats():
+    """
+    :return: list of LoadStats of the resources loaded by this process
+    """
+    return [stats for (name, pid), stats in _stats.items() if pid == os.getpid()]
@@ -0,0 +1,143 @@
+"""
+Streaming multiprocess scheduler.
+Work items flow through a chain of stages connected by bounded queues, so an
+item reaches the next stage as soon as it is produced rather than after the
+whole corpus clears the previous stage. Every stage has its own worker count.
+The parent checks its workers whenever it waits on a queue, so a worker that
+dies without finishing (a segfault, the OOM killer) fails the run instead of
+hanging it.
+"""
+import multiprocessing as mp
+import queue
+import traceback
+from collections import namedtuple
+
+# fn maps one item to an iterable of items for the next stage (or None),
+# workers is the number of processes and maxsize bounds the input queue of the stage
+Stage = namedtuple('Stage', ['name', 'fn', 'workers', 'maxsize'])
+Stage.__new__.__defaults__ = (1, 64)
+Failure = namedtuple('Failure', ['message'])
+
+_DONE = '__upstream_done__'
+_STOP = '__stop__'
+# Seconds between worker liveness checks while the parent waits on a queue
+POLL_S = 1.0
+
+
+def _worker(stage, inq, outq, received, lock, upstream_workers):
+    """
+    Process items until every upstream worker has finished. Each worker marks its own end with _DONE
+    on the next queue, after its outputs, so queue order guarantees nothing is dropped. The worker that
+    receives the last upstream _DONE stops its peers.
+    """
+    while True:
+        item = inq.get()
+        if isinstance(item, str) and item == _STOP:
+            break
+        if isinstance(item, str) and item == _DONE:
+            with lock:
+                received.value += 1
+                last = received.value == upstream_workers
+            if last:
+                for _ in range(stage.workers - 1):
+                    inq.put(_STOP)
+                break
+            continue
+        if isinstance(item, Failure):
+            outq.put(item)
+            continue
+        try:
+            outputs = stage.fn(item)
+        except Exception:
+            outq.put(Failure(f'{stage.name} failed on {item!r}\n{traceback.format_exc()}'))
+            continue
+        for output in outputs or []:
+            outq.put(output)
+    outq.put(_DONE)
+
+
+def _check_workers(procs):
+    """
+    :raise RuntimeError: if a worker exited abnormally, after terminating the others
+    """
+    dead = [proc for proc in procs if proc.exitcode not in (None, 0)]
+    if dead:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        raise RuntimeError('Stage workers died: ' + ', '.join(f'{proc.name} (exit code {proc.exitcode})' for proc in dead))
+
+
+def _put(q, item, procs):
+    while True:
+        try:
+            q.put(item, timeout=POLL_S)
+            return
+        except queue.Full:
+            _check_workers(procs)
+
+
+def _get(q, procs):
+    while True:
+        try:
+            return q.get(timeout=POLL_S)
+        except queue.Empty:
+            _check_workers(procs)
+
+
+def run_serial(items, stages):
+    """
+    Run the stages in the calling process, item by item. Useful for debugging.
+    :param items: iterable of input items for the first stage
+    :param stages: list of Stage
+    :return: list of outputs of the last stage
+    """
+    outputs = []
+    for item in items:
+        pending = [item]
+        for stage in stages:
+            pending = [output for inp in pending for output in (stage.fn(inp) or [])]
+        outputs.extend(pending)
+    return outputs
+
+
+def run_stages(items, stages):
+    """
+    Stream items through stages with one pool of processes per stage
+    :param items: iterable of input items for the first stage
+    :param stages: list of Stage
+    :return: list of outputs of the last stage, in completion order
+    :raise RuntimeError: if an item failed or a worker died
+    """
+    ctx = mp.get_context('fork')
+    queues = [ctx.Queue(maxsize=stage.maxsize) for stage in stages]
+    # Outputs of the last stage go to an unbounded queue drained by this process
+    queues.append(ctx.Queue())
+    procs = []
+    upstream_workers = 1
+    for ind, stage in enumerate(stages):
+        received, lock = ctx.Value('i', 0), ctx.Lock()
+        for _ in range(stage.workers):
+            proc = ctx.Process(target=_worker, args=(stage, queues[ind], queues[ind + 1], received, lock, upstream_workers),
+                               name=f'{stage.name}-worker', daemon=True)
+            proc.start()
+            procs.append(proc)
+        upstream_workers = stage.workers
+    for item in items:
+        _put(queues[0], item, procs)
+    _put(queues[0], _DONE, procs)
+    outputs, errors = [], []
+    done = 0
+    while done < stages[-1].workers:
+        output = _get(queues[-1], procs)
+        if isinstance(output, str) and output == _DONE:
+            done += 1
+        elif isinstance(output, Failure):
+            errors.append(output.message)
+        else:
+            outputs.append(output)
+    for proc in procs:
+        proc.join()
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+    return outputs
@@ -0,0 +1,85 @@
+"""
+Append-as-you-go table writers.
+Pipelines hand every finished chunk (e.g. the rows of one page) to a sink,
+which appends it to the output file right away, so memory does not grow
+with the corpus and readers see complete chunks as soon as they are done.
+The file is only created when the first chunk arrives.
+"""
+import os
+
+
+class CsvSink:
+    """
+    Append DataFrames to a csv, the header is written with the first one
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fh = None
+        self.rows = 0
+
+    def write(self, df):
+        """
+        :param df: DataFrame with the same columns as the previous ones
+        """
+        if self.fh is None:
+            self.fh = open(self.path, 'w', newline='', encoding='utf-8')
+            df.to_csv(self.fh, index=False)
+        else:
+            df.to_csv(self.fh, index=False, header=False)
+        self.fh.flush()
+        self.rows += len(df)
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetSink:
+    """
+    Append DataFrames to a parquet file, one row group per DataFrame. Columns are stored as strings.
+    Memory stays flat, but the file is only readable once the sink is closed and the footer written.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.schema = None
+        self.rows = 0
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self.writer is None:
+            self.schema = pa.schema([(str(c), pa.string()) for c in df.columns])
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        # Missing values (None or NaN) stay null, everything else is stored as its string
+        columns = {str(c): [None if v is None or v != v else str(v) for v in df[c]] for c in df.columns}
+        self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def table_sink(path):
+    """
+    :param path: output path, .parquet for a ParquetSink and a csv otherwise
+    :return: sink
+    """
+    if os.path.splitext(path)[1] == '.parquet':
+        return ParquetSink(path)
+    return CsvSink(path)
@@ -9,12 +9,12 @@ logging.basicConfig(format='%(levelname) :: %(asctime)s :: %(message)s', level=l
 import click
 import tempfile
 import time
-import subprocess
 import os
 import glob
 from PIL import Image
-from typing import Mapping, TypeVar, Callable
+from typing import Mapping, TypeVar, Callable, Sequence
 from pdf_extractor import parse_pdf
+from render import render_pdf
 from pymongo import MongoClient
 
 
@@ -31,8 +31,9 @@ def run_pdf_ingestion(pdf_dir: str, db_insert_fn: Callable[[Mapping[T, T]], None
     pdfs = []
     for pdf_path in glob.glob(os.path.join(pdf_dir, '*.pdf')):
         with tempfile.TemporaryDirectory() as img_tmp:
-            subprocess_fn(pdf_path, img_tmp)
+            render_stats = subprocess_fn(pdf_path, img_tmp)
             pdf_obj = {}
+            pdf_obj['render_stats'] = render_stats
             pdf_obj = load_page_data(img_tmp, pdf_obj)
             pdf_obj = load_pdf_metadata(pdf_path, pdf_obj)
             pdfs.append(pdf_obj)
@@ -43,24 +44,17 @@ def run_pdf_ingestion(pdf_dir: str, db_insert_fn: Callable[[Mapping[T, T]], None
     logging.info(f'End running proposal creation. Total time: {end_time - start_time} s')
     return pdfs
 
-def run_ghostscript(pdf_path: str, img_tmp: str) -> None:
+def run_ghostscript(pdf_path: str, img_tmp: str, size: int = 1920) -> Sequence[Mapping[T, T]]:
     """
-    Run ghostscript as a subprocess over pdf files
+    Render every page of a pdf with ghostscript directly at the target size, see render.render_pdf.
+    Page sizes are read with /Rotate applied and pages sharing a resolution are rendered in one gs call.
+    Writes <img_tmp>/page_<page_num>.png and returns the per page render stats
     """
-    with tempfile.TemporaryFile() as gs_stdout, tempfile.TemporaryFile() as gs_stderr:
-        subprocess.run(['gs', '-dBATCH', 
-                              '-dNOPAUSE', 
-                              '-sDEVICE=png16m', 
-                              '-dGraphicsAlphaBits=4',
-                              '-dTextAlphaBits=4', 
-                              '-r600', 
-                              f'-sOutputFile="{img_tmp}/%d"', 
-                              pdf_path
-                        ], stdout=gs_stdout, stderr=gs_stderr)
-        out = gs_stdout.read()
-        err = gs_stdout.read()
-        logging.info(out)
-        logging.warn(err)
+    stats = render_pdf(pdf_path, img_tmp, size=size, backend='ghostscript', name='page')
+    for stat in stats:
+        logging.info(f"Rendered page {stat['page']} of {pdf_path} at {stat['dpi']:.1f} dpi ({stat['width']}x{stat['height']}) "
+                     f"in {stat['render_s']} s, peak RSS {stat['peak_rss_kb']} KB, {stat['png_bytes']} bytes")
+    return stats
 
 
 def insert_pdfs_mongo(pdfs: Mapping[T, T]) -> None:
@@ -78,9 +72,9 @@ def load_page_data(img_dir: str, current_obj: Mapping[T, T]) -> Mapping[T, T]:
     Iterate through the img directory, and retrieve the page level data
     """
     page_data = []
-    for f in glob.glob(f'{img_tmp}/*'):
+    for f in glob.glob(f'{img_dir}/page_*.png'):
         page_obj = {}
-        page_num = int(os.basename(f))
+        page_num = int(os.path.splitext(os.path.basename(f))[0].split('_')[-1])
         img = Image.open(f)
         width, height = img.size
         with open(f, 'rb') as bimage:
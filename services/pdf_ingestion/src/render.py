@@ -0,0 +1,229 @@
+"""
+Vendored copy of cosmos/preprocess/render.py, the service image only contains src/.
+Keep the two in sync.
+
+Render PDF pages straight to the model resolution.
+The resolution of every page is derived from its MediaBox so the longest side
+lands on the target size, instead of rendering at 600 dpi and downscaling.
+Ghostscript is always available as a subprocess backend, PyMuPDF is used as an
+in-process backend when it is installed.
+"""
+import csv
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import resource
+import click
+from timeit import default_timer as timer
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+LEGACY_DPI = 600
+STAT_FIELDS = ['pdf', 'page', 'backend', 'dpi', 'width', 'height', 'render_s', 'peak_rss_kb', 'png_bytes']
+
+
+def get_page_sizes(pdf_path):
+    """
+    Read the displayed size of every page
+    :param pdf_path: Path to pdf
+    :return: [(width, height)] in points, with /Rotate applied
+    """
+    sizes = []
+    with open(pdf_path, 'rb') as fh:
+        doc = PDFDocument(PDFParser(fh))
+        for page in PDFPage.create_pages(doc):
+            x0, y0, x1, y1 = page.mediabox
+            width, height = abs(x1 - x0), abs(y1 - y0)
+            if (page.rotate or 0) % 180 == 90:
+                width, height = height, width
+            sizes.append((float(width), float(height)))
+    return sizes
+
+
+def target_dpi(width, height, size=1920):
+    """
+    :param width: page width in points
+    :param height: page height in points
+    :param size: target length of the longest side in pixels
+    :return: resolution that renders the longest side at size pixels
+    """
+    return size * 72.0 / max(width, height)
+
+
+class GhostscriptBackend:
+    """
+    Render with a gs subprocess, one call per run of consecutive pages sharing a resolution
+    """
+    name = 'ghostscript'
+
+    def render(self, pdf_path, first_page, last_page, dpi, output_paths):
+        """
+        Render pages first_page..last_page (1 indexed, inclusive) to output_paths
+        :return: elapsed seconds, peak RSS of the gs process in KB
+        """
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(output_paths[0]))
+        try:
+            start = timer()
+            proc = subprocess.Popen(['gs', '-dBATCH', '-dNOPAUSE', '-dQUIET', '-sDEVICE=png16m',
+                                     '-dGraphicsAlphaBits=4', '-dTextAlphaBits=4', f'-r{dpi:.4f}',
+                                     f'-dFirstPage={first_page}', f'-dLastPage={last_page}',
+                                     f'-sOutputFile={tmp_dir}/%d.png', pdf_path],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # wait4 reports the resource usage of this child alone
+            _, status, usage = os.wait4(proc.pid, 0)
+            # Negative for a gs killed by a signal (e.g. by the OOM killer), as in subprocess
+            proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            elapsed = timer() - start
+            if proc.returncode != 0:
+                raise RuntimeError(f'gs exited with {proc.returncode} rendering {pdf_path} pages {first_page}-{last_page}')
+            for ind, output_path in enumerate(output_paths):
+                shutil.move(os.path.join(tmp_dir, f'{ind + 1}.png'), output_path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return elapsed, usage.ru_maxrss
+
+
+class MuPDFBackend:
+    """
+    Render in process with PyMuPDF
+    """
+    name = 'mupdf'
+
+    def render(self, pdf_path, first_page, last_page, dpi, output_paths):
+        """
+        Render pages first_page..last_page (1 indexed, inclusive) to output_paths
+        :return: elapsed seconds, peak RSS of this process in KB
+        """
+        start = timer()
+        doc = fitz.open(pdf_path)
+        try:
+            zoom = dpi / 72.0
+            for page_num, output_path in zip(range(first_page - 1, last_page), output_paths):
+                pix = doc[page_num].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                pix.save(output_path)
+        finally:
+            doc.close()
+        return timer() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+BACKENDS = {GhostscriptBackend.name: GhostscriptBackend, MuPDFBackend.name: MuPDFBackend}
+
+
+def get_backend(name='auto'):
+    """
+    :param name: 'ghostscript', 'mupdf', or 'auto' to prefer the in-process backend when PyMuPDF is installed
+    :return: backend instance
+    """
+    if name == 'auto':
+        name = MuPDFBackend.name if fitz is not None else GhostscriptBackend.name
+    if name == MuPDFBackend.name and fitz is None:
+        raise ImportError('The mupdf render backend requires PyMuPDF')
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown render backend {name}, expected one of {list(BACKENDS)}')
+    return BACKENDS[name]()
+
+
+def split_page_ranges(npages, pages_per_range=8):
+    """
+    Split a document into page ranges so large documents can be rendered by several workers
+    :param npages: number of pages
+    :param pages_per_range: maximum pages per range
+    :return: [(first_page, last_page)] 1 indexed and inclusive
+    """
+    return [(first, min(first + pages_per_range - 1, npages)) for first in range(1, npages + 1, pages_per_range)]
+
+
+def render_pdf(pdf_path, output_dir, size=1920, dpi=None, backend='auto', first_page=None, last_page=None, name=None, sizes=None):
+    """
+    Render a pdf to <output_dir>/<name>_<page>.png
+    :param pdf_path: Path to pdf
+    :param output_dir: Output directory
+    :param size: Target length of the longest page side in pixels
+    :param dpi: Fixed resolution overriding size, e.g. 600 for the previous render path
+    :param backend: backend name or instance, see get_backend
+    :param first_page: First page to render (1 indexed), defaults to the first page
+    :param last_page: Last page to render (inclusive), defaults to the last page
+    :param name: Output file prefix, defaults to the pdf file name
+    :param sizes: Page sizes from get_page_sizes, read from the pdf when not given
+    :return: list of per page stat dictionaries, see STAT_FIELDS
+    """
+    if isinstance(backend, str):
+        backend = get_backend(backend)
+    name = os.path.basename(pdf_path) if name is None else name
+    sizes = get_page_sizes(pdf_path) if sizes is None else sizes
+    first_page = 1 if first_page is None else first_page
+    last_page = len(sizes) if last_page is None else min(last_page, len(sizes))
+    # Group consecutive pages sharing a resolution so each group is a single backend call
+    groups = []
+    for page_num in range(first_page, last_page + 1):
+        width, height = sizes[page_num - 1]
+        # Rounded up, so the longest side is never a pixel short of size and sent through the upscale path
+        page_dpi = dpi if dpi is not None else math.ceil(target_dpi(width, height, size) * 1e4) / 1e4
+        if groups and groups[-1][2] == page_dpi:
+            groups[-1][1] = page_num
+        else:
+            groups.append([page_num, page_num, page_dpi])
+    stats = []
+    for group_first, group_last, page_dpi in groups:
+        pages = list(range(group_first, group_last + 1))
+        output_paths = [os.path.join(output_dir, f'{name}_{page_num}.png') for page_num in pages]
+        elapsed, peak_rss = backend.render(pdf_path, group_first, group_last, page_dpi, output_paths)
+        for page_num, output_path in zip(pages, output_paths):
+            width, height = sizes[page_num - 1]
+            stats.append({'pdf': name,
+                          'page': page_num,
+                          'backend': backend.name,
+                          'dpi': page_dpi,
+                          'width': round(width * page_dpi / 72.0),
+                          'height': round(height * page_dpi / 72.0),
+                          'render_s': elapsed / len(pages),
+                          'peak_rss_kb': peak_rss,
+                          'png_bytes': os.path.getsize(output_path)})
+    return stats
+
+
+def write_render_stats(stats, output_path):
+    """
+    Write per page render statistics to a csv
+    :param stats: list of stat dictionaries from render_pdf
+    :param output_path: csv path
+    """
+    with open(output_path, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.DictWriter(fh, fieldnames=STAT_FIELDS)
+        writer.writeheader()
+        writer.writerows(stats)
+
+
+@click.command()
+@click.argument('pdf_dir')
+@click.argument('output_dir')
+@click.option('--size', default=1920, help='Target length of the longest page side')
+@click.option('--dpi', default=None, type=float, help='Fixed resolution, e.g. 600 to measure the previous render path')
+@click.option('--backend', default='auto', type=click.Choice(['auto', GhostscriptBackend.name, MuPDFBackend.name]))
+def benchmark(pdf_dir, output_dir, size, dpi, backend):
+    """
+    Render every pdf in pdf_dir and write per page time, peak RSS and PNG size to output_dir/render_stats.csv
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stats = []
+    for pdf_name in sorted(os.listdir(pdf_dir)):
+        if not pdf_name.endswith('.pdf'):
+            continue
+        stats.extend(render_pdf(os.path.join(pdf_dir, pdf_name), output_dir, size=size, dpi=dpi, backend=backend))
+    write_render_stats(stats, os.path.join(output_dir, 'render_stats.csv'))
+    if stats:
+        total_s = sum(stat['render_s'] for stat in stats)
+        print(f'{len(stats)} pages, {total_s / len(stats):.3f} s/page, '
+              f'{sum(stat["png_bytes"] for stat in stats) / len(stats) / 1024:.0f} KB/page, '
+              f'peak RSS {max(stat["peak_rss_kb"] for stat in stats) / 1024:.0f} MB')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,7 @@
+"""
+The service runs from /app with the contents of src/ as its working directory, mirror that for the tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
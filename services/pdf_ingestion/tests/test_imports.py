@@ -0,0 +1,15 @@
+"""
+The service module and the modules it imports have to resolve from src/ alone, as in the image
+"""
+import pytest
+
+pytest.importorskip('pdfminer')
+pytest.importorskip('pymongo')
+
+
+def test_service_imports():
+    import pdf_ingestion
+    import render
+    assert pdf_ingestion.render_pdf is render.render_pdf
+    assert callable(render.get_page_sizes)
+    assert callable(pdf_ingestion.parse_pdf)